@@ -0,0 +1,2 @@
+# Scripts de rendimiento. Se ejecutan desde la raíz del proyecto, por ejemplo:
+#   python -m benchmarks.bench_serializacion
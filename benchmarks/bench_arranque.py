@@ -0,0 +1,100 @@
+# Medimos el arranque en frío del servidor: cuánto tarda desde que lanzamos "python main.py"
+# hasta que responde la primera petición. Si se pasa del objetivo, el script termina con error
+# para que se pueda usar en integración continua.
+#
+# Uso: python -m benchmarks.bench_arranque [--objetivo-ms 1500] [--repeticiones 5]
+#                                          [--estado fichero.bin] [--generar-estado N]
+from __future__ import annotations
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _tiempo_importacion() -> float:
+    # Tiempo que tarda solo "import main" en un intérprete nuevo
+    inicio = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import main"], cwd=RAIZ, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - inicio
+
+
+def _tiempo_primera_peticion(estado: str | None, limite_segundos: float = 60.0) -> float:
+    # Lanzamos el servidor y sondeamos hasta que la primera petición responde 200
+    puerto = _puerto_libre()
+    entorno = dict(os.environ, PORT=str(puerto))
+    if estado:
+        entorno["ALQUILER_ESTADO"] = estado
+    url = f"http://127.0.0.1:{puerto}/sucursales"
+
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen([sys.executable, "main.py"], cwd=RAIZ, env=entorno,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - inicio < limite_segundos:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as respuesta:
+                    if respuesta.status == 200:
+                        return time.perf_counter() - inicio
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError("El servidor no respondió a tiempo.")
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+
+def _generar_estado(ruta: str, vehiculos: int):
+    # Construimos un estado de ejemplo y lo guardamos para medir el arranque a partir de él
+    sys.path.insert(0, RAIZ)
+    from benchmarks.bench_serializacion import _poblar
+    from services.AlquilerServicio import AlquilerServicio
+
+    servicio = AlquilerServicio()
+    _poblar(servicio, vehiculos)
+    servicio.guardar_estado(ruta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--objetivo-ms", type=float, default=1500.0)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--estado", help="Fichero de estado preconstruido con el que arrancar")
+    parser.add_argument("--generar-estado", type=int, metavar="N",
+                        help="Genera antes el fichero de --estado con N vehículos")
+    args = parser.parse_args()
+
+    if args.generar_estado:
+        if not args.estado:
+            parser.error("--generar-estado necesita --estado")
+        print(f"Generando estado con {args.generar_estado} vehículos en {args.estado}...")
+        _generar_estado(args.estado, args.generar_estado)
+
+    importaciones = [_tiempo_importacion() for _ in range(args.repeticiones)]
+    arranques = [_tiempo_primera_peticion(args.estado) for _ in range(args.repeticiones)]
+
+    mediana_import = statistics.median(importaciones) * 1000
+    mediana_arranque = statistics.median(arranques) * 1000
+    print(f"import main:           mediana {mediana_import:8.1f} ms")
+    print(f"primera petición:      mediana {mediana_arranque:8.1f} ms (máx {max(arranques) * 1000:.1f} ms)")
+    print(f"objetivo:                      {args.objetivo_ms:8.1f} ms")
+
+    if mediana_arranque > args.objetivo_ms:
+        print("Arranque por encima del objetivo.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# Comparamos el modelo de endpoints anterior (unos 'def' que Starlette ejecuta en su pool de hilos y
+# otros 'async def' que llaman al servicio síncrono, con el login calculando bcrypt en el propio bucle)
+# con el actual, todo 'async def' sobre services/AlquilerServicioAsync.py, con 1000 clientes a la vez.
+# Cada cliente consulta un vehículo, lo reserva y devuelve la reserva varias veces; uno de cada
+# --login-cada inicia sesión antes (bcrypt). Las peticiones van por ASGI en el mismo proceso (como
+# en bench_limitador), así que medimos la aplicación y no la red.
+#
+# Uso: [BCRYPT_RONDAS=8] python -m benchmarks.bench_async [--clientes 1000] [--vueltas 3] [--login-cada 20]
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from uuid import UUID
+
+# Sin registro de auditoría en disco y con un coste de bcrypt fijo (antes de importar main)
+os.environ.setdefault("ALQUILER_AUDITORIA", "")
+os.environ.setdefault("BCRYPT_RONDAS", "8")
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.security import OAuth2PasswordRequestForm
+
+import main
+from services.LimitadorPeticiones import Limite
+
+PASSWORD = "bench-password"
+
+
+def app_mixta() -> FastAPI:
+    # Los mismos endpoints con las definiciones de antes de la fachada asíncrona
+    servicio = main.alquiler_service
+    app = FastAPI()
+
+    @app.post("/token", dependencies=[Depends(main.limitar_peticiones)])
+    async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+        usuario = servicio.obtener_usuario_por_email(form_data.username)
+        valida, _ = main.verify_and_update_password(form_data.password, usuario.password) if usuario else (False, None)
+        if not valida:
+            raise HTTPException(status_code=401, detail="Email o contraseña incorrectos")
+        return main._emitir_tokens(usuario)
+
+    @app.get("/vehiculos/{vehiculo_id}", response_model=main.VehiculoRead)
+    def obtener_vehiculo(vehiculo_id: UUID) -> main.VehiculoRead:
+        try:
+            return main._vehiculo_to_read(servicio.obtener_vehiculo(vehiculo_id))
+        except ValueError as exc:
+            raise HTTPException(status_code=404, detail=str(exc))
+
+    @app.post("/reservas", response_model=main.ReservaRead)
+    def crear_reserva(datos: main.ReservaCreate) -> main.ReservaRead:
+        try:
+            reserva = servicio.realizar_reserva(datos.cliente_id, datos.vehiculo_id, datos.fecha_inicio,
+                                                datos.fecha_fin, datos.sucursal_devolucion_id)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        return main._reserva_to_read(reserva)
+
+    @app.post("/reservas/{reserva_id}/finalizar")
+    def finalizar_reserva(reserva_id: UUID, datos: main.ReservaFinalizarRequest):
+        try:
+            return servicio.finalizar_reserva(reserva_id, datos.km_recorridos, datos.retraso_dias,
+                                              datos.combustible_correcto, datos.metodo_pago)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+    return app
+
+
+def preparar(clientes: int):
+    # Un vehículo por cliente y modelo (cada modelo reserva los suyos), en la misma sucursal
+    servicio = main.alquiler_service
+    sucursal = servicio.agregar_sucursal("Central", "Calle Mayor 1", "900000000")
+    servicio.crear_tarifa("Básica", "Económico", 40)
+    cliente = servicio.registrar_usuario("cliente", "Cliente Benchmark", "bench@example.com",
+                                         main.hash_password(PASSWORD), licencia="B-0000", direccion="Calle Prueba 1")
+    flotas = [
+        [servicio.registrar_vehiculo("coche", f"{modelo}{i:06d}ASY", "Seat", "Ibiza", 2022, "Económico", 1000, sucursal).id
+         for i in range(clientes)]
+        for modelo in range(2)
+    ]
+    return cliente.id, sucursal.id, flotas
+
+
+async def simular(app: FastAPI, cliente_id, sucursal_id, vehiculos, vueltas: int, login_cada: int):
+    tiempos = {"GET /vehiculos/{id}": [], "POST /reservas": [], "POST /reservas/{id}/finalizar": [], "POST /token": []}
+
+    async def peticion(cliente: httpx.AsyncClient, nombre: str, metodo: str, ruta: str, **kwargs):
+        # Cedemos el turno antes de enviar: la petición espera a que el bucle atienda a los demás
+        # clientes, como una que llega por la red mientras el servidor está ocupado
+        inicio = time.perf_counter()
+        await asyncio.sleep(0)
+        respuesta = await cliente.request(metodo, ruta, **kwargs)
+        tiempos[nombre].append(time.perf_counter() - inicio)
+        if respuesta.status_code != 200:
+            raise RuntimeError(f"{metodo} {ruta}: {respuesta.status_code} {respuesta.text}")
+        return respuesta.json()
+
+    async def usuario(cliente: httpx.AsyncClient, numero: int, vehiculo_id):
+        if numero % login_cada == 0:
+            await peticion(cliente, "POST /token", "POST", "/token",
+                           data={"username": "bench@example.com", "password": PASSWORD})
+        for vuelta in range(vueltas):
+            await peticion(cliente, "GET /vehiculos/{id}", "GET", f"/vehiculos/{vehiculo_id}")
+            reserva = await peticion(cliente, "POST /reservas", "POST", "/reservas", json={
+                "cliente_id": str(cliente_id), "vehiculo_id": str(vehiculo_id),
+                "fecha_inicio": f"2030-01-{1 + 3 * vuelta:02d}", "fecha_fin": f"2030-01-{3 + 3 * vuelta:02d}",
+                "sucursal_devolucion_id": str(sucursal_id),
+            })
+            await peticion(cliente, "POST /reservas/{id}/finalizar", "POST", f"/reservas/{reserva['id']}/finalizar",
+                           json={"km_recorridos": 100})
+
+    # Una conexión por cliente, todas abiertas a la vez
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench",
+                                 limits=httpx.Limits(max_connections=None)) as cliente:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(usuario(cliente, i, v) for i, v in enumerate(vehiculos)))
+        duracion = time.perf_counter() - inicio
+    return duracion, tiempos
+
+
+def informe(nombre: str, duracion: float, tiempos: dict):
+    total = sum(len(t) for t in tiempos.values())
+    print(f"{nombre}: {total} peticiones en {duracion:.2f} s ({total / duracion:.0f} peticiones/s)")
+    for ruta, medidas in tiempos.items():
+        if not medidas:
+            continue
+        percentiles = statistics.quantiles(medidas, n=100)
+        print(f"  {ruta:<32} p50 {percentiles[49] * 1000:8.1f} ms   p99 {percentiles[98] * 1000:8.1f} ms")
+
+
+def main_benchmark(clientes: int, vueltas: int, login_cada: int):
+    # Sin límite de peticiones en /token: todas llegan desde el mismo cliente de prueba
+    main.limitador.configurar("/token", Limite(10 ** 9, 10 ** 9), Limite(10 ** 9, 10 ** 9))
+    cliente_id, sucursal_id, (flota_mixta, flota_async) = preparar(clientes)
+    print(f"{clientes} clientes a la vez, {vueltas} reservas cada uno, "
+          f"login con bcrypt ({os.environ['BCRYPT_RONDAS']} rondas) en uno de cada {login_cada}\n")
+
+    duracion, tiempos = asyncio.run(simular(app_mixta(), cliente_id, sucursal_id, flota_mixta, vueltas, login_cada))
+    informe("Modelo mixto (def en el pool de hilos, bcrypt en el bucle)", duracion, tiempos)
+    duracion, tiempos = asyncio.run(simular(main.app, cliente_id, sucursal_id, flota_async, vueltas, login_cada))
+    informe("Todo async (AlquilerServicioAsync, bcrypt en su pool)", duracion, tiempos)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clientes", type=int, default=1000)
+    parser.add_argument("--vueltas", type=int, default=3)
+    parser.add_argument("--login-cada", type=int, default=20)
+    argumentos = parser.parse_args()
+    main_benchmark(argumentos.clientes, argumentos.vueltas, argumentos.login_cada)
@@ -0,0 +1,133 @@
+# Medimos el registro de auditoría (services/RegistroAuditoria.py) en sus dos caras:
+# - Reservas por segundo sin auditoría, con el registro (cola acotada y escritura por bloques en otro
+#   hilo) y escribiendo y forzando a disco cada evento en la propia petición.
+# - Consultas ("historial de un vehículo", "pagos de un día") con el índice de cada segmento, frente a
+#   descomprimir y filtrar todos los bloques.
+#
+# Uso: python -m benchmarks.bench_auditoria [--reservas 5000] [--eventos 300000] [--directorio /tmp/auditoria-bench]
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import shutil
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from services.AlquilerServicio import AlquilerServicio
+from services.Eventos import Evento
+from services.RegistroAuditoria import RegistroAuditoria, _CABECERA
+
+
+def _reservas_por_segundo(reservas: int, suscriptor=None) -> float:
+    servicio = AlquilerServicio()
+    if suscriptor is not None:
+        servicio.suscribir(suscriptor)
+    sucursal = servicio.agregar_sucursal("Central", "Calle Mayor 1", "900000000")
+    servicio.crear_tarifa("Básica", "Económico", 40)
+    cliente = servicio.registrar_usuario("cliente", "Cliente Benchmark", "bench@example.com", "x",
+                                         licencia="B-0000", direccion="Calle Prueba 1")
+    flota = [servicio.registrar_vehiculo("coche", f"{i:07d}AUD", "Seat", "Ibiza", 2022, "Económico", 1000, sucursal)
+             for i in range(reservas)]
+    inicio = time.perf_counter()
+    for vehiculo in flota:
+        reserva = servicio.realizar_reserva(cliente.id, vehiculo.id, "2030-01-01", "2030-01-04", sucursal.id)
+        servicio.finalizar_reserva(reserva.id, km_recorridos=120)
+    return reservas / (time.perf_counter() - inicio)
+
+
+class _EscrituraDirecta:
+    # Lo que haríamos sin cola: cada evento se escribe y se fuerza a disco dentro de la petición
+    def __init__(self, ruta: str):
+        self._fichero = open(ruta, "ab")
+
+    def __call__(self, evento: Evento):
+        self._fichero.write(json.dumps(evento.a_dict(), ensure_ascii=False).encode() + b"\n")
+        self._fichero.flush()
+        os.fsync(self._fichero.fileno())
+
+
+def _medir(nombre: str, funcion, repeticiones: int = 3):
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    print(f"  {nombre:<52} {mejor * 1000:9.2f} ms ({len(resultado)} registros)")
+    return resultado
+
+
+def _recorrido_completo(registro: RegistroAuditoria, filtro, contiene: str):
+    # Alternativa sin índices: leer y descomprimir todos los bloques de todos los segmentos (con el
+    # mismo descarte por texto que las consultas, para comparar solo el efecto de los índices)
+    resultado = []
+    for segmento in registro._segmentos:
+        with open(segmento.ruta, "rb") as fichero:
+            while True:
+                cabecera = fichero.read(_CABECERA.size)
+                if not cabecera:
+                    break
+                registros = registro._descomprimir(cabecera, fichero.read(_CABECERA.unpack(cabecera)[0]), contiene)
+                resultado.extend(r for r in registros if filtro(r))
+    return resultado
+
+
+def main_benchmark(reservas: int, eventos: int, directorio: str):
+    shutil.rmtree(directorio, ignore_errors=True)
+    os.makedirs(directorio)
+
+    print(f"{reservas} reservas creadas y finalizadas (unos 6 eventos auditados por reserva)")
+    print(f"  {'sin auditoría':<52} {_reservas_por_segundo(reservas):9.0f} reservas/s")
+    registro = RegistroAuditoria(os.path.join(directorio, "registro"))
+    # Desde un hilo esperamos directamente a que haya sitio en la cola (en la API lo hace el hook de
+    # almacenamiento de la fachada asíncrona)
+    def auditar(evento: Evento):
+        registro.registrar(evento)
+        registro.esperar_sitio()
+    print(f"  {'registro de auditoría (cola y bloques)':<52} "
+          f"{_reservas_por_segundo(reservas, auditar):9.0f} reservas/s")
+    registro.cerrar()
+    directa = _EscrituraDirecta(os.path.join(directorio, "directa.jsonl"))
+    print(f"  {'escritura directa con fsync por evento':<52} "
+          f"{_reservas_por_segundo(min(reservas, 1000), directa):9.0f} reservas/s")
+
+    print(f"\nGenerando {eventos} eventos repartidos en 90 días para las consultas...")
+    aleatorio = random.Random(49)
+    vehiculos = [uuid4() for _ in range(2000)]
+    registro = RegistroAuditoria(os.path.join(directorio, "consultas"), sincronizar=False)
+    inicio_periodo = datetime(2026, 1, 1)
+    for i in range(eventos):
+        tipo = aleatorio.choice(("RESERVA_CREADA", "VEHICULO_ESTADO_CAMBIADO", "PAGO_REGISTRADO",
+                                 "RESERVA_FINALIZADA", "VEHICULO_ESTADO_CAMBIADO"))
+        evento = Evento(tipo, {"vehiculo_id": aleatorio.choice(vehiculos), "reserva_id": uuid4(), "importe": 80.0})
+        evento.fecha = inicio_periodo + timedelta(seconds=i * 90 * 86400 / eventos)
+        registro.registrar(evento)
+    registro.vaciar()
+    print(f"  {registro.estado()}")
+
+    vehiculo = str(vehiculos[0])
+    dia = inicio_periodo + timedelta(days=45)
+    siguiente = dia + timedelta(days=1)
+    _medir("historial de un vehículo (índice)", lambda: registro.buscar(entidad_id=vehiculo, limite=10 ** 9))
+    _medir("historial de un vehículo (todos los bloques)",
+           lambda: _recorrido_completo(registro, lambda r: r["datos"]["vehiculo_id"] == vehiculo, vehiculo),
+           repeticiones=1)
+    _medir("pagos de un día (índice)",
+           lambda: registro.buscar(tipo="PAGO_REGISTRADO", desde=dia, hasta=siguiente, limite=10 ** 9))
+    _medir("pagos de un día (todos los bloques)",
+           lambda: _recorrido_completo(registro, lambda r: r["tipo"] == "PAGO_REGISTRADO"
+                                       and dia <= datetime.fromisoformat(r["fecha"]) < siguiente,
+                                       '"tipo":"PAGO_REGISTRADO"'), repeticiones=1)
+    registro.cerrar()
+    shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reservas", type=int, default=5000)
+    parser.add_argument("--eventos", type=int, default=300_000)
+    parser.add_argument("--directorio", default="/tmp/auditoria-bench")
+    argumentos = parser.parse_args()
+    main_benchmark(argumentos.reservas, argumentos.eventos, argumentos.directorio)
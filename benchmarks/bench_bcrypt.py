@@ -0,0 +1,47 @@
+# Medimos cuánto cuesta verificar una contraseña con cada coste de bcrypt y cuántos logins por
+# segundo puede atender cada núcleo, para elegir BCRYPT_OBJETIVO_MS (o BCRYPT_RONDAS) sabiendo
+# qué seguridad y qué capacidad se obtienen. También mostramos qué coste elige la calibración.
+#
+# Uso: python -m benchmarks.bench_bcrypt [--desde 8] [--hasta 14] [--segundos 2]
+from __future__ import annotations
+import argparse
+import time
+
+import bcrypt
+
+from services.CalibracionBcrypt import RONDAS_MINIMAS, calibrar_rondas
+
+OBJETIVOS_MS = [50, 100, 250, 500, 1000]
+
+
+def medir_verificacion_ms(rondas: int, segundos: float) -> float:
+    # Verificamos la misma contraseña durante unos segundos (al menos 3 veces) y damos la media
+    hash_guardado = bcrypt.hashpw(b"contrasena-de-prueba", bcrypt.gensalt(rondas))
+    veces = 0
+    inicio = time.perf_counter()
+    while veces < 3 or time.perf_counter() - inicio < segundos:
+        bcrypt.checkpw(b"contrasena-de-prueba", hash_guardado)
+        veces += 1
+    return (time.perf_counter() - inicio) / veces * 1000
+
+
+def main_benchmark(desde: int, hasta: int, segundos: float):
+    print("Verificación de contraseñas (un núcleo):")
+    print(f"  {'rondas':>6} {'ms por login':>13} {'logins/s por núcleo':>20}")
+    for rondas in range(desde, hasta + 1):
+        ms = medir_verificacion_ms(rondas, segundos)
+        aviso = "  (por debajo del mínimo recomendado)" if rondas < RONDAS_MINIMAS else ""
+        print(f"  {rondas:>6} {ms:>13.1f} {1000 / ms:>20.1f}{aviso}")
+
+    print("Coste elegido por la calibración de arranque según BCRYPT_OBJETIVO_MS:")
+    for objetivo in OBJETIVOS_MS:
+        print(f"  {objetivo:>5} ms -> {calibrar_rondas(objetivo)} rondas")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--desde", type=int, default=8)
+    parser.add_argument("--hasta", type=int, default=14)
+    parser.add_argument("--segundos", type=float, default=2.0)
+    argumentos = parser.parse_args()
+    main_benchmark(argumentos.desde, argumentos.hasta, argumentos.segundos)
@@ -0,0 +1,130 @@
+# Medimos la búsqueda de vehículos por matrícula, marca o modelo (GET /vehiculos/buscar) con el
+# índice de services/BuscadorVehiculos.py (matrículas y vocabulario ordenados con búsqueda binaria
+# e índice invertido de palabras) frente a recorrer toda la flota comprobando cada vehículo.
+# Consultas de tres tipos: prefijo de matrícula, palabras de marca/modelo y combinadas (varios
+# términos, con filtros de estado y sucursal).
+#
+# Uso: python -m benchmarks.bench_buscador [--vehiculos 100000] [--consultas 2000] [--limite 20]
+from __future__ import annotations
+import argparse
+import random
+import time
+
+from models.Vehiculo import normalizar_matricula
+from services.AlquilerServicio import AlquilerServicio
+from services.BuscadorVehiculos import _tokenizar
+
+MODELOS = {
+    "Seat": ["Ibiza", "León", "Arona", "Ateca"],
+    "Toyota": ["Corolla", "Yaris", "C-HR", "RAV4"],
+    "Renault": ["Clio", "Mégane", "Captur", "Kangoo"],
+    "Volkswagen": ["Golf", "Polo", "T-Roc", "Transporter"],
+    "Peugeot": ["208", "308", "2008", "Partner"],
+    "Ford": ["Fiesta", "Focus", "Kuga", "Transit"],
+    "Kia": ["Rio", "Ceed", "Sportage", "Niro"],
+    "Hyundai": ["i20", "i30", "Tucson", "Kona"],
+}
+LETRAS = "BCDFGHJKLMNPRSTVWXYZ"
+
+
+def preparar(vehiculos: int):
+    aleatorio = random.Random(31)
+    servicio = AlquilerServicio()
+    sucursales = [servicio.agregar_sucursal(f"Sucursal {i}", f"Calle {i}", "900000000") for i in range(50)]
+    marcas = list(MODELOS)
+    for i in range(vehiculos):
+        marca = aleatorio.choice(marcas)
+        letras = "".join(aleatorio.choice(LETRAS) for _ in range(3))
+        servicio.registrar_vehiculo("coche", f"{i:04d} {letras}", marca, aleatorio.choice(MODELOS[marca]),
+                                    2020, "Económico", 1000, aleatorio.choice(sucursales))
+    # Una parte de la flota alquilada, para que el filtro de estado descarte vehículos
+    for vehiculo in aleatorio.sample(list(servicio.vehiculos.values()), vehiculos // 4):
+        vehiculo.cambiar_estado("RESERVADO")
+    return servicio, sucursales
+
+
+def recorrido_completo(servicio: AlquilerServicio, texto: str, estado, sucursal_id, limite: int):
+    # Lo que haríamos sin índice: comprobar todos los vehículos. Mismo criterio que el buscador: cada
+    # término es prefijo de la matrícula o de una palabra de la marca o el modelo (o el texto entero
+    # es prefijo de la matrícula escrita con separadores)
+    terminos = _tokenizar(texto)
+    matricula_texto = normalizar_matricula(texto) if len(terminos) > 1 else None
+    resultado = []
+    for vehiculo in servicio.vehiculos.values():
+        if estado and vehiculo.estado != estado:
+            continue
+        if sucursal_id and (not vehiculo.sucursal or vehiculo.sucursal.id != sucursal_id):
+            continue
+        matricula = normalizar_matricula(vehiculo.matricula)
+        palabras = _tokenizar(vehiculo.marca) + _tokenizar(vehiculo.modelo)
+        if not (matricula_texto and matricula.startswith(matricula_texto)) and not all(
+                matricula.startswith(t.upper()) or any(p.startswith(t) for p in palabras) for t in terminos):
+            continue
+        resultado.append(vehiculo)
+        if len(resultado) >= limite:
+            break
+    return resultado
+
+
+def consultas(sucursales, numero: int):
+    # (texto, estado, sucursal) de cada tipo de consulta
+    aleatorio = random.Random(7)
+    marcas = list(MODELOS)
+
+    def modelo():
+        marca = aleatorio.choice(marcas)
+        return marca, aleatorio.choice(MODELOS[marca])
+
+    prefijos = [(f"{aleatorio.randrange(10000):04d}"[:aleatorio.choice((2, 3, 4))], None, None)
+                for _ in range(numero)]
+    palabras = []
+    for _ in range(numero):
+        marca, nombre = modelo()
+        palabras.append((aleatorio.choice((marca, nombre, nombre[:3].lower())), None, None))
+    combinadas = []
+    for _ in range(numero):
+        marca, nombre = modelo()
+        texto = aleatorio.choice((f"{marca} {nombre[:2]}", f"{marca[:3]} {nombre} {aleatorio.randrange(10)}",
+                                  f"{aleatorio.randrange(10000):04d} {aleatorio.choice(LETRAS)}"))
+        combinadas.append((texto, aleatorio.choice((None, "DISPONIBLE")),
+                           aleatorio.choice(sucursales).id if aleatorio.random() < 0.5 else None))
+    return [("prefijo de matrícula", prefijos), ("marca o modelo", palabras),
+            ("combinada con filtros", combinadas)]
+
+
+def medir(funcion, lista) -> float:
+    # Milisegundos por consulta
+    inicio = time.perf_counter()
+    for texto, estado, sucursal_id in lista:
+        funcion(texto, estado, sucursal_id)
+    return (time.perf_counter() - inicio) * 1000 / len(lista)
+
+
+def main_benchmark(vehiculos: int, numero: int, limite: int):
+    print(f"Generando {vehiculos} vehículos...")
+    inicio = time.perf_counter()
+    servicio, sucursales = preparar(vehiculos)
+    print(f"  alta de la flota (con el índice de búsqueda) {time.perf_counter() - inicio:.1f} s\n")
+
+    print(f"{numero} consultas de cada tipo, hasta {limite} resultados")
+    for nombre, lista in consultas(sucursales, numero):
+        # Comprobamos que las dos formas encuentran los mismos vehículos (sin límite) antes de medir
+        for texto, estado, sucursal_id in lista[:20]:
+            con_indice = servicio.buscar_vehiculos(texto, estado, sucursal_id, vehiculos)
+            sin_indice = recorrido_completo(servicio, texto, estado, sucursal_id, vehiculos)
+            if {v.id for v in con_indice} != {v.id for v in sin_indice}:
+                raise RuntimeError(f"El índice no devuelve los mismos vehículos que el recorrido para '{texto}'")
+        ms_indice = medir(lambda t, e, s: servicio.buscar_vehiculos(t, e, s, limite), lista)
+        # El recorrido completo es mucho más lento: lo medimos con menos consultas
+        ms_lineal = medir(lambda t, e, s: recorrido_completo(servicio, t, e, s, limite), lista[:max(1, numero // 20)])
+        print(f"  {nombre:<24} índice {ms_indice:8.3f} ms   recorrido completo {ms_lineal:8.3f} ms"
+              f"   (x{ms_lineal / ms_indice:.0f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehiculos", type=int, default=100_000)
+    parser.add_argument("--consultas", type=int, default=2000)
+    parser.add_argument("--limite", type=int, default=20)
+    argumentos = parser.parse_args()
+    main_benchmark(argumentos.vehiculos, argumentos.consultas, argumentos.limite)
@@ -0,0 +1,93 @@
+# Comparamos lo que necesita cada proceso para servir el catálogo de vehículos:
+# cargar el estado completo del servicio (objetos Python en el heap de cada worker)
+# frente a proyectar en memoria el catálogo binario (páginas compartidas entre procesos).
+#
+# Uso (Linux): python -m benchmarks.bench_catalogo [--vehiculos 100000]
+from __future__ import annotations
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_serializacion import _poblar
+from services.AlquilerServicio import AlquilerServicio
+
+# Código que ejecuta cada proceso hijo: carga el catálogo de una forma u otra y mide memoria y tiempos
+_HIJO = r"""
+import random, sys, time
+
+def memoria_propia():
+    # Memoria privada modificada del proceso (heap): la que no se puede compartir con otros workers
+    with open("/proc/self/smaps_rollup") as fichero:
+        for linea in fichero:
+            if linea.startswith("Private_Dirty:"):
+                return int(linea.split()[1])
+    return 0
+
+modo, ruta = sys.argv[1], sys.argv[2]
+base = memoria_propia()
+inicio = time.perf_counter()
+if modo == "estado":
+    from services.AlquilerServicio import AlquilerServicio
+    import main
+    servicio = AlquilerServicio.cargar_estado(ruta)
+    ids = list(servicio.vehiculos)
+    consultar = lambda i: main._vehiculo_to_dict(servicio.vehiculos[i])
+    listar = lambda: [main._vehiculo_to_dict(v) for v in servicio.vehiculos.values()]
+else:
+    from services.CatalogoBinario import CatalogoBinario
+    from uuid import UUID
+    catalogo = CatalogoBinario(ruta)
+    ids = None
+    consultar = catalogo.vehiculo
+    listar = catalogo.vehiculos
+carga = time.perf_counter() - inicio
+memoria = memoria_propia() - base
+
+if ids is None:
+    ids = [UUID(f["id"]) for f in listar()]
+
+muestra = random.Random(1).choices(ids, k=10000)
+inicio = time.perf_counter()
+for i in muestra:
+    consultar(i)
+consulta = (time.perf_counter() - inicio) / len(muestra)
+inicio = time.perf_counter()
+listar()
+listado = time.perf_counter() - inicio
+print(carga, memoria, consulta, listado)
+"""
+
+
+def _medir(modo: str, ruta: str):
+    salida = subprocess.run([sys.executable, "-c", _HIJO, modo, ruta], check=True,
+                            capture_output=True, text=True, cwd=os.getcwd()).stdout.split()
+    carga, memoria, consulta, listado = map(float, salida)
+    print(f"  {modo:<9} carga {carga * 1000:8.1f} ms | memoria propia {memoria / 1024:7.1f} MB | "
+          f"consulta por id {consulta * 1e6:6.1f} µs | listado completo {listado * 1000:7.1f} ms")
+
+
+def main_benchmark(vehiculos: int):
+    servicio = AlquilerServicio()
+    print(f"Generando {vehiculos} vehículos...")
+    _poblar(servicio, vehiculos)
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        estado = os.path.join(carpeta, "estado.bin")
+        catalogo = os.path.join(carpeta, "catalogo.bin")
+        servicio.guardar_estado(estado)
+        inicio = time.perf_counter()
+        servicio.exportar_catalogo(catalogo)
+        print(f"Catálogo generado en {(time.perf_counter() - inicio) * 1000:.1f} ms "
+              f"({os.path.getsize(catalogo) / 1024 / 1024:.1f} MB en disco, "
+              f"estado completo {os.path.getsize(estado) / 1024 / 1024:.1f} MB)")
+        _medir("estado", estado)
+        _medir("catalogo", catalogo)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehiculos", type=int, default=100_000)
+    main_benchmark(parser.parse_args().vehiculos)
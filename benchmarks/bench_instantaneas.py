@@ -0,0 +1,95 @@
+# Medimos la latencia de las escrituras (crear y cancelar reservas) mientras otro hilo lista todas
+# las reservas una y otra vez: recorriendo una instantánea sin cerrojo, frente a recorrerlas con el
+# cerrojo del servicio tomado (lo necesario para listar sin instantáneas y sin errores de
+# "dictionary changed size during iteration"), y frente a las escrituras sin lecturas.
+#
+# Uso: python -m benchmarks.bench_instantaneas [--reservas 100000] [--segundos 5]
+from __future__ import annotations
+import argparse
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+
+from services.AlquilerServicio import AlquilerServicio
+
+
+def preparar(reservas: int):
+    servicio = AlquilerServicio()
+    sucursal = servicio.agregar_sucursal("Central", "Calle Mayor 1", "900000000")
+    servicio.crear_tarifa("Básica", "Económico", 40)
+    cliente = servicio.registrar_usuario("cliente", "Cliente Benchmark", "bench@example.com", "x",
+                                         licencia="B-0000", direccion="Calle Prueba 1")
+    inicio = datetime(2025, 1, 1)
+    print(f"Generando {reservas} reservas...")
+    for i in range(reservas):
+        vehiculo = servicio.registrar_vehiculo("coche", f"{i:07d}INS", "Seat", "Ibiza", 2022, "Económico", 1000, sucursal)
+        desde = inicio + timedelta(days=i % 300)
+        servicio.realizar_reserva(cliente.id, vehiculo.id, f"{desde:%Y-%m-%d}",
+                                  f"{desde + timedelta(days=3):%Y-%m-%d}", sucursal.id)
+    libres = [servicio.registrar_vehiculo("coche", f"{i:07d}LIB", "Seat", "Ibiza", 2022, "Económico", 1000, sucursal)
+              for i in range(100)]
+    return servicio, cliente, sucursal, libres
+
+
+def listar(servicio, reservas):
+    # Lo que hace un listado: recorrer todas las reservas y preparar cada fila
+    return [(str(r.id), r.estado, r.fecha_inicio, r.total_estimado) for r in reservas]
+
+
+def medir(nombre: str, servicio, cliente, sucursal, libres, segundos: float, lector=None):
+    parar = threading.Event()
+    listados = [0]
+
+    def leer():
+        while not parar.is_set():
+            lector(servicio)
+            listados[0] += 1
+
+    hilo = threading.Thread(target=leer) if lector else None
+    if hilo:
+        hilo.start()
+
+    latencias = []
+    fin = time.perf_counter() + segundos
+    i = 0
+    while time.perf_counter() < fin:
+        vehiculo = libres[i % len(libres)]
+        inicio = time.perf_counter()
+        reserva = servicio.realizar_reserva(cliente.id, vehiculo.id, "2026-06-01", "2026-06-03", sucursal.id)
+        servicio.cancelar_reserva(reserva.id)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        i += 1
+        time.sleep(0.001)  # ritmo de escrituras moderado, como en producción
+
+    parar.set()
+    if hilo:
+        hilo.join()
+    latencias.sort()
+    p99 = latencias[int(len(latencias) * 0.99) - 1]
+    print(f"  {nombre:<36} escrituras {len(latencias):5d} | mediana {statistics.median(latencias):7.2f} ms | "
+          f"p99 {p99:7.2f} ms | máx {latencias[-1]:8.2f} ms | listados {listados[0]}")
+
+
+def main_benchmark(reservas: int, segundos: float):
+    servicio, cliente, sucursal, libres = preparar(reservas)
+
+    def con_instantanea(s):
+        listar(s, s.reservas.values())
+
+    def con_cerrojo(s):
+        with s._lock:
+            listar(s, dict.values(s.reservas))
+
+    print(f"Latencia de crear y cancelar una reserva mientras se listan {reservas} reservas:")
+    medir("sin lecturas", servicio, cliente, sucursal, libres, segundos)
+    medir("listados sobre instantánea", servicio, cliente, sucursal, libres, segundos, con_instantanea)
+    medir("listados con el cerrojo tomado", servicio, cliente, sucursal, libres, segundos, con_cerrojo)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reservas", type=int, default=100_000)
+    parser.add_argument("--segundos", type=float, default=5.0)
+    argumentos = parser.parse_args()
+    main_benchmark(argumentos.reservas, argumentos.segundos)
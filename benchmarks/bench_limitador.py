@@ -0,0 +1,94 @@
+# Medimos lo que añade el límite de peticiones a cada petición: la comprobación de las cubetas
+# sola (con muchos clientes distintos y con el almacén lleno, olvidando cubetas) y dentro de una
+# petición HTTP completa, frente a la misma ruta sin límite.
+#
+# Uso: python -m benchmarks.bench_limitador [--peticiones 200000] [--clientes 50000]
+from __future__ import annotations
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+from fastapi import Depends, FastAPI, Request
+
+from services.LimitadorPeticiones import AlmacenLocal, Limite, LimitadorPeticiones
+
+
+def medir_comprobaciones(nombre: str, limitador: LimitadorPeticiones, clientes: list):
+    inicio = time.perf_counter()
+    rechazadas = 0
+    for cliente in clientes:
+        if limitador.comprobar("/token", cliente):
+            rechazadas += 1
+    duracion = time.perf_counter() - inicio
+    print(f"  {nombre:<44} {duracion / len(clientes) * 1e6:6.2f} µs por petición "
+          f"({rechazadas} rechazadas, {len(limitador.almacen)} cubetas)")
+
+
+def medir_http(peticiones: int):
+    # Misma ruta vacía con y sin la dependencia de límite, para aislar su coste dentro de FastAPI
+    limitador = LimitadorPeticiones()
+    limitador.configurar("/con-limite", Limite(10**9, 10**9))
+
+    async def limitar(request: Request):
+        limitador.comprobar(request.url.path, request.client.host if request.client else "")
+
+    app = FastAPI()
+
+    @app.get("/sin-limite")
+    def sin_limite():
+        return {}
+
+    @app.get("/con-limite", dependencies=[Depends(limitar)])
+    def con_limite():
+        return {}
+
+    async def lanzar():
+        resultados = {}
+        transporte = httpx.ASGITransport(app=app, client=("10.0.0.1", 1234))
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+            # Cada ruta se mide dos veces y nos quedamos con la segunda (la primera calienta)
+            for ruta in ("/sin-limite", "/con-limite", "/sin-limite", "/con-limite"):
+                inicio = time.perf_counter()
+                for _ in range(peticiones):
+                    await cliente.get(ruta)
+                resultados[ruta] = (time.perf_counter() - inicio) / peticiones * 1e6
+        return resultados
+
+    resultados = asyncio.run(lanzar())
+    for ruta, micros in resultados.items():
+        print(f"  GET {ruta:<40} {micros:6.1f} µs por petición")
+    print(f"  Coste del límite dentro de la petición: {resultados['/con-limite'] - resultados['/sin-limite']:.1f} µs")
+
+
+def main_benchmark(peticiones: int, clientes: int):
+    aleatorio = random.Random(5)
+    ips = [f"ip:10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(clientes)]
+    secuencia = [aleatorio.choice(ips) for _ in range(peticiones)]
+
+    print(f"Comprobaciones de límite ({peticiones} peticiones de {clientes} clientes):")
+    limitador = LimitadorPeticiones()
+    limitador.configurar("/token", Limite(10, 10), Limite(10**6, 10**6))
+    medir_comprobaciones("almacén local", limitador, secuencia)
+
+    # Con un almacén más pequeño que el número de clientes, casi cada petición olvida una cubeta
+    limitador = LimitadorPeticiones(AlmacenLocal(max_cubetas=clientes // 10))
+    limitador.configurar("/token", Limite(10, 10), Limite(10**6, 10**6))
+    medir_comprobaciones(f"almacén local lleno ({clientes // 10} cubetas)", limitador, secuencia)
+
+    # Un solo cliente insistente: casi todas sus peticiones se rechazan
+    limitador = LimitadorPeticiones()
+    limitador.configurar("/token", Limite(10, 10))
+    medir_comprobaciones("un cliente por encima del límite", limitador, ["ip:10.0.0.1"] * peticiones)
+
+    print("Peticiones HTTP (ASGI en el mismo proceso):")
+    medir_http(min(peticiones, 3000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peticiones", type=int, default=200_000)
+    parser.add_argument("--clientes", type=int, default=50_000)
+    argumentos = parser.parse_args()
+    main_benchmark(argumentos.peticiones, argumentos.clientes)
@@ -0,0 +1,93 @@
+# Medimos reservas por segundo con el estado repartido por sucursales entre varios procesos
+# (services/Particionado.py), frente a un único AlquilerServicio en el proceso. Las reservas se
+# envían en lotes repartidos entre todas las sucursales, así que cada partición trabaja con las
+# suyas a la vez que las demás: con núcleos libres, el rendimiento crece con las particiones.
+#
+# Uso: python -m benchmarks.bench_particionado [--sucursales 8] [--vehiculos 250] [--rondas 5] [--particiones 1 2 4]
+from __future__ import annotations
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+from services.AlquilerServicio import AlquilerServicio
+from services.Particionado import ServicioParticionado
+
+DIAS = 5
+
+
+def preparar(servicio, sucursales: int, vehiculos: int, por_id: bool):
+    # Mismos datos en los dos casos; el servicio particionado recibe ids de sucursal en lugar de objetos
+    lista = [servicio.agregar_sucursal(f"Sucursal {i}", f"Calle {i}", "900000000") for i in range(sucursales)]
+    servicio.crear_tarifa("Básica", "Económico", 40)
+    cliente = servicio.registrar_usuario("cliente", "Cliente Benchmark", "bench@example.com", "x",
+                                         licencia="B-0000", direccion="Calle Prueba 1")
+    flota = []
+    for i in range(sucursales * vehiculos):
+        sucursal = lista[i % sucursales]
+        vehiculo = servicio.registrar_vehiculo("coche", f"{i:07d}PAR", "Seat", "Ibiza", 2022, "Económico",
+                                               1000, sucursal.id if por_id else sucursal)
+        flota.append((vehiculo["id"] if por_id else vehiculo.id, sucursal.id))
+    return cliente, flota
+
+
+def peticiones(cliente, flota, ronda: int):
+    # Una reserva por vehículo, devolviendo en la misma sucursal; cada ronda usa otras fechas
+    desde = datetime(2026, 1, 1) + timedelta(days=ronda * DIAS)
+    inicio, fin = f"{desde:%Y-%m-%d}", f"{desde + timedelta(days=DIAS - 1):%Y-%m-%d}"
+    return [{"cliente_id": cliente.id, "vehiculo_id": vehiculo_id, "fecha_inicio": inicio,
+             "fecha_fin": fin, "id_sucursal_devolucion": sucursal_id} for vehiculo_id, sucursal_id in flota]
+
+
+def medir_local(sucursales: int, vehiculos: int, rondas: int) -> float:
+    servicio = AlquilerServicio()
+    cliente, flota = preparar(servicio, sucursales, vehiculos, por_id=False)
+    total, segundos = 0, 0.0
+    for ronda in range(rondas):
+        lote = peticiones(cliente, flota, ronda)
+        inicio = time.perf_counter()
+        reservas = [servicio.realizar_reserva(**peticion) for peticion in lote]
+        segundos += time.perf_counter() - inicio
+        # Las cancelamos (sin contar el tiempo) para que el vehículo esté disponible en la siguiente ronda
+        for reserva in reservas:
+            servicio.cancelar_reserva(reserva.id)
+        total += len(reservas)
+    return total / segundos
+
+
+def medir_particionado(particiones: int, sucursales: int, vehiculos: int, rondas: int) -> float:
+    with ServicioParticionado(particiones) as servicio:
+        cliente, flota = preparar(servicio, sucursales, vehiculos, por_id=True)
+        total, segundos = 0, 0.0
+        for ronda in range(rondas):
+            lote = peticiones(cliente, flota, ronda)
+            inicio = time.perf_counter()
+            resultados = servicio.realizar_reservas(lote)
+            segundos += time.perf_counter() - inicio
+            fallidas = [r["error"] for r in resultados if not r["correcta"]]
+            if fallidas:
+                raise RuntimeError(f"Reservas rechazadas: {fallidas[:3]}")
+            # Igual que arriba, las cancelaciones no cuentan
+            for resultado in resultados:
+                servicio.cancelar_reserva(resultado["reserva"]["id"])
+            total += len(resultados)
+        return total / segundos
+
+
+def main_benchmark(sucursales: int, vehiculos: int, rondas: int, particiones):
+    print(f"{sucursales} sucursales x {vehiculos} vehículos, {rondas} rondas de reservas "
+          f"({os.cpu_count()} núcleos disponibles)")
+    print(f"  {'un proceso (AlquilerServicio)':<32} {medir_local(sucursales, vehiculos, rondas):10.0f} reservas/s")
+    for n in particiones:
+        ritmo = medir_particionado(n, sucursales, vehiculos, rondas)
+        print(f"  {f'{n} particiones':<32} {ritmo:10.0f} reservas/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sucursales", type=int, default=8)
+    parser.add_argument("--vehiculos", type=int, default=250)
+    parser.add_argument("--rondas", type=int, default=5)
+    parser.add_argument("--particiones", type=int, nargs="+", default=[1, 2, 4])
+    argumentos = parser.parse_args()
+    main_benchmark(argumentos.sucursales, argumentos.vehiculos, argumentos.rondas, argumentos.particiones)
@@ -0,0 +1,76 @@
+# Medimos el planificador de mantenimiento con una flota grande: cuánto cuesta pedir el plan
+# (los vehículos más urgentes con su ventana) y mantenerlo al día cuando se devuelven vehículos,
+# frente a recalcular el vencimiento de toda la flota y ordenarla en cada consulta.
+#
+# Uso: python -m benchmarks.bench_planificador [--vehiculos 100000]
+from __future__ import annotations
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from services.AlquilerServicio import AlquilerServicio
+
+
+def _medir(nombre: str, funcion, repeticiones: int = 5):
+    # Nos quedamos con el mejor tiempo de varias repeticiones
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    print(f"  {nombre:<42} {mejor * 1000:9.2f} ms")
+    return resultado
+
+
+def main_benchmark(vehiculos: int):
+    aleatorio = random.Random(7)
+    servicio = AlquilerServicio()
+    sucursal = servicio.agregar_sucursal("Central", "Calle Mayor 1", "900000000")
+    servicio.crear_tarifa("Básica", "Económico", 35.0)
+    cliente = servicio.registrar_usuario("cliente", "Cliente Benchmark", "bench@example.com", "x",
+                                         licencia="B-0000", direccion="Calle Prueba 1")
+    hoy = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    print(f"Generando {vehiculos} vehículos (un 10% con una reserva en los próximos días)...")
+    inicio = time.perf_counter()
+    flota = []
+    for i in range(vehiculos):
+        vehiculo = servicio.registrar_vehiculo("coche", f"{i:07d}PLN", "Seat", "Ibiza",
+                                               aleatorio.randint(2012, 2025), "Económico",
+                                               aleatorio.uniform(0, 120000), sucursal)
+        flota.append(vehiculo)
+        if i % 10 == 0:
+            desde = hoy + timedelta(days=aleatorio.randint(0, 20))
+            servicio.realizar_reserva(cliente.id, vehiculo.id, f"{desde:%Y-%m-%d}",
+                                      f"{desde + timedelta(days=aleatorio.randint(1, 7)):%Y-%m-%d}", sucursal.id)
+    print(f"  alta de la flota: {time.perf_counter() - inicio:.1f} s")
+
+    planificador = servicio.planificador
+    _medir("plan: 50 más urgentes (cola de prioridad)", lambda: servicio.planificar_mantenimientos(limite=50))
+    _medir("plan: 500 más urgentes (cola de prioridad)", lambda: servicio.planificar_mantenimientos(limite=500))
+
+    def recorrido_completo():
+        # Alternativa sin cola: calcular el vencimiento de cada vehículo y ordenar toda la flota
+        vencimientos = [(planificador.vencimiento(v.id, tipo), v.id, tipo)
+                        for v in flota for tipo in ("REVISIÓN", "ITV")]
+        vencimientos.sort()
+        return vencimientos[:50]
+    _medir("recorrido completo de la flota y ordenación", recorrido_completo, repeticiones=3)
+
+    # Devoluciones: cada una actualiza los km del vehículo y su posición en la cola
+    reservas = list(servicio.reservas)
+    inicio = time.perf_counter()
+    for reserva_id in reservas:
+        servicio.finalizar_reserva(reserva_id, km_recorridos=aleatorio.uniform(50, 2000))
+    duracion = time.perf_counter() - inicio
+    print(f"  {len(reservas)} devoluciones (con actualización del plan): {duracion * 1000:.1f} ms "
+          f"({duracion / len(reservas) * 1e6:.1f} µs cada una)")
+    _medir("plan tras las devoluciones", lambda: servicio.planificar_mantenimientos(limite=50))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehiculos", type=int, default=100_000)
+    main_benchmark(parser.parse_args().vehiculos)
@@ -0,0 +1,69 @@
+# Medimos el coste de los presupuestos con precios dinámicos: con los multiplicadores de cada día
+# ya calculados, tras invalidar los días de una reserva nueva y sin memoria (recalculando todo).
+#
+# Uso: python -m benchmarks.bench_precios [--reservas 50000]
+from __future__ import annotations
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from services.AlquilerServicio import AlquilerServicio
+
+CATEGORIAS = ["Económico", "Compacto", "SUV", "Premium", "Furgoneta"]
+
+
+def main_benchmark(reservas: int):
+    aleatorio = random.Random(3)
+    servicio = AlquilerServicio()
+    sucursales = [servicio.agregar_sucursal(f"Sucursal {i}", f"Calle {i}", "900000000") for i in range(20)]
+    for categoria in CATEGORIAS:
+        servicio.crear_tarifa(categoria, categoria, aleatorio.uniform(30, 120))
+    servicio.agregar_temporada("Verano", "07-01", "08-31", 1.3)
+    servicio.agregar_temporada("Navidad", "12-20", "01-07", 1.2)
+    cliente = servicio.registrar_usuario("cliente", "Cliente Benchmark", "bench@example.com", "x",
+                                         licencia="B-0000", direccion="Calle Prueba 1")
+    inicio_año = datetime(2025, 1, 1)
+
+    print(f"Generando {reservas} reservas...")
+    for i in range(reservas):
+        vehiculo = servicio.registrar_vehiculo("coche", f"{i:07d}PRC", "Seat", "Ibiza", 2022,
+                                               aleatorio.choice(CATEGORIAS), 1000, aleatorio.choice(sucursales))
+        desde = inicio_año + timedelta(days=aleatorio.randint(0, 360))
+        servicio.realizar_reserva(cliente.id, vehiculo.id, f"{desde:%Y-%m-%d}",
+                                  f"{desde + timedelta(days=aleatorio.randint(1, 14)):%Y-%m-%d}", sucursales[0].id)
+
+    consultas = [(aleatorio.choice(sucursales).id, aleatorio.choice(CATEGORIAS),
+                  inicio_año + timedelta(days=aleatorio.randint(0, 350))) for _ in range(20000)]
+
+    def presupuestos():
+        for sucursal_id, categoria, desde in consultas:
+            servicio.cotizar_reserva(sucursal_id, categoria, f"{desde:%Y-%m-%d}",
+                                     f"{desde + timedelta(days=7):%Y-%m-%d}")
+
+    def medir(nombre):
+        inicio = time.perf_counter()
+        presupuestos()
+        duracion = time.perf_counter() - inicio
+        print(f"  {nombre:<38} {duracion / len(consultas) * 1e6:8.1f} µs por presupuesto de 7 días")
+
+    servicio.precios._multiplicadores.clear()
+    medir("sin multiplicadores calculados")
+    medir("con multiplicadores en memoria")
+
+    # Cada reserva nueva solo invalida sus propios días en su sucursal y categoría
+    inicio = time.perf_counter()
+    for i in range(1000):
+        vehiculo = servicio.registrar_vehiculo("coche", f"{i:07d}NEW", "Seat", "Ibiza", 2022,
+                                               aleatorio.choice(CATEGORIAS), 1000, aleatorio.choice(sucursales))
+        desde = inicio_año + timedelta(days=aleatorio.randint(0, 360))
+        servicio.realizar_reserva(cliente.id, vehiculo.id, f"{desde:%Y-%m-%d}",
+                                  f"{desde + timedelta(days=5):%Y-%m-%d}", sucursales[0].id)
+    print(f"  1000 altas y reservas nuevas: {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    medir("tras las reservas nuevas")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reservas", type=int, default=50_000)
+    main_benchmark(parser.parse_args().reservas)
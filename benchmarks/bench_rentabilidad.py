@@ -0,0 +1,80 @@
+# Medimos el ranking de los vehículos menos rentables (GET /vehiculos/rentabilidad) con los totales
+# por vehículo que se actualizan en cada devolución y mantenimiento, frente a cruzar todas las
+# reservas finalizadas y todos los mantenimientos en cada consulta.
+#
+# Uso: python -m benchmarks.bench_rentabilidad [--vehiculos 20000] [--reservas 3] [--limite 20]
+from __future__ import annotations
+import argparse
+import heapq
+import random
+import time
+from datetime import datetime, timedelta
+
+from services.AlquilerServicio import AlquilerServicio
+
+
+def _medir(nombre: str, funcion, repeticiones: int = 5):
+    # Nos quedamos con el mejor tiempo de varias repeticiones
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    print(f"  {nombre:<46} {mejor * 1000:9.3f} ms")
+    return resultado
+
+
+def main_benchmark(vehiculos: int, reservas: int, limite: int):
+    aleatorio = random.Random(48)
+    servicio = AlquilerServicio()
+    sucursal = servicio.agregar_sucursal("Central", "Calle Mayor 1", "900000000")
+    servicio.crear_tarifa("Básica", "Económico", 35.0)
+    cliente = servicio.registrar_usuario("cliente", "Cliente Benchmark", "bench@example.com", "x",
+                                         licencia="B-0000", direccion="Calle Prueba 1")
+    hoy = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    print(f"Generando {vehiculos} vehículos con {reservas} alquileres finalizados cada uno "
+          f"y un mantenimiento uno de cada cinco...")
+    inicio = time.perf_counter()
+    for i in range(vehiculos):
+        vehiculo = servicio.registrar_vehiculo("coche", f"{i:07d}REN", "Seat", "Ibiza", 2020, "Económico",
+                                               aleatorio.uniform(0, 120000), sucursal)
+        desde = hoy + timedelta(days=10)
+        for _ in range(reservas):
+            dias = aleatorio.randint(1, 7)
+            reserva = servicio.realizar_reserva(cliente.id, vehiculo.id, f"{desde:%Y-%m-%d}",
+                                                f"{desde + timedelta(days=dias):%Y-%m-%d}", sucursal.id)
+            servicio.finalizar_reserva(reserva.id, km_recorridos=aleatorio.uniform(50, 1500))
+            desde += timedelta(days=dias)
+        if i % 5 == 0:
+            servicio.registrar_mantenimiento(vehiculo.id, "Reparación", f"{desde:%Y-%m-%d}", f"{desde:%Y-%m-%d}",
+                                             aleatorio.uniform(100, 1500), "REPARACIÓN")
+    print(f"  alta de la flota e historial: {time.perf_counter() - inicio:.1f} s")
+
+    con_totales = _medir(f"{limite} menos rentables (totales y cola)",
+                         lambda: servicio.vehiculos_menos_rentables(limite))
+
+    def cruzar_todo():
+        # Alternativa sin totales: sumar reservas y mantenimientos de cada vehículo y quedarse con los peores
+        beneficio = {vehiculo_id: 0.0 for vehiculo_id in servicio.vehiculos}
+        for reserva in servicio.reservas.values():
+            if reserva.estado == "FINALIZADA":
+                beneficio[reserva.vehiculo.id] += reserva.total_final
+        for mantenimiento in servicio.mantenimientos.values():
+            beneficio[mantenimiento.vehiculo.id] -= mantenimiento.coste
+        return heapq.nsmallest(limite, beneficio.items(), key=lambda par: par[1])
+    sin_totales = _medir("cruce de todas las reservas y mantenimientos", cruzar_todo, repeticiones=3)
+
+    if [round(t.beneficio, 6) for t in con_totales] != [round(b, 6) for _, b in sin_totales]:
+        raise RuntimeError("Los totales no coinciden con el cruce completo")
+    _medir("rentabilidad de un vehículo", lambda: servicio.rentabilidad_vehiculo(con_totales[0].vehiculo.id))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehiculos", type=int, default=20_000)
+    parser.add_argument("--reservas", type=int, default=3)
+    parser.add_argument("--limite", type=int, default=20)
+    argumentos = parser.parse_args()
+    main_benchmark(argumentos.vehiculos, argumentos.reservas, argumentos.limite)
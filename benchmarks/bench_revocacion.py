@@ -0,0 +1,53 @@
+# Medimos lo que añade la comprobación de tokens revocados a cada petición autenticada, con muchos
+# tokens revocados a la vez, frente al resto de la validación del token (firma JWT) y a renovar la
+# sesión con la contraseña (bcrypt) en lugar de con un refresh token.
+#
+# Uso: python -m benchmarks.bench_revocacion [--revocados 100000]
+from __future__ import annotations
+import argparse
+import time
+from uuid import uuid4
+
+from services.RevocacionTokens import RevocacionTokens
+
+CONSULTAS = 200_000
+
+
+def medir(nombre: str, funcion, claves: list):
+    inicio = time.perf_counter()
+    for clave in claves:
+        funcion(clave)
+    duracion = time.perf_counter() - inicio
+    print(f"  {nombre:<46} {duracion / len(claves) * 1e9:9.0f} ns por consulta")
+
+
+def main_benchmark(revocados: int):
+    revocaciones = RevocacionTokens()
+    caduca = time.time() + 3600
+    lista = [uuid4().hex for _ in range(revocados)]
+    for jti in lista:
+        revocaciones.revocar(jti, caduca)
+    validos = [uuid4().hex for _ in range(CONSULTAS)]
+    revocados_consulta = (lista * (CONSULTAS // len(lista) + 1))[:CONSULTAS]
+
+    print(f"Comprobación de revocación ({revocados} tokens revocados):")
+    medir("token válido (vacío: sin revocaciones)", RevocacionTokens().esta_revocado, validos)
+    medir("token válido", revocaciones.esta_revocado, validos)
+    medir("token revocado", revocaciones.esta_revocado, revocados_consulta)
+    falsos = sum(1 for jti in validos if jti in revocaciones._filtro)
+    print(f"  Falsos positivos del filtro: {falsos / len(validos):.2%}")
+
+    # Contexto: el resto de la validación de cada petición y lo que cuesta renovar con contraseña
+    from jose import jwt
+    from passlib.context import CryptContext
+    token = jwt.encode({"sub": "bench@example.com", "exp": caduca, "jti": uuid4().hex}, "clave", algorithm="HS256")
+    medir("decodificar y verificar el JWT", lambda t: jwt.decode(t, "clave", algorithms=["HS256"]), [token] * 5000)
+    contexto = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    hash_password = contexto.hash("contraseña")
+    medir("verificar la contraseña con bcrypt (/token)", lambda p: contexto.verify(p, hash_password), ["contraseña"] * 5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--revocados", type=int, default=100_000)
+    main_benchmark(parser.parse_args().revocados)
@@ -0,0 +1,71 @@
+# Comparamos la serialización de listados grandes: el camino clásico (un modelo Pydantic por fila
+# que FastAPI valida y vuelve a serializar) frente a la codificación directa a JSON de main.py.
+#
+# Uso: python -m benchmarks.bench_serializacion [filas]
+from __future__ import annotations
+import sys
+import time
+
+from pydantic import TypeAdapter
+from starlette.responses import JSONResponse
+
+import main
+from services.AlquilerServicio import AlquilerServicio
+
+
+def _poblar(servicio: AlquilerServicio, filas: int):
+    # Creamos una flota con una reserva y un mantenimiento por vehículo
+    sucursal = servicio.agregar_sucursal("Central", "Calle Mayor 1", "900000000")
+    servicio.crear_tarifa("Básica", "Económico", 35.0)
+    cliente = servicio.registrar_usuario("cliente", "Cliente Benchmark", "bench@example.com", "x",
+                                         licencia="B-0000", direccion="Calle Prueba 1")
+    for i in range(filas):
+        vehiculo = servicio.registrar_vehiculo("coche", f"{i:07d}BCH", "Seat", "Ibiza", 2022,
+                                               "Económico", 1000 + i, sucursal)
+        servicio.realizar_reserva(cliente.id, vehiculo.id, "2025-03-01", "2025-03-05", sucursal.id)
+        servicio.registrar_mantenimiento(vehiculo.id, "Revisión anual", "2025-04-01", "2025-04-02", 80.0)
+
+
+def _medir(nombre: str, funcion, repeticiones: int = 3):
+    # Nos quedamos con el mejor tiempo de varias repeticiones
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    print(f"  {nombre:<10} {mejor * 1000:9.1f} ms")
+    return resultado, mejor
+
+
+def main_benchmark(filas: int = 100_000):
+    servicio = AlquilerServicio()
+    print(f"Generando {filas} vehículos, reservas y mantenimientos...")
+    _poblar(servicio, filas)
+
+    casos = [
+        ("vehiculos", servicio.vehiculos, main.VehiculoRead, main._vehiculo_to_read, main._vehiculo_to_dict),
+        ("reservas", servicio.reservas, main.ReservaRead, main._reserva_to_read, main._reserva_to_dict),
+        ("mantenimientos", servicio.mantenimientos, main.MantenimientoRead,
+         main._mantenimiento_to_read, main._mantenimiento_to_dict),
+    ]
+    for nombre, coleccion, modelo, to_read, to_dict in casos:
+        adaptador = TypeAdapter(list[modelo])
+        objetos = list(coleccion.values())
+
+        def camino_modelos():
+            # Lo que hace FastAPI con response_model: modelos, validación, volcado JSON y render
+            lectura = [to_read(o) for o in objetos]
+            return JSONResponse(adaptador.dump_python(adaptador.validate_python(lectura), mode="json")).body
+
+        def camino_directo():
+            return main._json_response([to_dict(o) for o in objetos]).body
+
+        print(f"/{nombre} ({len(objetos)} filas)")
+        esperado, t_modelos = _medir("modelos", camino_modelos)
+        obtenido, t_directo = _medir("directo", camino_directo)
+        print(f"  mismo JSON: {esperado == obtenido} | aceleración: x{t_modelos / t_directo:.1f}")
+
+
+if __name__ == "__main__":
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
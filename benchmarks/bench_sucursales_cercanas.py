@@ -0,0 +1,96 @@
+# Medimos la búsqueda de las sucursales más cercanas con vehículos disponibles
+# (GET /sucursales/cercanas) con el índice espacial por celdas (services/IndiceEspacial.py), frente a
+# calcular la distancia a todas las sucursales y ordenarlas en cada consulta. Las sucursales se
+# reparten al azar por la península; una parte no tiene vehículos de la categoría pedida, así que la
+# búsqueda tiene que saltárselas.
+#
+# Uso: python -m benchmarks.bench_sucursales_cercanas [--sucursales 5000] [--consultas 2000] [--limite 5]
+from __future__ import annotations
+import argparse
+import random
+import time
+
+from services.AlquilerServicio import AlquilerServicio
+from services.IndiceEspacial import distancia_km
+
+# Caja aproximada de la península ibérica
+LATITUD = (36.0, 43.8)
+LONGITUD = (-9.3, 3.3)
+
+
+def preparar(sucursales: int) -> AlquilerServicio:
+    aleatorio = random.Random(47)
+    servicio = AlquilerServicio()
+    servicio.crear_tarifa("Básica", "Económico", 40)
+    servicio.crear_tarifa("Premium", "Lujo", 120)
+    for i in range(sucursales):
+        sucursal = servicio.agregar_sucursal(f"Sucursal {i}", f"Calle {i}", "900000000",
+                                             latitud=aleatorio.uniform(*LATITUD),
+                                             longitud=aleatorio.uniform(*LONGITUD))
+        # Todas tienen un Económico; una de cada cuatro, además, un Lujo
+        servicio.registrar_vehiculo("coche", f"{i:07d}ECO", "Seat", "Ibiza", 2022, "Económico", 1000, sucursal)
+        if i % 4 == 0:
+            servicio.registrar_vehiculo("coche", f"{i:07d}LUX", "Audi", "A6", 2023, "Lujo", 1000, sucursal)
+    return servicio
+
+
+def lineal(servicio: AlquilerServicio, latitud: float, longitud: float, categoria, periodo, limite: int):
+    # Lo que haríamos sin índice: distancia a todas las sucursales con coordenadas, ordenar y filtrar
+    candidatas = sorted(
+        (distancia_km(latitud, longitud, s.latitud, s.longitud), s)
+        for s in servicio.sucursales.values() if s.latitud is not None
+    )
+    resultado = []
+    for distancia, sucursal in candidatas:
+        disponibles = servicio._contar_disponibles(sucursal, categoria, periodo)
+        if disponibles:
+            resultado.append({"sucursal": sucursal, "distancia_km": round(distancia, 3),
+                              "vehiculos_disponibles": disponibles})
+            if len(resultado) == limite:
+                break
+    return resultado
+
+
+def medir(funcion, puntos) -> float:
+    # Milisegundos por consulta
+    inicio = time.perf_counter()
+    for latitud, longitud in puntos:
+        funcion(latitud, longitud)
+    return (time.perf_counter() - inicio) * 1000 / len(puntos)
+
+
+def main_benchmark(sucursales: int, consultas: int, limite: int):
+    servicio = preparar(sucursales)
+    aleatorio = random.Random(7)
+    puntos = [(aleatorio.uniform(*LATITUD), aleatorio.uniform(*LONGITUD)) for _ in range(consultas)]
+    desde, hasta = "2026-07-01", "2026-07-05"
+    periodo = servicio._parsear_periodo(desde, hasta)
+
+    casos = [
+        ("cualquier categoría", None, None, None),
+        ("categoría Lujo", "Lujo", None, None),
+        ("categoría Lujo con fechas", "Lujo", (desde, hasta), periodo),
+    ]
+    print(f"{sucursales} sucursales, {consultas} consultas de las {limite} más cercanas")
+    for nombre, categoria, fechas, rango in casos:
+        fechas = fechas or (None, None)
+        # Comprobamos que las dos formas dan lo mismo antes de medir
+        for latitud, longitud in puntos[:50]:
+            con_indice = servicio.sucursales_cercanas(latitud, longitud, categoria, *fechas, limite=limite)
+            sin_indice = lineal(servicio, latitud, longitud, categoria, rango, limite)
+            if [c["sucursal"].id for c in con_indice] != [c["sucursal"].id for c in sin_indice]:
+                raise RuntimeError("El índice no devuelve las mismas sucursales que el recorrido completo")
+        ms_indice = medir(lambda la, lo: servicio.sucursales_cercanas(la, lo, categoria, *fechas, limite=limite),
+                          puntos)
+        ms_lineal = medir(lambda la, lo: lineal(servicio, la, lo, categoria, rango, limite), puntos)
+        print(f"  {nombre:<28} índice {ms_indice:8.3f} ms   recorrido completo {ms_lineal:8.3f} ms"
+              f"   (x{ms_lineal / ms_indice:.0f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sucursales", type=int, default=5000)
+    parser.add_argument("--consultas", type=int, default=2000)
+    parser.add_argument("--limite", type=int, default=5)
+    argumentos = parser.parse_args()
+    main_benchmark(argumentos.sucursales, argumentos.consultas, argumentos.limite)
@@ -1,17 +1,32 @@
 from __future__ import annotations
 
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import List, Optional
-from uuid import UUID
+from uuid import UUID, uuid4
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr, Field
 
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+# python-jose y passlib (bcrypt) se importan la primera vez que se usan,
+# no al arrancar: así el contenedor empieza a atender peticiones antes
 
 from services.AlquilerServicio import AlquilerServicio
+from services.AlquilerServicioAsync import AlquilerServicioAsync
+from services.CatalogoBinario import CatalogoBinario
+from services.Particionado import ServicioParticionado
+from services.LimitadorPeticiones import LimitadorPeticiones, Limite, AlmacenRedis
+from services.RevocacionTokens import RevocacionTokens
+from services.RegistroAuditoria import RegistroAuditoria
+from services.CalibracionBcrypt import RONDAS_MINIMAS, calibrar_rondas, cortar_password
+from services.Excepciones import ConflictoMantenimiento, VehiculoNoDisponible
 from models.Usuario import Usuario, Cliente, Administrador
 from models.Vehiculo import Vehiculo, Coche, Moto, Furgoneta
 from models.Reserva import Reserva
@@ -19,6 +34,8 @@ from models.Sucursal import Sucursal
 from models.Tarifa import Tarifa
 from models.Mantenimiento import Mantenimiento
 
+logger = logging.getLogger(__name__)
+
 # ---------------------- CONFIGURACIÓN JWT Y SEGURIDAD ---------------------- #
 
 # Clave secreta para firmar los tokens JWT (cambiar en producción)
@@ -27,77 +44,300 @@ SECRET_KEY = "clave_secreta_alquiler_coches_2025"
 ALGORITHM = "HS256"
 # Tiempo de expiración del token de acceso en minutos
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-# Configuración de hashing con bcrypt para las contraseñas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Tiempo de expiración del refresh token en días (permite renovar la sesión sin volver a enviar la contraseña)
+REFRESH_TOKEN_EXPIRE_DAYS = 7
+
+# Tiempo objetivo de cada hash bcrypt en milisegundos: al arrancar elegimos el mayor coste que no lo supera
+BCRYPT_OBJETIVO_MS = float(os.environ.get("BCRYPT_OBJETIVO_MS", "250"))
+# Coste bcrypt fijo (opcional). Si se indica, no se calibra (ni se aplica el mínimo de la calibración)
+BCRYPT_RONDAS = os.environ.get("BCRYPT_RONDAS")
+
+# Codificador JSON para las respuestas de listados. Usa las mismas opciones que JSONResponse
+# de Starlette, así que los bytes son idénticos a los que generaría FastAPI con el response_model.
+_codificador_json = json.JSONEncoder(ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"))
+
+# Segundos sin eventos tras los que enviamos un comentario para mantener viva la conexión SSE
+EVENTOS_KEEPALIVE_SEGUNDOS = 15
+
+# Cada cuántos segundos comprobamos si empieza algún mantenimiento programado
+MANTENIMIENTOS_INTERVALO_SEGUNDOS = 60
+
+# Fichero opcional con el estado del servicio ya construido (ver AlquilerServicio.guardar_estado)
+ESTADO_INICIAL = os.environ.get("ALQUILER_ESTADO")
+
+# Catálogo binario opcional (ver AlquilerServicio.exportar_catalogo). Si se indica, esta instancia es una
+# réplica de consulta: los listados y búsquedas de vehículos, tarifas y sucursales se leen de ese fichero
+# y el resto de endpoints no se atienden (ver rechazar_en_replica)
+CATALOGO = os.environ.get("ALQUILER_CATALOGO")
+# Rutas que una réplica de consulta responde desde el catálogo (solo con GET)
+RUTAS_CATALOGO = {
+    "/sucursales", "/sucursales/{sucursal_id}",
+    "/vehiculos", "/vehiculos/disponibles", "/vehiculos/matricula/{matricula}", "/vehiculos/{vehiculo_id}",
+    "/tarifas",
+}
+
+# Directorio opcional del registro de auditoría con todos los cambios de estado (ver
+# services/RegistroAuditoria.py). Sin él no hay registro. Las réplicas de consulta (con catálogo)
+# no cambian nada y no lo abren
+AUDITORIA = os.environ.get("ALQUILER_AUDITORIA")
+
+# Número opcional de procesos entre los que se reparte el estado por sucursales (ver
+# services/Particionado.py). Con él, los vehículos y las reservas se atienden a través del enrutador
+# y los endpoints que aún no pasan por él no se atienden (ver rechazar_sin_particion). ALQUILER_ESTADO
+# puede ser un estado completo o un directorio guardado por el enrutador, que se guarda de nuevo al parar
+PARTICIONES = int(os.environ.get("ALQUILER_PARTICIONES") or 0)
+# Rutas que se atienden con particiones, con su método: las de vehículos y reservas van al enrutador;
+# las de usuarios y tarifas se leen de los datos comunes
+RUTAS_PARTICIONADO = {
+    ("POST", "/register"), ("POST", "/token"), ("POST", "/token/refresh"), ("POST", "/logout"),
+    ("POST", "/usuarios"), ("GET", "/usuarios"), ("GET", "/usuarios/{usuario_id}"), ("GET", "/me"),
+    ("POST", "/sucursales"), ("GET", "/sucursales/{sucursal_id}/reservas"),
+    ("POST", "/vehiculos"), ("GET", "/vehiculos/disponibles"), ("GET", "/vehiculos/rentabilidad"),
+    ("GET", "/vehiculos/{vehiculo_id}/rentabilidad"), ("POST", "/vehiculos/{vehiculo_id}/transferir"),
+    ("POST", "/tarifas"), ("GET", "/tarifas"), ("GET", "/tarifas/cotizacion"),
+    ("POST", "/reservas"), ("GET", "/reservas/{reserva_id}"), ("GET", "/usuarios/{cliente_id}/reservas"),
+    ("POST", "/reservas/{reserva_id}/finalizar"), ("POST", "/reservas/{reserva_id}/cancelar"),
+}
+if PARTICIONES and (CATALOGO or AUDITORIA):
+    # Las réplicas de consulta no modifican nada y el registro de auditoría solo vería los datos comunes
+    raise RuntimeError("ALQUILER_PARTICIONES no se puede combinar con ALQUILER_CATALOGO ni con ALQUILER_AUDITORIA.")
+
+# Límites de peticiones de los endpoints que calculan hashes bcrypt (los más caros de la API).
+# Para cada ruta: límite por cliente y límite total de la ruta, como (ráfaga, peticiones por minuto)
+LIMITES_PETICIONES = {
+    "/token": (Limite(10, 10), Limite(200, 600)),
+    "/register": (Limite(5, 5), Limite(100, 300)),
+    "/usuarios": (Limite(5, 5), Limite(100, 300)),
+}
+
+# Redis opcional para que los límites se compartan entre todos los workers (si no, cada worker cuenta los suyos)
+LIMITADOR_REDIS = os.environ.get("ALQUILER_REDIS_URL")
 
 # Esquema OAuth2 para autenticación basada en tokens
 # tokenUrl indica el endpoint donde el cliente obtiene el token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+async def rechazar_en_replica(request: Request) -> None:
+    # Dependencia de todos los endpoints: una réplica de consulta solo tiene el catálogo, así que
+    # rechaza las modificaciones (405) y las consultas que no salen de él (503) en lugar de
+    # responder con su servicio en memoria, que está vacío o desactualizado
+    if catalogo is None:
+        return
+    ruta = request.scope["route"].path
+    if request.method not in ("GET", "HEAD"):
+        raise HTTPException(
+            status_code=status.HTTP_405_METHOD_NOT_ALLOWED,
+            detail="Réplica de consulta: las modificaciones se hacen en la instancia principal.",
+            headers={"Allow": "GET, HEAD" if ruta in RUTAS_CATALOGO else ""},
+        )
+    if ruta not in RUTAS_CATALOGO:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Réplica de consulta: este endpoint solo está disponible en la instancia principal.",
+        )
+
+async def rechazar_sin_particion(request: Request) -> None:
+    # Dependencia de todos los endpoints: con particiones, los que no están en RUTAS_PARTICIONADO
+    # responderían desde los datos comunes, que no tienen vehículos ni reservas
+    if PARTICIONES and (request.method, request.scope["route"].path) not in RUTAS_PARTICIONADO:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Este endpoint no está disponible con el estado repartido en particiones.",
+        )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global particionado
+    # Los procesos de las particiones se lanzan aquí y no al importar el módulo: así no se vuelven a
+    # lanzar cuando cada proceso nuevo importa main.py. La fachada pasa a usar sus datos comunes
+    if PARTICIONES:
+        ruta = ESTADO_INICIAL if ESTADO_INICIAL and os.path.exists(ESTADO_INICIAL) else None
+        particionado = await asyncio.to_thread(ServicioParticionado, PARTICIONES, ruta)
+        alquiler_async.servicio = particionado.comun
+    # Mientras la API está en marcha, una tarea en segundo plano inicia los mantenimientos programados
+    # (las réplicas de consulta no modifican nada y con particiones los mantenimientos no se atienden)
+    tarea = (asyncio.create_task(_iniciar_mantenimientos_periodicamente())
+             if catalogo is None and not PARTICIONES else None)
+    # Calibramos el coste de bcrypt antes de aceptar peticiones: así ningún hash se calcula con un
+    # coste provisional y el primer login no paga la calibración
+    await asyncio.to_thread(get_pwd_context)
+    yield
+    if tarea is not None:
+        tarea.cancel()
+    alquiler_async.cerrar()
+    # Lo que quede en la cola de auditoría se escribe antes de parar
+    if registro_auditoria is not None:
+        await asyncio.to_thread(registro_auditoria.vaciar)
+    # El estado repartido se guarda en su directorio (nunca encima de un estado completo)
+    if particionado is not None:
+        if ESTADO_INICIAL and not os.path.isfile(ESTADO_INICIAL):
+            await asyncio.to_thread(particionado.guardar_estado, ESTADO_INICIAL)
+        await asyncio.to_thread(particionado.cerrar)
+
 # Creamos la instancia de FastAPI
-app = FastAPI(title="Sistema de Alquiler de Coches API")
+app = FastAPI(title="Sistema de Alquiler de Coches API", lifespan=lifespan,
+              dependencies=[Depends(rechazar_en_replica), Depends(rechazar_sin_particion)])
 
-# Creamos la instancia del servicio de alquiler
-alquiler_service = AlquilerServicio()
+# Creamos la instancia del servicio de alquiler (partiendo del estado guardado si lo hay). Con
+# particiones, el estado lo carga el enrutador al arrancar (ver lifespan)
+particionado: Optional[ServicioParticionado] = None
+if PARTICIONES:
+    alquiler_service = AlquilerServicio()
+elif ESTADO_INICIAL and os.path.exists(ESTADO_INICIAL):
+    alquiler_service = AlquilerServicio.cargar_estado(ESTADO_INICIAL)
+else:
+    alquiler_service = AlquilerServicio()
 
-# ---------------------- FUNCIONES AUXILIARES DE SEGURIDAD ---------------------- #
+catalogo = CatalogoBinario(CATALOGO) if CATALOGO else None
 
-def hash_password(password: str) -> str:
-    password_cortada = password[:72]
-    print("DEBUG password:", password, "len:", len(password))
-    print("DEBUG cortada:", password_cortada, "len:", len(password_cortada))
-    return pwd_context.hash(password_cortada)
+# Cada evento del servicio queda en el registro de auditoría (se escribe fuera del camino de la petición)
+registro_auditoria = RegistroAuditoria(AUDITORIA) if AUDITORIA and catalogo is None else None
+if registro_auditoria is not None:
+    alquiler_service.suscribir(registro_auditoria.registrar)
 
+# Tokens revocados (cierre de sesión y refresh tokens ya usados) hasta que caducan
+revocaciones = RevocacionTokens()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    # Aplicamos el mismo corte antes de verificar
-    plain_cortada = plain_password[:72]
-    return pwd_context.verify(plain_cortada, hashed_password)
+limitador = LimitadorPeticiones(AlmacenRedis.desde_url(LIMITADOR_REDIS) if LIMITADOR_REDIS else None)
+for _ruta, (_por_cliente, _total) in LIMITES_PETICIONES.items():
+    limitador.configurar(_ruta, _por_cliente, _total)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    # Verifica que una contraseña en texto plano coincida con su hash
-    return pwd_context.verify(plain_password, hashed_password)
+# ---------------------- FUNCIONES AUXILIARES DE SEGURIDAD ---------------------- #
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    # Configuración de hashing con bcrypt para las contraseñas (se crea al primer uso).
+    # El coste se calibra según BCRYPT_OBJETIVO_MS (nunca por debajo de RONDAS_MINIMAS) y es el
+    # mínimo de todos los hashes: los de un coste menor se marcan como desactualizados y se rehacen
+    # en el siguiente login. Los de un coste mayor se dejan como están (nunca bajamos el coste de un hash)
+    from passlib.context import CryptContext
+    rondas = int(BCRYPT_RONDAS) if BCRYPT_RONDAS else calibrar_rondas(BCRYPT_OBJETIVO_MS)
+    if rondas < RONDAS_MINIMAS:
+        logger.warning("Coste bcrypt fijado en %d rondas, por debajo del mínimo recomendado (%d)",
+                       rondas, RONDAS_MINIMAS)
+    logger.info("Coste bcrypt: %d rondas", rondas)
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=rondas,
+                        bcrypt__min_rounds=rondas)
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+def hash_password(password: str) -> str:
+    # bcrypt solo usa los primeros 72 bytes: cortamos antes de hashear
+    return get_pwd_context().hash(cortar_password(password))
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    # Verifica que una contraseña en texto plano coincida con su hash (aplicando el mismo corte)
+    return get_pwd_context().verify(cortar_password(plain_password), hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    # Verifica la contraseña y, si el hash usa un coste distinto del actual, devuelve el hash nuevo
+    return get_pwd_context().verify_and_update(cortar_password(plain_password), hashed_password)
+
+# Fachada asíncrona del servicio que usan todos los endpoints (todos son 'async def'): las operaciones
+# se ejecutan en el bucle de eventos y los hashes bcrypt en su propio pool de hilos. Con registro de
+# auditoría, cada modificación espera antes de hacerse (en un hilo) a que su escritor tenga sitio en
+# la cola: así el ritmo de escritura frena a las modificaciones sin bloquear el bucle, y si el
+# registro está detenido la modificación se rechaza sin tocar el servicio
+alquiler_async = AlquilerServicioAsync(
+    alquiler_service, hash_password, verify_and_update_password,
+    admitir=registro_auditoria.esperar_escritor if registro_auditoria is not None else None,
+)
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None, token_type: str = "access"):
     # Crea un token JWT con los datos del usuario y tiempo de expiración
+    from jose import jwt
     to_encode = data.copy()
     # Calculamos la fecha de expiración
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    # Añadimos la fecha de expiración al payload
-    to_encode.update({"exp": expire})
+    # Añadimos la fecha de expiración, el tipo de token y un identificador único (jti) para poder revocarlo
+    to_encode.update({"exp": expire, "type": token_type, "jti": uuid4().hex})
     # Codificamos y firmamos el token JWT
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> Usuario:
-    # Obtiene el usuario actual decodificando y validando el token JWT
+def create_refresh_token(data: dict):
+    # Crea un refresh token: solo sirve para pedir tokens nuevos en /token/refresh
+    return create_access_token(data, timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), token_type="refresh")
+
+def _emitir_tokens(usuario: Usuario) -> dict:
+    # Función auxiliar: par de tokens (acceso y refresh) para un usuario
+    return {
+        "access_token": create_access_token(
+            data={"sub": usuario.email}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        ),
+        "refresh_token": create_refresh_token(data={"sub": usuario.email}),
+        "token_type": "bearer",
+    }
+
+def decode_token(token: str, token_type: str = "access") -> dict:
+    # Decodifica y valida un token JWT del tipo indicado que no haya sido revocado
+    from jose import JWTError, jwt
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
     try:
         # Decodificamos el token JWT usando la clave secreta
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        # Extraemos el email del payload (almacenado en el campo "sub")
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
         # Si hay error al decodificar, lanzamos excepción
         raise credentials_exception
-    
+
+    # Los tokens emitidos antes de existir los refresh tokens no llevan tipo: son de acceso
+    if payload.get("sub") is None or payload.get("type", "access") != token_type:
+        raise credentials_exception
+    jti = payload.get("jti")
+    if jti is not None and revocaciones.esta_revocado(jti):
+        raise credentials_exception
+    return payload
+
+def _revocar_payload(payload: dict):
+    # Función auxiliar: revoca un token ya decodificado hasta su caducidad
+    if payload.get("jti") is not None:
+        revocaciones.revocar(payload["jti"], float(payload["exp"]))
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Usuario:
+    # Obtiene el usuario actual decodificando y validando el token JWT
+    # Extraemos el email del payload (almacenado en el campo "sub")
+    email: str = decode_token(token)["sub"]
+
     # Buscamos el usuario por email en la base de datos
-    usuario = alquiler_service.obtener_usuario_por_email(email)
+    usuario = await alquiler_async.obtener_usuario_por_email(email)
     if usuario is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="No se pudieron validar las credenciales",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return usuario
 
+def _cliente_peticion(request: Request) -> str:
+    # Identificamos al cliente por el usuario de su token si trae uno válido y, si no, por su IP
+    autorizacion = request.headers.get("authorization", "")
+    if autorizacion[:7].lower() == "bearer ":
+        from jose import JWTError, jwt
+        try:
+            email = jwt.decode(autorizacion[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        except JWTError:
+            email = None
+        if email:
+            return f"usuario:{email}"
+    return f"ip:{request.client.host if request.client else 'desconocida'}"
+
+async def limitar_peticiones(request: Request) -> None:
+    # Dependencia que rechaza con 429 las peticiones que superan el límite de la ruta (ver LIMITES_PETICIONES).
+    # Es asíncrona para no pasar por el pool de hilos: la comprobación solo cuesta unos microsegundos
+    espera = limitador.comprobar(request.url.path, _cliente_peticion(request))
+    if espera:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiadas peticiones. Inténtalo de nuevo más tarde.",
+            headers={"Retry-After": limitador.reintentar_en(espera)},
+        )
+
 # ---------------------- SCHEMAS ---------------------- #
 
 # ------ AUTENTICACIÓN ------ #
@@ -105,6 +345,15 @@ class Token(BaseModel):
     # Esquema para la respuesta del token de autenticación
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    # Esquema para renovar la sesión (o cerrarla también en el resto de dispositivos con ese refresh token)
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    # Esquema opcional para cerrar sesión revocando también el refresh token
+    refresh_token: Optional[str] = None
 
 class UsuarioRegister(BaseModel):
     # Esquema para registrar un nuevo usuario con contraseña
@@ -162,11 +411,16 @@ class VehiculoRead(BaseModel):
     cilindrada: Optional[int] = None
     capacidad_carga: Optional[float] = None
 
+class VehiculoTransferir(BaseModel):
+    sucursal_id: UUID
+
 # ------ SUCURSALES ------ #
 class SucursalCreate(BaseModel):
     nombre: str
     direccion: str
     telefono: str
+    latitud: Optional[float] = Field(None, ge=-90, le=90)
+    longitud: Optional[float] = Field(None, ge=-180, le=180)
 
 class SucursalRead(BaseModel):
     id: UUID
@@ -175,6 +429,19 @@ class SucursalRead(BaseModel):
     telefono: str
     num_vehiculos: int
     num_reservas: int
+    latitud: Optional[float] = None
+    longitud: Optional[float] = None
+
+class SucursalUbicacion(BaseModel):
+    # Coordenadas de una sucursal (las dos a None para quitarlas)
+    latitud: Optional[float] = Field(None, ge=-90, le=90)
+    longitud: Optional[float] = Field(None, ge=-180, le=180)
+
+class SucursalCercanaRead(BaseModel):
+    # Sucursal con vehículos disponibles cerca de un punto
+    sucursal: SucursalRead
+    distancia_km: float
+    vehiculos_disponibles: int
 
 # ------ TARIFAS ------ #
 class TarifaCreate(BaseModel):
@@ -196,6 +463,31 @@ class TarifaRead(BaseModel):
     recargo_retraso: float
     penalizacion_comb: float
 
+class CotizacionDia(BaseModel):
+    fecha: str
+    multiplicador: float
+    precio: float
+
+class CotizacionRead(BaseModel):
+    # Presupuesto con precios dinámicos: precio de cada día según la ocupación y la temporada
+    sucursal_id: UUID
+    categoria: str
+    dias: int
+    precio_diario: float
+    total: float
+    detalle: List[CotizacionDia]
+
+class TemporadaCreate(BaseModel):
+    nombre: str
+    inicio: str  # "MM-DD"
+    fin: str     # "MM-DD"
+    multiplicador: float
+    sucursal_id: Optional[UUID] = None
+    categoria: Optional[str] = None
+
+class TemporadaRead(TemporadaCreate):
+    id: UUID
+
 # ------ RESERVAS ------ #
 class ReservaCreate(BaseModel):
     cliente_id: UUID
@@ -223,6 +515,36 @@ class ReservaFinalizarRequest(BaseModel):
     combustible_correcto: bool = True
     metodo_pago: str = "Tarjeta"
 
+class ReservaDevolucion(ReservaFinalizarRequest):
+    # Una devolución dentro de una finalización por lotes
+    reserva_id: UUID
+
+class ReservaFinalizarLoteRequest(BaseModel):
+    devoluciones: List[ReservaDevolucion] = Field(min_length=1)
+
+class EsperaCreate(BaseModel):
+    # Apuntarse a la lista de espera de una categoría en una sucursal (devolución en la misma si no se indica)
+    cliente_id: UUID
+    sucursal_id: UUID
+    categoria: str
+    fecha_inicio: str
+    fecha_fin: str
+    sucursal_devolucion_id: Optional[UUID] = None
+
+class EsperaRead(BaseModel):
+    # Estado de una solicitud de espera: PENDIENTE (con su posición en la cola), ASIGNADA (con la reserva creada),
+    # CANCELADA o CADUCADA
+    id: UUID
+    cliente_id: UUID
+    sucursal_id: UUID
+    categoria: str
+    fecha_inicio: str
+    fecha_fin: str
+    sucursal_devolucion_id: UUID
+    estado: str
+    posicion: Optional[int] = None
+    reserva: Optional[ReservaRead] = None
+
 # ------ MANTENIMIENTOS ------ #
 class MantenimientoCreate(BaseModel):
     vehiculo_id: UUID
@@ -240,25 +562,68 @@ class MantenimientoRead(BaseModel):
     fecha_fin: str
     coste: float
     tipo: str
+    estado: str
+
+class MantenimientoPlanRead(BaseModel):
+    # Mantenimiento preventivo propuesto por el planificador (las fechas se pueden enviar tal cual a POST /mantenimientos)
+    vehiculo_id: UUID
+    vehiculo_matricula: str
+    tipo: str
+    vencimiento: str
+    km_desde_revision: float
+    fecha_inicio: Optional[str] = None
+    fecha_fin: Optional[str] = None
+
+class AlternativaRead(BaseModel):
+    # Vehículo que puede sustituir al pedido: MISMA_SUCURSAL, OTRA_SUCURSAL o CATEGORIA_SUPERIOR
+    vehiculo: VehiculoRead
+    motivo: str
+    precio_estimado: Optional[float] = None
+
+class RentabilidadRead(BaseModel):
+    # Totales de un vehículo desde su alta: ingresos de reservas finalizadas, coste de sus
+    # mantenimientos, beneficio (la diferencia) y uso (utilizacion = días alquilado / días en flota)
+    vehiculo: VehiculoRead
+    ingresos: float
+    coste_mantenimiento: float
+    beneficio: float
+    alquileres: int
+    dias_alquilado: int
+    km_recorridos: float
+    mantenimientos: int
+    dias_en_flota: int
+    utilizacion: float
+
+# ------ AUDITORÍA ------ #
+class AuditoriaRead(BaseModel):
+    # Registro de auditoría: número consecutivo, fecha, tipo de evento y sus datos
+    n: int
+    fecha: str
+    tipo: str
+    datos: dict
 
 # ---------------------- ENDPOINTS DE AUTENTICACIÓN ---------------------- #
 
-@app.post("/register", response_model=UsuarioRead, status_code=201)
-def registrar_usuario(datos: UsuarioRegister) -> UsuarioRead:
+@app.post("/register", response_model=UsuarioRead, status_code=201, dependencies=[Depends(limitar_peticiones)])
+async def registrar_usuario(datos: UsuarioRegister) -> UsuarioRead:
     # Endpoint para registrar un nuevo usuario con contraseña hasheada
     try:
-        # Hasheamos la contraseña antes de guardarla
-        password_hash = hash_password(datos.password)
+        # Hasheamos la contraseña antes de guardarla (en el pool de bcrypt, sin parar el bucle)
+        password_hash = await alquiler_async.hash_password(datos.password)
         
-        # Registramos el usuario usando el servicio
-        usuario = alquiler_service.registrar_usuario(
-            tipo=datos.tipo,
-            nombre=datos.nombre,
-            email=datos.email,
-            password=password_hash,
-            licencia=datos.licencia,
-            direccion=datos.direccion
-        )
+        # Registramos el usuario usando el servicio (con particiones, el enrutador lo copia a todas)
+        if particionado is not None:
+            usuario = await asyncio.to_thread(particionado.registrar_usuario, datos.tipo, datos.nombre,
+                                              datos.email, password_hash, datos.licencia, datos.direccion)
+        else:
+            usuario = await alquiler_async.registrar_usuario(
+                tipo=datos.tipo,
+                nombre=datos.nombre,
+                email=datos.email,
+                password=password_hash,
+                licencia=datos.licencia,
+                direccion=datos.direccion
+            )
         
         # Devolvemos el usuario creado en formato UsuarioRead
         return UsuarioRead(
@@ -271,49 +636,75 @@ def registrar_usuario(datos: UsuarioRegister) -> UsuarioRead:
         # Si hay un error de validación, devolvemos un error 400
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/token", response_model=Token)
+@app.post("/token", response_model=Token, dependencies=[Depends(limitar_peticiones)])
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     # Endpoint de autenticación que devuelve un token JWT
     # El cliente envía username (email) y password para obtener el token
     
-    # Buscamos el usuario por email (el campo username del form contiene el email)
-    usuario = alquiler_service.obtener_usuario_por_email(form_data.username)
-    
-    # Verificamos que el usuario existe y la contraseña es correcta
-    if not usuario or not verify_password(form_data.password, usuario.password):
+    # Verificamos que el usuario (el campo username del form contiene el email) existe y la contraseña
+    # es correcta. Si el hash guardado usa un coste antiguo, se sustituye por uno con el coste actual
+    usuario = await alquiler_async.autenticar(form_data.username, form_data.password)
+    if usuario is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email o contraseña incorrectos",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Creamos el token JWT con el email del usuario
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": usuario.email}, expires_delta=access_token_expires
-    )
-    
-    # Devolvemos el token de acceso
-    return {"access_token": access_token, "token_type": "bearer"}
+    # Creamos el token de acceso y el refresh token con el email del usuario
+    return _emitir_tokens(usuario)
+
+@app.post("/token/refresh", response_model=Token)
+async def refrescar_token(datos: RefreshRequest):
+    # Endpoint para renovar la sesión con un refresh token, sin volver a comprobar la contraseña (sin bcrypt).
+    # El refresh token usado se revoca y se entrega uno nuevo (rotación): cada uno vale una sola vez
+    payload = decode_token(datos.refresh_token, token_type="refresh")
+    usuario = await alquiler_async.obtener_usuario_por_email(payload["sub"])
+    if usuario is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="No se pudieron validar las credenciales",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    _revocar_payload(payload)
+    return _emitir_tokens(usuario)
+
+@app.post("/logout", status_code=204)
+async def cerrar_sesion(
+    datos: Optional[LogoutRequest] = None,
+    token: str = Depends(oauth2_scheme),
+) -> None:
+    # Endpoint PROTEGIDO para cerrar sesión: revoca el token de acceso y, si se envía, el refresh token
+    payload = decode_token(token)
+    if datos is not None and datos.refresh_token:
+        refresh = decode_token(datos.refresh_token, token_type="refresh")
+        if refresh["sub"] != payload["sub"]:
+            raise HTTPException(status_code=400, detail="El refresh token no pertenece a este usuario.")
+        _revocar_payload(refresh)
+    _revocar_payload(payload)
 
 # ---------------------- ENDPOINTS DE USUARIOS ---------------------- #
 
-@app.post("/usuarios", response_model=UsuarioRead, status_code=201)
-def crear_usuario(datos: UsuarioCreate) -> UsuarioRead:
+@app.post("/usuarios", response_model=UsuarioRead, status_code=201, dependencies=[Depends(limitar_peticiones)])
+async def crear_usuario(datos: UsuarioCreate) -> UsuarioRead:
     # Endpoint legacy para crear usuario sin contraseña (deprecado)
     try:
         # Usamos una contraseña por defecto para mantener compatibilidad
-        password_hash = hash_password("default123")
+        password_hash = await alquiler_async.hash_password("default123")
         
-        # Registramos el usuario usando el servicio
-        usuario = alquiler_service.registrar_usuario(
-            tipo=datos.tipo,
-            nombre=datos.nombre,
-            email=datos.email,
-            password=password_hash,
-            licencia=datos.licencia,
-            direccion=datos.direccion
-        )
+        # Registramos el usuario usando el servicio (con particiones, el enrutador lo copia a todas)
+        if particionado is not None:
+            usuario = await asyncio.to_thread(particionado.registrar_usuario, datos.tipo, datos.nombre,
+                                              datos.email, password_hash, datos.licencia, datos.direccion)
+        else:
+            usuario = await alquiler_async.registrar_usuario(
+                tipo=datos.tipo,
+                nombre=datos.nombre,
+                email=datos.email,
+                password=password_hash,
+                licencia=datos.licencia,
+                direccion=datos.direccion
+            )
         
         # Devolvemos el usuario creado en formato UsuarioRead
         return UsuarioRead(
@@ -335,7 +726,7 @@ async def obtener_usuario(
     # Requiere autenticación: el usuario debe enviar un token válido
     try:
         # Obtenemos el usuario del servicio
-        usuario = alquiler_service.obtener_usuario(usuario_id)
+        usuario = await alquiler_async.obtener_usuario(usuario_id)
         
         # Devolvemos el usuario en formato UsuarioRead
         return UsuarioRead(
@@ -349,21 +740,10 @@ async def obtener_usuario(
         raise HTTPException(status_code=404, detail=str(e))
 
 @app.get("/usuarios", response_model=List[UsuarioRead])
-def listar_usuarios() -> List[UsuarioRead]:
+async def listar_usuarios() -> Response:
     # Endpoint para listar todos los usuarios
-    # Obtenemos todos los usuarios del servicio
-    usuarios = alquiler_service.listar_usuarios()
-    
-    # Convertimos cada usuario al formato UsuarioRead
-    return [
-        UsuarioRead(
-            id=u.id,
-            nombre=u.nombre,
-            email=u.email,
-            es_admin=u.is_admin()
-        )
-        for u in usuarios
-    ]
+    usuarios = await alquiler_async.listar_usuarios()
+    return await _listado_en_hilo(usuarios, _usuario_to_dict)
 
 @app.get("/me", response_model=UsuarioRead)
 async def obtener_usuario_actual(current_user: Usuario = Depends(get_current_user)):
@@ -378,54 +758,78 @@ async def obtener_usuario_actual(current_user: Usuario = Depends(get_current_use
 
 # ------ SUCURSALES ------ #
 @app.post("/sucursales", response_model=SucursalRead)
-def crear_sucursal(datos: SucursalCreate) -> SucursalRead:
+async def crear_sucursal(datos: SucursalCreate) -> SucursalRead:
     try:
-        sucursal = alquiler_service.agregar_sucursal(
-            nombre=datos.nombre,
-            direccion=datos.direccion,
-            telefono=datos.telefono,
-        )
+        if particionado is not None:
+            sucursal = await asyncio.to_thread(particionado.agregar_sucursal, datos.nombre, datos.direccion,
+                                               datos.telefono, datos.latitud, datos.longitud)
+        else:
+            sucursal = await alquiler_async.agregar_sucursal(
+                nombre=datos.nombre,
+                direccion=datos.direccion,
+                telefono=datos.telefono,
+                latitud=datos.latitud,
+                longitud=datos.longitud,
+            )
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
 
-    return SucursalRead(
-        id=sucursal.id,
-        nombre=sucursal.nombre,
-        direccion=sucursal.direccion,
-        telefono=sucursal.telefono,
-        num_vehiculos=len(sucursal.vehiculos),
-        num_reservas=len(sucursal.reservas),
-    )
+    return SucursalRead(**_sucursal_to_dict(sucursal))
 
 @app.get("/sucursales", response_model=list[SucursalRead])
-def listar_sucursales() -> list[SucursalRead]:
-    sucursales = alquiler_service.sucursales.values()
-    return [
-        SucursalRead(
-            id=s.id,
-            nombre=s.nombre,
-            direccion=s.direccion,
-            telefono=s.telefono,
-            num_vehiculos=len(s.vehiculos),
-            num_reservas=len(s.reservas),
-        )
-        for s in sucursales
-    ]
+async def listar_sucursales() -> Response:
+    if catalogo is not None:
+        return _json_response(catalogo.sucursales())
+    return await _listado_en_hilo(await alquiler_async.listar_sucursales(), _sucursal_to_dict)
+
+@app.get("/sucursales/cercanas", response_model=list[SucursalCercanaRead])
+async def buscar_sucursales_cercanas(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    categoria: Optional[str] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    limite: int = Query(5, ge=1, le=100),
+) -> Response:
+    # Sucursales más cercanas al punto con vehículos disponibles (de la categoría y libres en las fechas, si se indican)
+    try:
+        cercanas = await alquiler_async.sucursales_cercanas(lat, lon, categoria, desde, hasta, limite)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    return _json_response([
+        {
+            "sucursal": _sucursal_to_dict(c["sucursal"]),
+            "distancia_km": c["distancia_km"],
+            "vehiculos_disponibles": c["vehiculos_disponibles"],
+        }
+        for c in cercanas
+    ])
 
 @app.get("/sucursales/{sucursal_id}", response_model=SucursalRead)
-def obtener_sucursal(sucursal_id: UUID) -> SucursalRead:
-    sucursal = alquiler_service.sucursales.get(sucursal_id)
-    if not sucursal:
+async def obtener_sucursal(sucursal_id: UUID) -> SucursalRead:
+    if catalogo is not None:
+        fila = catalogo.sucursal(sucursal_id)
+        if fila is None:
+            raise HTTPException(status_code=404, detail="Sucursal no encontrada.")
+        return _json_response(fila)
+    try:
+        sucursal = await alquiler_async.obtener_sucursal(sucursal_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+
+    return SucursalRead(**_sucursal_to_dict(sucursal))
+
+@app.put("/sucursales/{sucursal_id}/ubicacion", response_model=SucursalRead)
+async def ubicar_sucursal(sucursal_id: UUID, datos: SucursalUbicacion) -> SucursalRead:
+    if not await alquiler_async.existe_sucursal(sucursal_id):
         raise HTTPException(status_code=404, detail="Sucursal no encontrada.")
+    try:
+        sucursal = await alquiler_async.ubicar_sucursal(sucursal_id, datos.latitud, datos.longitud)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
-    return SucursalRead(
-        id=sucursal.id,
-        nombre=sucursal.nombre,
-        direccion=sucursal.direccion,
-        telefono=sucursal.telefono,
-        num_vehiculos=len(sucursal.vehiculos),
-        num_reservas=len(sucursal.reservas),
-    )
+    return SucursalRead(**_sucursal_to_dict(sucursal))
 
 # ------ VEHÍCULOS ------ #
 @app.post("/vehiculos", response_model=VehiculoRead)
@@ -435,84 +839,211 @@ async def crear_vehiculo(
 ) -> VehiculoRead:
     # Endpoint PROTEGIDO para crear un nuevo vehículo
     # Requiere autenticación: solo usuarios autenticados pueden crear vehículos
+    if particionado is not None:
+        try:
+            argumentos = await _vehiculo_create_to_kwargs(datos)
+            argumentos["sucursal_id"] = argumentos.pop("sucursal").id
+            vehiculo = await asyncio.to_thread(lambda: particionado.registrar_vehiculo(**argumentos))
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        return _json_response(_vehiculo_resumen_to_dict(vehiculo))
     try:
-        sucursal = alquiler_service.sucursales.get(datos.sucursal_id)
-        if not sucursal:
-            raise ValueError("Sucursal no encontrada.")
-
-        extras = {}
-        if datos.puertas is not None:
-            extras["puertas"] = datos.puertas
-        if datos.tipo_motor is not None:
-            extras["motor"] = datos.tipo_motor
-        if datos.cilindrada is not None:
-            extras["cilindrada"] = datos.cilindrada
-        if datos.capacidad_carga is not None:
-            extras["carga"] = datos.capacidad_carga
-
-        vehiculo = alquiler_service.registrar_vehiculo(
-            tipo=datos.tipo,
-            matricula=datos.matricula,
-            marca=datos.marca,
-            modelo=datos.modelo,
-            año=datos.año,
-            categoria=datos.categoria,
-            km=datos.km,
-            sucursal=sucursal,
-            **extras
-        )
+        vehiculo = await alquiler_async.registrar_vehiculo(**await _vehiculo_create_to_kwargs(datos))
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
 
     return _vehiculo_to_read(vehiculo)
 
-@app.get("/vehiculos", response_model=list[VehiculoRead])
-def listar_vehiculos() -> list[VehiculoRead]:
-    vehiculos = alquiler_service.vehiculos.values()
+@app.post("/vehiculos/importar", response_model=list[VehiculoRead])
+async def importar_vehiculos(
+    datos: List[VehiculoCreate],
+    current_user: Usuario = Depends(get_current_user)
+) -> list[VehiculoRead]:
+    # Endpoint PROTEGIDO para la carga masiva de vehículos
+    # Se importan todos o ninguno: una matrícula repetida rechaza el lote completo
+    try:
+        vehiculos = await alquiler_async.importar_vehiculos(
+            [await _vehiculo_create_to_kwargs(d) for d in datos]
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
     return [_vehiculo_to_read(v) for v in vehiculos]
 
+@app.get("/vehiculos", response_model=list[VehiculoRead])
+async def listar_vehiculos() -> Response:
+    if catalogo is not None:
+        return _json_response(catalogo.vehiculos())
+    return await _listado_en_hilo(await alquiler_async.listar_vehiculos(), _vehiculo_to_dict)
+
 @app.get("/vehiculos/disponibles", response_model=list[VehiculoRead])
-def listar_vehiculos_disponibles() -> list[VehiculoRead]:
-    vehiculos = alquiler_service.listar_vehiculos_disponibles()
-    return [_vehiculo_to_read(v) for v in vehiculos]
+async def listar_vehiculos_disponibles() -> Response:
+    if catalogo is not None:
+        return _json_response(catalogo.vehiculos_disponibles())
+    if particionado is not None:
+        vehiculos = await asyncio.to_thread(particionado.listar_vehiculos_disponibles)
+        return await _listado_en_hilo(vehiculos, _vehiculo_resumen_to_dict)
+    vehiculos = await alquiler_async.listar_vehiculos_disponibles()
+    return await _listado_en_hilo(vehiculos, _vehiculo_to_dict)
+
+@app.get("/vehiculos/buscar", response_model=list[VehiculoRead])
+async def buscar_vehiculos(
+    q: str = Query(min_length=1),
+    estado: Optional[str] = None,
+    sucursal_id: Optional[UUID] = None,
+    limite: int = Query(20, ge=1, le=200),
+) -> Response:
+    # Búsqueda por matrícula, marca o modelo (parcial) para el mostrador y el autocompletado
+    vehiculos = await alquiler_async.buscar_vehiculos(q, estado, sucursal_id, limite)
+    return _json_response([_vehiculo_to_dict(v) for v in vehiculos])
+
+@app.get("/vehiculos/rentabilidad", response_model=list[RentabilidadRead])
+async def listar_vehiculos_menos_rentables(limite: int = Query(10, ge=1, le=500)) -> Response:
+    # Vehículos en flota de menor a mayor beneficio: los primeros candidatos a retirar
+    if particionado is not None:
+        totales = await asyncio.to_thread(particionado.vehiculos_menos_rentables, limite)
+        return _json_response([_rentabilidad_resumen_to_dict(t) for t in totales])
+    totales = await alquiler_async.vehiculos_menos_rentables(limite)
+    return _json_response([_rentabilidad_to_dict(t) for t in totales])
+
+@app.get("/vehiculos/matricula/{matricula}", response_model=VehiculoRead)
+async def obtener_vehiculo_por_matricula(matricula: str) -> VehiculoRead:
+    # Búsqueda exacta por matrícula (sin importar mayúsculas, espacios o guiones)
+    if catalogo is not None:
+        fila = catalogo.vehiculo_por_matricula(matricula)
+        if fila is None:
+            raise HTTPException(status_code=404, detail="No existe ningún vehículo con esa matrícula.")
+        return _json_response(fila)
+    try:
+        vehiculo = await alquiler_async.obtener_vehiculo_por_matricula(matricula)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+
+    return _vehiculo_to_read(vehiculo)
 
 @app.get("/vehiculos/{vehiculo_id}", response_model=VehiculoRead)
-def obtener_vehiculo(vehiculo_id: UUID) -> VehiculoRead:
+async def obtener_vehiculo(vehiculo_id: UUID) -> VehiculoRead:
+    if catalogo is not None:
+        fila = catalogo.vehiculo(vehiculo_id)
+        if fila is None:
+            raise HTTPException(status_code=404, detail="Vehículo no encontrado.")
+        return _json_response(fila)
     try:
-        vehiculo = alquiler_service.obtener_vehiculo(vehiculo_id)
+        vehiculo = await alquiler_async.obtener_vehiculo(vehiculo_id)
     except ValueError as exc:
         raise HTTPException(status_code=404, detail=str(exc))
 
     return _vehiculo_to_read(vehiculo)
 
+@app.get("/vehiculos/{vehiculo_id}/alternativas", response_model=list[AlternativaRead])
+async def buscar_alternativas(
+    vehiculo_id: UUID,
+    fecha_inicio: str,
+    fecha_fin: str,
+    limite: int = Query(10, ge=1, le=100),
+) -> Response:
+    # Vehículos libres en esas fechas que pueden sustituir al pedido, de mejor a peor alternativa:
+    # misma categoría en la misma sucursal, en otras sucursales y después categorías superiores
+    if not await alquiler_async.existe_vehiculo(vehiculo_id):
+        raise HTTPException(status_code=404, detail="Vehículo no encontrado.")
+    try:
+        alternativas = await alquiler_async.buscar_alternativas(vehiculo_id, fecha_inicio, fecha_fin, limite)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    return _json_response([_alternativa_to_dict(a) for a in alternativas])
+
+@app.get("/vehiculos/{vehiculo_id}/rentabilidad", response_model=RentabilidadRead)
+async def obtener_rentabilidad_vehiculo(vehiculo_id: UUID) -> Response:
+    if particionado is not None:
+        try:
+            totales = await asyncio.to_thread(particionado.rentabilidad_vehiculo, vehiculo_id)
+        except ValueError as exc:
+            raise HTTPException(status_code=404, detail=str(exc))
+        return _json_response(_rentabilidad_resumen_to_dict(totales))
+    try:
+        totales = await alquiler_async.rentabilidad_vehiculo(vehiculo_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+
+    return _json_response(_rentabilidad_to_dict(totales))
+
 @app.delete("/vehiculos/{vehiculo_id}", status_code=204)
 async def eliminar_vehiculo(
     vehiculo_id: UUID,
+    cascada: bool = False,
     current_user: Usuario = Depends(get_current_user)
 ) -> None:
     # Endpoint PROTEGIDO para eliminar un vehículo del inventario
     # Requiere autenticación: solo usuarios autenticados pueden eliminar vehículos
+    # Con cascada=true se cancelan antes sus reservas activas; si no, se rechaza la baja
+    if not await alquiler_async.existe_vehiculo(vehiculo_id):
+        raise HTTPException(status_code=404, detail="Vehículo no encontrado.")
     try:
-        vehiculo = alquiler_service.vehiculos.get(vehiculo_id)
-        if not vehiculo:
-            raise ValueError("Vehículo no encontrado.")
-        del alquiler_service.vehiculos[vehiculo_id]
+        await alquiler_async.eliminar_vehiculo(vehiculo_id, cascada=cascada)
     except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/vehiculos/{vehiculo_id}/retirar", response_model=VehiculoRead)
+async def retirar_vehiculo(
+    vehiculo_id: UUID,
+    cascada: bool = False,
+    current_user: Usuario = Depends(get_current_user)
+) -> VehiculoRead:
+    # Endpoint PROTEGIDO para retirar un vehículo de la flota conservando su historial
+    if not await alquiler_async.existe_vehiculo(vehiculo_id):
+        raise HTTPException(status_code=404, detail="Vehículo no encontrado.")
+    try:
+        vehiculo = await alquiler_async.retirar_vehiculo(vehiculo_id, cascada=cascada)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return _vehiculo_to_read(vehiculo)
+
+@app.post("/vehiculos/{vehiculo_id}/transferir", response_model=VehiculoRead)
+async def transferir_vehiculo(
+    vehiculo_id: UUID,
+    datos: VehiculoTransferir,
+    current_user: Usuario = Depends(get_current_user)
+) -> VehiculoRead:
+    # Endpoint PROTEGIDO para trasladar un vehículo al inventario de otra sucursal (con particiones,
+    # si la sucursal es de otra partición el vehículo se traspasa en dos fases)
+    if particionado is not None:
+        try:
+            particionado.particion_de_vehiculo(vehiculo_id)
+        except ValueError as exc:
+            raise HTTPException(status_code=404, detail=str(exc))
+        try:
+            vehiculo = await asyncio.to_thread(particionado.transferir_vehiculo, vehiculo_id, datos.sucursal_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return _json_response(_vehiculo_resumen_to_dict(vehiculo))
+    if not await alquiler_async.existe_vehiculo(vehiculo_id):
+        raise HTTPException(status_code=404, detail="Vehículo no encontrado.")
+    try:
+        vehiculo = await alquiler_async.transferir_vehiculo(vehiculo_id, datos.sucursal_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return _vehiculo_to_read(vehiculo)
 
 # ------ TARIFAS ------ #
 @app.post("/tarifas", response_model=TarifaRead)
-def crear_tarifa(datos: TarifaCreate) -> TarifaRead:
+async def crear_tarifa(datos: TarifaCreate) -> TarifaRead:
     try:
-        tarifa = alquiler_service.crear_tarifa(
-            nombre=datos.nombre,
-            categoria=datos.categoria,
-            precio_diario=datos.precio_diario,
-            km_incluidos=datos.km_incluidos,
-            coste_km_extra=datos.coste_km_extra,
-            recargo_retraso=datos.recargo_retraso,
-            penalizacion_comb=datos.penalizacion_comb,
-        )
+        if particionado is not None:
+            # Con particiones, el enrutador copia la tarifa a todas
+            tarifa = await asyncio.to_thread(lambda: particionado.crear_tarifa(**datos.model_dump()))
+        else:
+            tarifa = await alquiler_async.crear_tarifa(
+                nombre=datos.nombre,
+                categoria=datos.categoria,
+                precio_diario=datos.precio_diario,
+                km_incluidos=datos.km_incluidos,
+                coste_km_extra=datos.coste_km_extra,
+                recargo_retraso=datos.recargo_retraso,
+                penalizacion_comb=datos.penalizacion_comb,
+            )
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
 
@@ -528,58 +1059,221 @@ def crear_tarifa(datos: TarifaCreate) -> TarifaRead:
     )
 
 @app.get("/tarifas", response_model=list[TarifaRead])
-def listar_tarifas() -> list[TarifaRead]:
-    tarifas = alquiler_service.tarifas.values()
-    return [
-        TarifaRead(
-            id=t.id,
-            nombre=t.nombre,
-            categoria=t.categoria,
-            precio_diario=t.precio_diario,
-            km_incluidos=t.km_incluidos,
-            coste_km_extra=t.coste_km_extra,
-            recargo_retraso=t.recargo_retraso,
-            penalizacion_comb=t.penalizacion_comb,
+async def listar_tarifas() -> Response:
+    if catalogo is not None:
+        return _json_response(catalogo.tarifas())
+    return _json_response([_tarifa_to_dict(t) for t in await alquiler_async.listar_tarifas()])
+
+@app.get("/tarifas/cotizacion", response_model=CotizacionRead)
+async def cotizar_reserva(sucursal_id: UUID, categoria: str, fecha_inicio: str, fecha_fin: str) -> CotizacionRead:
+    # Presupuesto del alquiler de un vehículo de esa categoría en esa sucursal para esas fechas
+    try:
+        if particionado is not None:
+            cotizacion = await asyncio.to_thread(particionado.cotizar_reserva, sucursal_id, categoria,
+                                                 fecha_inicio, fecha_fin)
+        else:
+            cotizacion = await alquiler_async.cotizar_reserva(sucursal_id, categoria, fecha_inicio, fecha_fin)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    return CotizacionRead(
+        sucursal_id=cotizacion["sucursal_id"],
+        categoria=cotizacion["categoria"],
+        dias=cotizacion["dias"],
+        precio_diario=cotizacion["precio_diario"],
+        total=cotizacion["total"],
+        detalle=[
+            CotizacionDia(fecha=_formatear_fecha(d["fecha"]), multiplicador=d["multiplicador"], precio=d["precio"])
+            for d in cotizacion["detalle"]
+        ],
+    )
+
+@app.get("/tarifas/temporadas", response_model=list[TemporadaRead])
+async def listar_temporadas() -> list[TemporadaRead]:
+    return [_temporada_to_read(t) for t in await alquiler_async.listar_temporadas()]
+
+@app.post("/tarifas/temporadas", response_model=TemporadaRead, status_code=201)
+async def crear_temporada(
+    datos: TemporadaCreate,
+    current_user: Usuario = Depends(get_current_user)
+) -> TemporadaRead:
+    # Endpoint PROTEGIDO para configurar una temporada de precios
+    try:
+        temporada = await alquiler_async.agregar_temporada(
+            nombre=datos.nombre,
+            inicio=datos.inicio,
+            fin=datos.fin,
+            multiplicador=datos.multiplicador,
+            sucursal_id=datos.sucursal_id,
+            categoria=datos.categoria,
         )
-        for t in tarifas
-    ]
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    return _temporada_to_read(temporada)
+
+@app.delete("/tarifas/temporadas/{temporada_id}", status_code=204)
+async def eliminar_temporada(
+    temporada_id: UUID,
+    current_user: Usuario = Depends(get_current_user)
+) -> None:
+    # Endpoint PROTEGIDO para quitar una temporada de precios
+    try:
+        await alquiler_async.eliminar_temporada(temporada_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
 
 # ------ RESERVAS ------ #
 @app.post("/reservas", response_model=ReservaRead)
-def crear_reserva(datos: ReservaCreate) -> ReservaRead:
+async def crear_reserva(datos: ReservaCreate) -> ReservaRead:
+    if particionado is not None:
+        # Las particiones solo devuelven el motivo del rechazo (sin alternativas)
+        try:
+            reserva = await asyncio.to_thread(particionado.realizar_reserva, datos.cliente_id, datos.vehiculo_id,
+                                              datos.fecha_inicio, datos.fecha_fin, datos.sucursal_devolucion_id)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        return _json_response(_reserva_resumen_to_dict(reserva))
     try:
-        reserva = alquiler_service.realizar_reserva(
+        reserva = await alquiler_async.realizar_reserva(
             cliente_id=datos.cliente_id,
             vehiculo_id=datos.vehiculo_id,
             fecha_inicio=datos.fecha_inicio,
             fecha_fin=datos.fecha_fin,
             id_sucursal_devolucion=datos.sucursal_devolucion_id,
         )
+    except ConflictoMantenimiento as exc:
+        raise _conflicto_to_http(exc)
+    except VehiculoNoDisponible as exc:
+        # Devolvemos las alternativas junto con el rechazo (409, igual que los conflictos de calendario)
+        raise HTTPException(status_code=409, detail={
+            "mensaje": str(exc),
+            "alternativas": [_alternativa_to_dict(a) for a in exc.alternativas],
+        })
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
 
     return _reserva_to_read(reserva)
 
+# Lista de espera: en lugar de reintentar POST /reservas hasta que quede un vehículo libre, el cliente
+# se apunta una vez y consulta su solicitud (o escucha ESPERA_ASIGNADA en /eventos)
+@app.post("/reservas/espera", response_model=EsperaRead, status_code=202)
+async def solicitar_espera(datos: EsperaCreate) -> EsperaRead:
+    try:
+        solicitud = await alquiler_async.solicitar_espera(
+            cliente_id=datos.cliente_id,
+            sucursal_id=datos.sucursal_id,
+            categoria=datos.categoria,
+            fecha_inicio=datos.fecha_inicio,
+            fecha_fin=datos.fecha_fin,
+            id_sucursal_devolucion=datos.sucursal_devolucion_id,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    return await _espera_to_read(solicitud)
+
+@app.get("/reservas/espera/{solicitud_id}", response_model=EsperaRead)
+async def obtener_espera(solicitud_id: UUID) -> EsperaRead:
+    try:
+        solicitud = await alquiler_async.obtener_espera(solicitud_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+
+    return await _espera_to_read(solicitud)
+
+@app.post("/reservas/espera/{solicitud_id}/cancelar", response_model=EsperaRead)
+async def cancelar_espera(solicitud_id: UUID) -> EsperaRead:
+    try:
+        solicitud = await alquiler_async.cancelar_espera(solicitud_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    return await _espera_to_read(solicitud)
+
 @app.get("/reservas", response_model=list[ReservaRead])
-def listar_reservas() -> list[ReservaRead]:
-    reservas = alquiler_service.reservas.values()
-    return [_reserva_to_read(r) for r in reservas]
+async def listar_reservas() -> Response:
+    return await _listado_en_hilo(await alquiler_async.listar_reservas(), _reserva_to_dict)
+
+@app.get("/reservas/{reserva_id}", response_model=ReservaRead)
+async def obtener_reserva(reserva_id: UUID) -> ReservaRead:
+    if particionado is not None:
+        try:
+            reserva = await asyncio.to_thread(particionado.obtener_reserva, reserva_id)
+        except ValueError as exc:
+            raise HTTPException(status_code=404, detail=str(exc))
+        return _json_response(_reserva_resumen_to_dict(reserva))
+    try:
+        reserva = await alquiler_async.obtener_reserva(reserva_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+
+    return _reserva_to_read(reserva)
 
 @app.get("/usuarios/{cliente_id}/reservas", response_model=list[ReservaRead])
-def listar_reservas_cliente(cliente_id: UUID) -> list[ReservaRead]:
+async def listar_reservas_cliente(
+    cliente_id: UUID,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    estado: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limite: Optional[int] = Query(None, ge=1, le=1000),
+) -> Response:
+    # Reservas del cliente ordenadas por fecha de inicio, filtrables por ventana de fechas y estado
     try:
-        cliente = alquiler_service.obtener_usuario(cliente_id)
+        cliente = await alquiler_async.obtener_usuario(cliente_id)
         if not isinstance(cliente, Cliente):
             raise ValueError("El usuario no es un cliente.")
     except ValueError as exc:
         raise HTTPException(status_code=404, detail=str(exc))
 
-    return [_reserva_to_read(r) for r in cliente.reservas]
+    try:
+        if particionado is not None:
+            # El enrutador junta las de todas las particiones; la página la cortamos aquí
+            reservas = await asyncio.to_thread(particionado.listar_reservas_cliente, cliente.id, desde, hasta, estado)
+            return _json_response([_reserva_resumen_to_dict(r)
+                                   for r in reservas[offset:offset + limite if limite else None]])
+        reservas = await alquiler_async.listar_reservas_cliente(cliente.id, desde, hasta, estado, offset, limite)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    return _json_response([_reserva_to_dict(r) for r in reservas])
+
+@app.get("/sucursales/{sucursal_id}/reservas", response_model=list[ReservaRead])
+async def listar_reservas_sucursal(
+    sucursal_id: UUID,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    estado: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limite: Optional[int] = Query(None, ge=1, le=1000),
+) -> Response:
+    # Calendario de la sucursal: reservas que se recogen o devuelven en ella, por fecha de inicio
+    if not await alquiler_async.existe_sucursal(sucursal_id):
+        raise HTTPException(status_code=404, detail="Sucursal no encontrada.")
+
+    try:
+        if particionado is not None:
+            reservas = await asyncio.to_thread(particionado.listar_reservas_sucursal, sucursal_id, desde, hasta, estado)
+            return _json_response([_reserva_resumen_to_dict(r)
+                                   for r in reservas[offset:offset + limite if limite else None]])
+        reservas = await alquiler_async.listar_reservas_sucursal(sucursal_id, desde, hasta, estado, offset, limite)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    return _json_response([_reserva_to_dict(r) for r in reservas])
 
 @app.post("/reservas/{reserva_id}/finalizar")
-def finalizar_reserva(reserva_id: UUID, datos: ReservaFinalizarRequest):
+async def finalizar_reserva(reserva_id: UUID, datos: ReservaFinalizarRequest):
+    if particionado is not None:
+        # Si se devuelve en una sucursal de otra partición, el enrutador traspasa después el vehículo
+        try:
+            return await asyncio.to_thread(particionado.finalizar_reserva, reserva_id, datos.km_recorridos,
+                                           datos.retraso_dias, datos.combustible_correcto, datos.metodo_pago)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
     try:
-        pago_info = alquiler_service.finalizar_reserva(
+        pago_info = await alquiler_async.finalizar_reserva(
             reserva_id=reserva_id,
             km_recorridos=datos.km_recorridos,
             retraso_dias=datos.retraso_dias,
@@ -591,11 +1285,43 @@ def finalizar_reserva(reserva_id: UUID, datos: ReservaFinalizarRequest):
 
     return pago_info
 
+@app.post("/reservas/{reserva_id}/cancelar", response_model=ReservaRead)
+async def cancelar_reserva(reserva_id: UUID) -> ReservaRead:
+    # Cancelamos la reserva y el vehículo queda libre de nuevo
+    if particionado is not None:
+        try:
+            reserva = await asyncio.to_thread(particionado.cancelar_reserva, reserva_id)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        return _json_response(_reserva_resumen_to_dict(reserva))
+    try:
+        reserva = await alquiler_async.cancelar_reserva(reserva_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    return _reserva_to_read(reserva)
+
+@app.post("/reservas/finalizar-lote")
+async def finalizar_reservas_lote(datos: ReservaFinalizarLoteRequest):
+    # Finalizamos varias devoluciones en una sola petición. Los fallos se informan por
+    # elemento y no impiden que el resto de reservas se finalicen.
+    resultados = await alquiler_async.finalizar_reservas_lote(
+        [d.model_dump() for d in datos.devoluciones]
+    )
+    correctas = sum(1 for r in resultados if r["correcta"])
+
+    return {
+        "procesadas": len(resultados),
+        "correctas": correctas,
+        "fallidas": len(resultados) - correctas,
+        "resultados": resultados,
+    }
+
 # ------ MANTENIMIENTOS ------ #
 @app.post("/mantenimientos", response_model=MantenimientoRead)
-def crear_mantenimiento(datos: MantenimientoCreate) -> MantenimientoRead:
+async def crear_mantenimiento(datos: MantenimientoCreate) -> MantenimientoRead:
     try:
-        mantenimiento = alquiler_service.registrar_mantenimiento(
+        mantenimiento = await alquiler_async.registrar_mantenimiento(
             vehiculo_id=datos.vehiculo_id,
             motivo=datos.motivo,
             fecha_inicio=datos.fecha_inicio,
@@ -603,48 +1329,194 @@ def crear_mantenimiento(datos: MantenimientoCreate) -> MantenimientoRead:
             coste=datos.coste,
             tipo=datos.tipo,
         )
+    except ConflictoMantenimiento as exc:
+        raise _conflicto_to_http(exc)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
 
-    return MantenimientoRead(
-        id=mantenimiento.id,
-        vehiculo_matricula=mantenimiento.vehiculo.matricula,
-        motivo=mantenimiento.motivo,
-        fecha_inicio=mantenimiento.fecha_inicio.strftime("%Y-%m-%d"),
-        fecha_fin=mantenimiento.fecha_fin.strftime("%Y-%m-%d"),
-        coste=mantenimiento.coste,
-        tipo=mantenimiento.tipo,
-    )
+    return _mantenimiento_to_read(mantenimiento)
 
 @app.get("/mantenimientos", response_model=list[MantenimientoRead])
-def listar_mantenimientos() -> list[MantenimientoRead]:
-    mantenimientos = alquiler_service.mantenimientos.values()
+async def listar_mantenimientos() -> Response:
+    return await _listado_en_hilo(await alquiler_async.listar_mantenimientos(), _mantenimiento_to_dict)
+
+@app.get("/mantenimientos/plan", response_model=list[MantenimientoPlanRead])
+async def planificar_mantenimientos(
+    desde: Optional[str] = None,
+    horizonte: int = Query(30, ge=0, le=365),
+    limite: int = Query(50, ge=1, le=500),
+) -> list[MantenimientoPlanRead]:
+    # Revisiones e ITV que vencen en los próximos 'horizonte' días (desde hoy o desde 'desde'),
+    # de la más urgente a la menos, con la ventana propuesta en los días de menos demanda
+    try:
+        plan = await alquiler_async.planificar_mantenimientos(desde, horizonte, limite)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
     return [
-        MantenimientoRead(
-            id=m.id,
-            vehiculo_matricula=m.vehiculo.matricula,
-            motivo=m.motivo,
-            fecha_inicio=m.fecha_inicio.strftime("%Y-%m-%d"),
-            fecha_fin=m.fecha_fin.strftime("%Y-%m-%d"),
-            coste=m.coste,
-            tipo=m.tipo,
+        MantenimientoPlanRead(
+            vehiculo_id=p["vehiculo"].id,
+            vehiculo_matricula=p["vehiculo"].matricula,
+            tipo=p["tipo"],
+            vencimiento=_formatear_fecha(p["vencimiento"]),
+            km_desde_revision=p["km_desde_revision"],
+            fecha_inicio=_formatear_fecha(p["inicio"]) if p["inicio"] else None,
+            fecha_fin=_formatear_fecha(p["fin"]) if p["fin"] else None,
         )
-        for m in mantenimientos
+        for p in plan
     ]
 
 @app.post("/mantenimientos/{mantenimiento_id}/finalizar")
-def finalizar_mantenimiento(mantenimiento_id: UUID):
+async def finalizar_mantenimiento(mantenimiento_id: UUID):
     try:
-        mantenimiento = alquiler_service.finalizar_mantenimiento(mantenimiento_id)
+        mantenimiento = await alquiler_async.finalizar_mantenimiento(mantenimiento_id)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
 
     return {"mensaje": "Mantenimiento finalizado correctamente.", "vehiculo": mantenimiento.vehiculo.matricula}
 
+# ------ EVENTOS ------ #
+@app.get("/eventos")
+async def flujo_eventos(
+    request: Request,
+    desde: Optional[int] = Query(None, ge=0),
+    last_event_id: Optional[str] = Header(None),
+    current_user: Usuario = Depends(get_current_user),
+):
+    # Endpoint PROTEGIDO: flujo de eventos del dominio con Server-Sent Events, para sustituir el sondeo de /vehiculos y /reservas.
+    # El cliente puede reanudar desde un número de secuencia (parámetro desde o cabecera Last-Event-ID);
+    # sin ninguno de los dos, recibe solo los eventos a partir de ahora.
+    if desde is None and last_event_id and last_event_id.isdigit():
+        desde = int(last_event_id)
+    if desde is None:
+        desde = await alquiler_async.ultima_secuencia_eventos()
+
+    return StreamingResponse(
+        _generar_eventos_sse(request, desde),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/eventos/historial")
+async def historial_eventos(
+    desde: int = Query(0, ge=0),
+    limite: int = Query(100, ge=1, le=1000),
+    current_user: Usuario = Depends(get_current_user),
+):
+    # Endpoint PROTEGIDO. Alternativa sin SSE: eventos posteriores a una secuencia, para clientes que sondean
+    eventos, perdidos = await alquiler_async.leer_eventos(desde, limite)
+    return {
+        "ultima_secuencia": await alquiler_async.ultima_secuencia_eventos(),
+        "eventos_perdidos": perdidos,
+        "eventos": [e.a_dict() for e in eventos],
+    }
+
+# ------ AUDITORÍA ------ #
+@app.get("/auditoria", response_model=list[AuditoriaRead])
+async def consultar_auditoria(
+    entidad_id: Optional[UUID] = None,
+    tipo: Optional[str] = None,
+    fecha: Optional[str] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    limite: int = Query(1000, ge=1, le=10000),
+    current_user: Usuario = Depends(get_current_user),
+) -> Response:
+    # Endpoint PROTEGIDO (solo administradores): registros de auditoría de una entidad (vehículo,
+    # reserva, cliente...), de un tipo de evento (PAGO_REGISTRADO...) y de un día ('fecha') o entre
+    # 'desde' y 'hasta' (excluida), del más antiguo al más moderno
+    registro = _registro_auditoria(current_user)
+    try:
+        if fecha is not None:
+            if desde is not None or hasta is not None:
+                raise ValueError("Indica 'fecha' o 'desde'/'hasta', no las dos cosas.")
+            desde_fecha = datetime.strptime(fecha, "%Y-%m-%d")
+            hasta_fecha = desde_fecha + timedelta(days=1)
+        else:
+            desde_fecha = datetime.fromisoformat(desde) if desde else None
+            hasta_fecha = datetime.fromisoformat(hasta) if hasta else None
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    # La consulta lee y descomprime bloques del disco: va en un hilo
+    registros = await asyncio.to_thread(registro.buscar, str(entidad_id) if entidad_id else None, tipo,
+                                        desde_fecha, hasta_fecha, limite)
+    return _json_response(registros)
+
+@app.get("/auditoria/estado")
+async def estado_auditoria(current_user: Usuario = Depends(get_current_user)):
+    # Endpoint PROTEGIDO (solo administradores): tamaño del registro y registros pendientes de escribir
+    return _registro_auditoria(current_user).estado()
+
 # ---------------------- FUNCIONES AUXILIARES ---------------------- #
 
+async def _generar_eventos_sse(request: Request, secuencia: int):
+    # Generador del flujo SSE. Cada cliente avanza a su ritmo sobre el buffer compartido:
+    # si el cliente lee despacio, simplemente tarda más en pedir el siguiente bloque.
+    while not await request.is_disconnected():
+        eventos, perdidos = await alquiler_async.leer_eventos(secuencia)
+        if perdidos:
+            # El cliente se ha quedado atrás: le avisamos para que recargue el estado completo
+            yield f"event: resync\ndata: {json.dumps({'desde': secuencia})}\n\n"
+        for evento in eventos:
+            secuencia = evento.secuencia
+            yield (f"id: {evento.secuencia}\nevent: {evento.tipo}\n"
+                   f"data: {json.dumps(evento.a_dict(), ensure_ascii=False)}\n\n")
+        if not eventos and not await alquiler_async.esperar_eventos(secuencia, EVENTOS_KEEPALIVE_SEGUNDOS):
+            yield ": keepalive\n\n"
+
+async def _vehiculo_create_to_kwargs(datos: VehiculoCreate) -> dict:
+    # Función auxiliar para convertir un VehiculoCreate en los argumentos de registrar_vehiculo
+    sucursal = await alquiler_async.obtener_sucursal(datos.sucursal_id)
+
+    extras = {}
+    if datos.puertas is not None:
+        extras["puertas"] = datos.puertas
+    if datos.tipo_motor is not None:
+        extras["motor"] = datos.tipo_motor
+    if datos.cilindrada is not None:
+        extras["cilindrada"] = datos.cilindrada
+    if datos.capacidad_carga is not None:
+        extras["carga"] = datos.capacidad_carga
+
+    return dict(
+        tipo=datos.tipo,
+        matricula=datos.matricula,
+        marca=datos.marca,
+        modelo=datos.modelo,
+        año=datos.año,
+        categoria=datos.categoria,
+        km=datos.km,
+        sucursal=sucursal,
+        **extras
+    )
+
+def _json_response(filas) -> Response:
+    # Función auxiliar para responder listados grandes (o una sola fila) sin construir modelos Pydantic:
+    # las filas ya son diccionarios con tipos JSON y se codifican directamente a bytes
+    return Response(content=_codificador_json.encode(filas).encode("utf-8"), media_type="application/json")
+
+async def _listado_en_hilo(objetos, to_dict) -> Response:
+    # Los listados completos pueden tener decenas de miles de filas: las convertimos y codificamos en
+    # un hilo para que el bucle de eventos siga atendiendo al resto de peticiones mientras tanto
+    return await asyncio.to_thread(lambda: _json_response([to_dict(o) for o in objetos]))
+
+@lru_cache(maxsize=8192)
+def _formatear_fecha(fecha: datetime) -> str:
+    # Las mismas fechas se repiten mucho en los listados, así que guardamos el texto ya formateado
+    return fecha.strftime("%Y-%m-%d")
+
+def _usuario_to_dict(usuario: Usuario) -> dict:
+    # Función auxiliar para convertir un usuario al diccionario JSON de UsuarioRead
+    return {"id": str(usuario.id), "nombre": usuario.nombre, "email": usuario.email, "es_admin": usuario.is_admin()}
+
 def _vehiculo_to_read(vehiculo: Vehiculo) -> VehiculoRead:
     # Función auxiliar para convertir un vehículo a VehiculoRead
+    return VehiculoRead(**_vehiculo_to_dict(vehiculo))
+
+def _vehiculo_to_dict(vehiculo: Vehiculo) -> dict:
+    # Función auxiliar para convertir un vehículo al diccionario JSON de VehiculoRead
+    # (mismos campos, mismo orden y mismos tipos que produciría el modelo)
     tipo_vehiculo = "generico"
     puertas = None
     tipo_motor = None
@@ -662,35 +1534,230 @@ def _vehiculo_to_read(vehiculo: Vehiculo) -> VehiculoRead:
         tipo_vehiculo = "furgoneta"
         capacidad_carga = vehiculo.capacidad_carga
 
-    return VehiculoRead(
-        id=vehiculo.id,
-        tipo=tipo_vehiculo,
-        matricula=vehiculo.matricula,
-        marca=vehiculo.marca,
-        modelo=vehiculo.modelo,
-        año=vehiculo.año,
-        categoria=vehiculo.categoria,
-        km=vehiculo.km,
-        estado=vehiculo.estado,
-        sucursal_nombre=vehiculo.sucursal.nombre if vehiculo.sucursal else "Sin asignar",
-        puertas=puertas,
-        tipo_motor=tipo_motor,
-        cilindrada=cilindrada,
-        capacidad_carga=capacidad_carga,
+    return {
+        "id": str(vehiculo.id),
+        "tipo": tipo_vehiculo,
+        "matricula": vehiculo.matricula,
+        "marca": vehiculo.marca,
+        "modelo": vehiculo.modelo,
+        "año": int(vehiculo.año),
+        "categoria": vehiculo.categoria,
+        "km": float(vehiculo.km),
+        "estado": vehiculo.estado,
+        "sucursal_nombre": vehiculo.sucursal.nombre if vehiculo.sucursal else "Sin asignar",
+        "puertas": int(puertas) if puertas is not None else None,
+        "tipo_motor": tipo_motor,
+        "cilindrada": int(cilindrada) if cilindrada is not None else None,
+        "capacidad_carga": float(capacidad_carga) if capacidad_carga is not None else None,
+    }
+
+def _vehiculo_resumen_to_dict(resumen: dict) -> dict:
+    # Función auxiliar: vehículo devuelto por una partición (ver services/Particionado.py) con la
+    # forma de VehiculoRead
+    return {
+        "id": str(resumen["id"]),
+        "tipo": {"Coche": "coche", "Moto": "moto", "Furgoneta": "furgoneta"}.get(resumen["clase"], "generico"),
+        "matricula": resumen["matricula"],
+        "marca": resumen["marca"],
+        "modelo": resumen["modelo"],
+        "año": int(resumen["año"]),
+        "categoria": resumen["categoria"],
+        "km": float(resumen["km"]),
+        "estado": resumen["estado"],
+        "sucursal_nombre": resumen["sucursal_nombre"] or "Sin asignar",
+        "puertas": int(resumen["puertas"]) if resumen["puertas"] is not None else None,
+        "tipo_motor": resumen["tipo_motor"],
+        "cilindrada": int(resumen["cilindrada"]) if resumen["cilindrada"] is not None else None,
+        "capacidad_carga": float(resumen["capacidad_carga"]) if resumen["capacidad_carga"] is not None else None,
+    }
+
+def _sucursal_to_dict(sucursal: Sucursal) -> dict:
+    # Función auxiliar para convertir una sucursal al diccionario JSON de SucursalRead
+    return {
+        "id": str(sucursal.id),
+        "nombre": sucursal.nombre,
+        "direccion": sucursal.direccion,
+        "telefono": sucursal.telefono,
+        "num_vehiculos": len(sucursal.vehiculos),
+        "num_reservas": len(sucursal.reservas),
+        "latitud": sucursal.latitud,
+        "longitud": sucursal.longitud,
+    }
+
+def _tarifa_to_dict(tarifa: Tarifa) -> dict:
+    # Función auxiliar para convertir una tarifa al diccionario JSON de TarifaRead (el mismo que
+    # genera el catálogo binario)
+    return {
+        "id": str(tarifa.id),
+        "nombre": tarifa.nombre,
+        "categoria": tarifa.categoria,
+        "precio_diario": float(tarifa.precio_diario),
+        "km_incluidos": float(tarifa.km_incluidos),
+        "coste_km_extra": float(tarifa.coste_km_extra),
+        "recargo_retraso": float(tarifa.recargo_retraso),
+        "penalizacion_comb": float(tarifa.penalizacion_comb),
+    }
+
+def _temporada_to_read(temporada) -> TemporadaRead:
+    # Función auxiliar para convertir una temporada de precios a TemporadaRead
+    return TemporadaRead(
+        id=temporada.id,
+        nombre=temporada.nombre,
+        inicio=f"{temporada.inicio[0]:02d}-{temporada.inicio[1]:02d}",
+        fin=f"{temporada.fin[0]:02d}-{temporada.fin[1]:02d}",
+        multiplicador=temporada.multiplicador,
+        sucursal_id=temporada.sucursal_id,
+        categoria=temporada.categoria,
     )
 
 def _reserva_to_read(reserva: Reserva) -> ReservaRead:
     # Función auxiliar para convertir una reserva a ReservaRead
-    return ReservaRead(
-        id=reserva.id,
-        cliente_nombre=reserva.cliente.nombre,
-        vehiculo_matricula=reserva.vehiculo.matricula,
-        fecha_inicio=reserva.fecha_inicio.strftime("%Y-%m-%d"),
-        fecha_fin=reserva.fecha_fin.strftime("%Y-%m-%d"),
-        sucursal_recogida=reserva.sucursal_recogida.nombre,
-        sucursal_devolucion=reserva.sucursal_devolucion.nombre,
-        dias=reserva.dias,
-        total_estimado=reserva.total_estimado,
-        estado=reserva.estado,
-        pagada=reserva.pagada,
-    )
+    return ReservaRead(**_reserva_to_dict(reserva))
+
+def _reserva_to_dict(reserva: Reserva) -> dict:
+    # Función auxiliar para convertir una reserva al diccionario JSON de ReservaRead
+    return {
+        "id": str(reserva.id),
+        "cliente_nombre": reserva.cliente.nombre,
+        "vehiculo_matricula": reserva.vehiculo.matricula,
+        "fecha_inicio": _formatear_fecha(reserva.fecha_inicio),
+        "fecha_fin": _formatear_fecha(reserva.fecha_fin),
+        "sucursal_recogida": reserva.sucursal_recogida.nombre,
+        "sucursal_devolucion": reserva.sucursal_devolucion.nombre,
+        "dias": reserva.dias,
+        "total_estimado": float(reserva.total_estimado),
+        "estado": reserva.estado,
+        "pagada": reserva.pagada,
+    }
+
+def _reserva_resumen_to_dict(resumen: dict) -> dict:
+    # Función auxiliar: reserva devuelta por una partición con la forma de ReservaRead
+    return {
+        "id": str(resumen["id"]),
+        "cliente_nombre": resumen["cliente_nombre"],
+        "vehiculo_matricula": resumen["vehiculo_matricula"],
+        "fecha_inicio": _formatear_fecha(resumen["fecha_inicio"]),
+        "fecha_fin": _formatear_fecha(resumen["fecha_fin"]),
+        "sucursal_recogida": resumen["sucursal_recogida_nombre"],
+        "sucursal_devolucion": resumen["sucursal_devolucion_nombre"],
+        "dias": resumen["dias"],
+        "total_estimado": float(resumen["total_estimado"]),
+        "estado": resumen["estado"],
+        "pagada": resumen["pagada"],
+    }
+
+async def _espera_to_read(solicitud) -> EsperaRead:
+    # Función auxiliar para convertir una solicitud de la lista de espera a EsperaRead, con su
+    # posición en la cola y la reserva asignada (si la hay)
+    posicion = await alquiler_async.posicion_espera(solicitud)
+    reserva = await alquiler_async.obtener_reserva(solicitud.reserva_id) if solicitud.reserva_id else None
+    return EsperaRead(**_espera_to_dict(solicitud, posicion, reserva))
+
+def _espera_to_dict(solicitud, posicion: Optional[int], reserva: Optional[Reserva]) -> dict:
+    # Función auxiliar para convertir una solicitud de la lista de espera al diccionario de EsperaRead
+    return {
+        "id": str(solicitud.id),
+        "cliente_id": str(solicitud.cliente_id),
+        "sucursal_id": str(solicitud.sucursal_id),
+        "categoria": solicitud.categoria,
+        "fecha_inicio": _formatear_fecha(solicitud.fecha_inicio),
+        "fecha_fin": _formatear_fecha(solicitud.fecha_fin),
+        "sucursal_devolucion_id": str(solicitud.sucursal_devolucion_id),
+        "estado": solicitud.estado,
+        "posicion": posicion,
+        "reserva": _reserva_to_dict(reserva) if reserva else None,
+    }
+
+def _mantenimiento_to_read(mantenimiento: Mantenimiento) -> MantenimientoRead:
+    # Función auxiliar para convertir un mantenimiento a MantenimientoRead
+    return MantenimientoRead(**_mantenimiento_to_dict(mantenimiento))
+
+def _mantenimiento_to_dict(mantenimiento: Mantenimiento) -> dict:
+    # Función auxiliar para convertir un mantenimiento al diccionario JSON de MantenimientoRead
+    return {
+        "id": str(mantenimiento.id),
+        "vehiculo_matricula": mantenimiento.vehiculo.matricula,
+        "motivo": mantenimiento.motivo,
+        "fecha_inicio": _formatear_fecha(mantenimiento.fecha_inicio),
+        "fecha_fin": _formatear_fecha(mantenimiento.fecha_fin),
+        "coste": float(mantenimiento.coste),
+        "tipo": mantenimiento.tipo,
+        "estado": mantenimiento.estado,
+    }
+
+def _conflicto_to_http(exc: ConflictoMantenimiento) -> HTTPException:
+    # Función auxiliar para responder un conflicto de calendario con 409: qué se solapa y qué vehículos están libres
+    return HTTPException(status_code=409, detail={
+        "mensaje": str(exc),
+        "conflictos": [
+            {
+                "tipo": c["tipo"],
+                "id": str(c["id"]),
+                "fecha_inicio": _formatear_fecha(c["fecha_inicio"]),
+                "fecha_fin": _formatear_fecha(c["fecha_fin"]),
+            }
+            for c in exc.conflictos
+        ],
+        "alternativas": [_alternativa_to_dict(a) for a in exc.alternativas],
+    })
+
+def _alternativa_to_dict(alternativa: dict) -> dict:
+    # Función auxiliar: alternativa propuesta por el servicio con la forma de AlternativaRead
+    return {
+        "vehiculo": _vehiculo_to_dict(alternativa["vehiculo"]),
+        "motivo": alternativa["motivo"],
+        "precio_estimado": alternativa["precio_estimado"],
+    }
+
+def _registro_auditoria(usuario: Usuario) -> RegistroAuditoria:
+    # Función auxiliar: el registro de auditoría, solo para administradores y si está activo
+    if not usuario.is_admin():
+        raise HTTPException(status_code=403, detail="Solo los administradores pueden consultar la auditoría.")
+    if registro_auditoria is None:
+        raise HTTPException(status_code=503, detail="El registro de auditoría no está activo.")
+    return registro_auditoria
+
+def _rentabilidad_to_dict(totales) -> dict:
+    # Función auxiliar: totales de un vehículo con la forma de RentabilidadRead
+    return {
+        "vehiculo": _vehiculo_to_dict(totales.vehiculo),
+        "ingresos": round(totales.ingresos, 2),
+        "coste_mantenimiento": round(totales.coste_mantenimiento, 2),
+        "beneficio": round(totales.beneficio, 2),
+        "alquileres": totales.alquileres,
+        "dias_alquilado": totales.dias_alquilado,
+        "km_recorridos": totales.km_recorridos,
+        "mantenimientos": totales.mantenimientos,
+        "dias_en_flota": totales.dias_en_flota(),
+        "utilizacion": round(totales.utilizacion(), 4),
+    }
+
+def _rentabilidad_resumen_to_dict(totales: dict) -> dict:
+    # Función auxiliar: totales de un vehículo devueltos por una partición con la forma de RentabilidadRead
+    return {
+        "vehiculo": _vehiculo_resumen_to_dict(totales["vehiculo"]),
+        "ingresos": round(totales["ingresos"], 2),
+        "coste_mantenimiento": round(totales["coste_mantenimiento"], 2),
+        "beneficio": round(totales["beneficio"], 2),
+        "alquileres": totales["alquileres"],
+        "dias_alquilado": totales["dias_alquilado"],
+        "km_recorridos": totales["km_recorridos"],
+        "mantenimientos": totales["mantenimientos"],
+        "dias_en_flota": totales["dias_en_flota"],
+        "utilizacion": round(totales["utilizacion"], 4),
+    }
+
+async def _iniciar_mantenimientos_periodicamente():
+    # Tarea en segundo plano: pone en mantenimiento los vehículos cuya ventana programada ha empezado
+    while True:
+        await asyncio.sleep(MANTENIMIENTOS_INTERVALO_SEGUNDOS)
+        try:
+            await alquiler_async.procesar_mantenimientos_programados()
+        except Exception:
+            # Un fallo puntual no debe parar la tarea: se reintenta en la siguiente vuelta
+            logger.exception("Error al iniciar los mantenimientos programados")
+
+if __name__ == "__main__":
+    # Arrancamos el servidor al ejecutar "python main.py" (es el comando del contenedor)
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "8000")))
@@ -0,0 +1,79 @@
+from __future__ import annotations
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+# ID máximo posible, para que el límite superior de un rango incluya todas las reservas de ese día
+_ID_MAXIMO = UUID(int=(1 << 128) - 1)
+
+
+class IndiceReservas:
+    # Colección de reservas indexada por ID y ordenada por fecha de inicio.
+    # La usamos en clientes y sucursales para poder buscar, añadir y quitar reservas
+    # sin recorrer toda la lista, manteniendo además el orden cronológico.
+
+    def __init__(self):
+        # Diccionario para acceder a cada reserva por su ID
+        self._por_id: Dict[UUID, object] = {}
+        # Claves (fecha_inicio, id) ordenadas, para recorrer las reservas por fecha
+        self._claves: List[Tuple[datetime, UUID]] = []
+
+    def agregar(self, reserva):
+        # Añadimos la reserva si no estaba ya en el índice
+        if reserva.id in self._por_id:
+            return
+        self._por_id[reserva.id] = reserva
+        insort(self._claves, (reserva.fecha_inicio, reserva.id))
+
+    def eliminar(self, reserva) -> bool:
+        # Quitamos la reserva del índice; devolvemos False si no estaba
+        if self._por_id.pop(reserva.id, None) is None:
+            return False
+        posicion = bisect_left(self._claves, (reserva.fecha_inicio, reserva.id))
+        del self._claves[posicion]
+        return True
+
+    def obtener(self, reserva_id: UUID):
+        # Devolvemos la reserva con ese ID (o None si no existe)
+        return self._por_id.get(reserva_id)
+
+    def rango(self, desde: Optional[datetime] = None, hasta: Optional[datetime] = None,
+              estado: Optional[str] = None, offset: int = 0, limite: Optional[int] = None):
+        # Devolvemos las reservas cuya fecha de inicio está entre desde y hasta (ambas incluidas),
+        # ordenadas por fecha. Localizamos los extremos con búsqueda binaria, así que el coste
+        # depende del tamaño de la ventana y no de todo el historial.
+        inicio = 0 if desde is None else bisect_left(self._claves, (desde,))
+        fin = len(self._claves) if hasta is None else bisect_right(self._claves, (hasta, _ID_MAXIMO))
+
+        # Copiamos de golpe el tramo de claves y buscamos las reservas con get: si otro hilo
+        # añade o quita reservas mientras tanto, el recorrido no falla (las quitadas se omiten)
+        por_id = self._por_id
+        if estado is None:
+            # Sin filtro de estado la página se obtiene directamente por posición
+            inicio = min(inicio + offset, fin)
+            if limite is not None:
+                fin = min(fin, inicio + limite)
+            reservas = (por_id.get(reserva_id) for _, reserva_id in self._claves[inicio:fin])
+            return [r for r in reservas if r is not None]
+
+        # Con filtro de estado paginamos sobre el resultado ya filtrado
+        estado = estado.upper()
+        reservas = (por_id.get(reserva_id) for _, reserva_id in self._claves[inicio:fin])
+        reservas = (r for r in reservas if r is not None and r.estado == estado)
+        parada = None if limite is None else offset + limite
+        return list(islice(reservas, offset, parada))
+
+    def __contains__(self, reserva) -> bool:
+        return reserva.id in self._por_id
+
+    def __len__(self) -> int:
+        return len(self._por_id)
+
+    def __iter__(self):
+        # Recorremos las reservas ordenadas por fecha de inicio (sobre una copia de las claves)
+        for _, reserva_id in list(self._claves):
+            reserva = self._por_id.get(reserva_id)
+            if reserva is not None:
+                yield reserva
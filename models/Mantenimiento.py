@@ -31,15 +31,29 @@ class Mantenimiento:
         if self.tipo not in ["REVISIÓN", "REPARACIÓN", "ITV", "OTRO"]:
             raise ValueError("El tipo de mantenimiento no es válido.")
 
-        # Al registrar un mantenimiento, cambiamos el estado del vehículo
+        # El mantenimiento queda programado: el vehículo no cambia de estado hasta que empiece
+        self.estado = "PROGRAMADO"  # Podrá cambiar a EN_CURSO y FINALIZADO
+
+    def iniciar_mantenimiento(self):
+        # Empieza la ventana del mantenimiento: el vehículo pasa a estar en mantenimiento
+        if self.estado != "PROGRAMADO":
+            raise ValueError("Solo se pueden iniciar mantenimientos programados.")
+        if self.vehiculo.estado not in ("DISPONIBLE", "RESERVADO", "MANTENIMIENTO"):
+            raise ValueError(f"El vehículo no puede entrar en mantenimiento (estado {self.vehiculo.estado}).")
         self.vehiculo.cambiar_estado("MANTENIMIENTO")
+        self.estado = "EN_CURSO"
 
     def finalizar_mantenimiento(self):
         # Una vez finalizado el mantenimiento, devolvemos el vehículo a disponible
-        self.vehiculo.cambiar_estado("DISPONIBLE")
+        # (salvo que se haya retirado de la flota mientras tanto)
+        if self.estado == "FINALIZADO":
+            raise ValueError("El mantenimiento ya está finalizado.")
+        if self.vehiculo.estado == "MANTENIMIENTO":
+            self.vehiculo.cambiar_estado("DISPONIBLE")
+        self.estado = "FINALIZADO"
 
     def __str__(self):
         # Mostramos un resumen del mantenimiento
         return (f"[Mantenimiento#{self.id}] Vehículo: {self.vehiculo.matricula} | "
                 f"Tipo: {self.tipo} | Desde: {self.fecha_inicio.date()} Hasta: {self.fecha_fin.date()} | "
-                f"Coste: {self.coste:.2f}€ | Motivo: {self.motivo}")
+                f"Coste: {self.coste:.2f}€ | Estado: {self.estado} | Motivo: {self.motivo}")
@@ -1,12 +1,17 @@
 from __future__ import annotations
 from datetime import datetime
+from typing import Optional
 from uuid import uuid4, UUID
 
 
 class Reserva:
     # Clase que representa una reserva dentro del sistema de alquiler. En ella gestionamos la relación entre un cliente, un vehículo y las fechas del alquiler.
 
-    def __init__(self, cliente, vehiculo, fecha_inicio: str, fecha_fin: str, tarifa, sucursal_recogida, sucursal_devolucion):
+    # Precio base ya cotizado (precios dinámicos). Como atributo de clase, las reservas guardadas antes de tenerlo cargan sin él
+    precio_base: Optional[float] = None
+
+    def __init__(self, cliente, vehiculo, fecha_inicio: str, fecha_fin: str, tarifa, sucursal_recogida, sucursal_devolucion,
+                 precio_base: float = None):
         # Asignamos un ID incremental a la reserva
         self.id: UUID = uuid4()
 
@@ -29,9 +34,11 @@ class Reserva:
         if self.fecha_fin <= self.fecha_inicio:
             raise ValueError("La fecha de fin debe ser posterior a la fecha de inicio.")
 
-        # Calculamos la duración total y el coste estimado usando la tarifa
+        # Calculamos la duración total y el coste estimado usando la tarifa.
+        # Si hay un precio base ya cotizado (precios dinámicos), se respeta también al finalizar.
         self.dias = (self.fecha_fin - self.fecha_inicio).days
-        self.total_estimado = self.tarifa.calcular_precio(self.dias)
+        self.precio_base = precio_base
+        self.total_estimado = self.tarifa.calcular_precio(self.dias, precio_base=precio_base)
 
         # Estado inicial de la reserva
         self.estado = "ACTIVA"  # Podrá cambiar a FINALIZADA o CANCELADA
@@ -42,12 +49,17 @@ class Reserva:
         self.metodo_pago = None
 
     def finalizar_reserva(self, km_recorridos: float = 0, retraso_dias: int = 0, combustible_correcto: bool = True):
+        # Solo tiene sentido finalizar una reserva que siga activa (evitamos cobrar dos veces)
+        if self.estado != "ACTIVA":
+            raise ValueError("Solo se pueden finalizar reservas activas.")
+
         # Calculamos el coste final utilizando la tarifa, teniendo en cuenta días, km, retrasos y combustible
         coste_final = self.tarifa.calcular_precio(
             self.dias,
             km_recorridos=km_recorridos,
             retraso_dias=retraso_dias,
-            combustible_correcto=combustible_correcto
+            combustible_correcto=combustible_correcto,
+            precio_base=self.precio_base
         )
 
         # Cambiamos el estado de la reserva y guardamos el total final
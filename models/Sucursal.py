@@ -1,11 +1,19 @@
 from __future__ import annotations
+from typing import Optional
 from uuid import uuid4, UUID
 
+from models.IndiceReservas import IndiceReservas
+
 
 class Sucursal:
     # Clase que representa una sucursal dentro del sistema de alquiler. Cada sucursal tiene su propio inventario de vehículos y gestiona las reservas locales.
 
-    def __init__(self, nombre: str, direccion: str, telefono: str):
+    # Coordenadas (opcionales). Como atributos de clase, las sucursales guardadas antes de tenerlas cargan sin ellas
+    latitud: Optional[float] = None
+    longitud: Optional[float] = None
+
+    def __init__(self, nombre: str, direccion: str, telefono: str,
+                 latitud: Optional[float] = None, longitud: Optional[float] = None):
         # Asignamos un ID incremental a cada sucursal
         self.id: UUID = uuid4()
 
@@ -14,9 +22,9 @@ class Sucursal:
         self.direccion = direccion.strip()
         self.telefono = telefono.strip()
 
-        # Creamos listas para almacenar los vehículos y las reservas de esta sucursal
-        self.vehiculos = []
-        self.reservas = []
+        # Inventario de vehículos (ID -> Vehículo) e índice de reservas de esta sucursal
+        self.vehiculos = {}
+        self.reservas = IndiceReservas()
 
         # Validamos los datos básicos
         if not self.nombre:
@@ -25,19 +33,38 @@ class Sucursal:
             raise ValueError("La dirección no puede estar vacía.")
         if not self.telefono:
             raise ValueError("El teléfono no puede estar vacío.")
+        self.ubicar(latitud, longitud)
+
+    def ubicar(self, latitud: Optional[float], longitud: Optional[float]):
+        # Fijamos (o quitamos, con None) las coordenadas de la sucursal. Si se dan, tienen que venir las dos
+        if (latitud is None) != (longitud is None):
+            raise ValueError("Hay que indicar latitud y longitud a la vez.")
+        if latitud is not None and not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+            raise ValueError("Coordenadas no válidas: latitud entre -90 y 90 y longitud entre -180 y 180.")
+        self.latitud = latitud
+        self.longitud = longitud
 
     def agregar_vehiculo(self, vehiculo):
         # Añadimos un vehículo al inventario de la sucursal
-        self.vehiculos.append(vehiculo)
+        self.vehiculos[vehiculo.id] = vehiculo
         vehiculo.sucursal = self  # Asociamos el vehículo con esta sucursal
 
+    def quitar_vehiculo(self, vehiculo):
+        # Sacamos un vehículo del inventario de la sucursal (si estaba)
+        self.vehiculos.pop(vehiculo.id, None)
+
     def registrar_reserva(self, reserva):
         # Asociamos una reserva a la sucursal
-        self.reservas.append(reserva)
+        self.reservas.agregar(reserva)
+
+    def eliminar_reserva(self, reserva):
+        # Desvinculamos una reserva de la sucursal (por ejemplo, al cancelarla)
+        self.reservas.eliminar(reserva)
 
     def listar_vehiculos_disponibles(self):
-        # Devolvemos solo los vehículos que estén disponibles
-        return [v for v in self.vehiculos if v.estado == "DISPONIBLE"]
+        # Devolvemos solo los vehículos que estén disponibles (copiamos la lista de golpe para que
+        # un alta o baja simultánea en el inventario no interrumpa el recorrido)
+        return [v for v in list(self.vehiculos.values()) if v.estado == "DISPONIBLE"]
 
     def __str__(self):
         # Mostramos la información principal de la sucursal
@@ -1,4 +1,5 @@
 from __future__ import annotations
+from typing import Optional
 from uuid import uuid4, UUID
 
 
@@ -32,7 +33,8 @@ class Tarifa:
             raise ValueError("Los valores de recargos y penalizaciones deben ser no negativos.")
 
     def calcular_precio(self, dias: int, km_recorridos: float = 0,
-                        retraso_dias: int = 0, combustible_correcto: bool = True) -> float:
+                        retraso_dias: int = 0, combustible_correcto: bool = True,
+                        precio_base: Optional[float] = None) -> float:
         # Calculamos el precio total del alquiler según los días, kilómetros y penalizaciones
         if dias <= 0:
             raise ValueError("El número de días debe ser mayor que cero.")
@@ -40,7 +42,8 @@ class Tarifa:
             raise ValueError("Los valores de km o retraso no pueden ser negativos.")
 
         # Calculamos el precio base multiplicando los días por el precio diario
-        total = dias * self.precio_diario
+        # (salvo que ya venga calculado día a día, por ejemplo con precios dinámicos)
+        total = dias * self.precio_diario if precio_base is None else precio_base
 
         # Si el cliente supera los kilómetros incluidos, aplicamos un coste adicional por cada km extra
         if km_recorridos > self.km_incluidos * dias:
@@ -1,6 +1,8 @@
 from __future__ import annotations
 from uuid import uuid4, UUID
 
+from models.IndiceReservas import IndiceReservas
+
 
 class Usuario:
     # Clase base que representa a cualquier usuario del sistema de alquiler. Aquí guardamos la información general y el comportamiento común a clientes y administradores.
@@ -46,7 +48,7 @@ class Cliente(Usuario):
         # Guardamos los datos específicos del cliente
         self.licencia = licencia.strip()
         self.direccion = direccion.strip()
-        self.reservas = []  # Aquí iremos guardando las reservas que haga el cliente
+        self.reservas = IndiceReservas()  # Reservas del cliente, por ID y ordenadas por fecha
 
         # Validamos los nuevos campos
         if not self.licencia:
@@ -56,7 +58,11 @@ class Cliente(Usuario):
 
     def agregar_reserva(self, reserva):
         # Asociamos una reserva al cliente
-        self.reservas.append(reserva)
+        self.reservas.agregar(reserva)
+
+    def eliminar_reserva(self, reserva):
+        # Desvinculamos una reserva del cliente (por ejemplo, al cancelarla)
+        self.reservas.eliminar(reserva)
 
     def __str__(self):
         # Mostramos los datos principales del cliente
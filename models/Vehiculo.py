@@ -2,6 +2,11 @@ from __future__ import annotations
 from uuid import uuid4, UUID
 
 
+def normalizar_matricula(matricula: str) -> str:
+    # Normalizamos la matrícula para compararla: mayúsculas y sin espacios ni guiones ("1234-abc" -> "1234ABC")
+    return "".join(c for c in matricula.upper() if c.isalnum())
+
+
 class Vehiculo:
     # Clase base que representa un vehículo dentro de nuestro sistema de alquiler.
     # Aquí reunimos la información general de cualquier vehículo y las funciones que nos permiten controlar su estado y kilometraje.
@@ -31,7 +36,8 @@ class Vehiculo:
 
     def cambiar_estado(self, nuevo_estado: str):
         # Cambiamos el estado del vehículo (por ejemplo: disponible, alquilado, en mantenimiento...)
-        estados_validos = ["DISPONIBLE", "RESERVADO", "ALQUILADO", "MANTENIMIENTO"]
+        # RETIRADO indica que el vehículo se ha dado de baja pero conservamos su historial
+        estados_validos = ["DISPONIBLE", "RESERVADO", "ALQUILADO", "MANTENIMIENTO", "RETIRADO"]
         if nuevo_estado.upper() not in estados_validos:
             raise ValueError(f"Estado '{nuevo_estado}' no válido.")
         self.estado = nuevo_estado.upper()
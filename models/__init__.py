@@ -1,7 +1,8 @@
 # Importamos todas las clases principales del módulo models
 from .Usuario import Usuario, Cliente, Administrador
-from .Vehiculo import Vehiculo, Coche, Moto, Furgoneta
+from .Vehiculo import Vehiculo, Coche, Moto, Furgoneta, normalizar_matricula
 from .Reserva import Reserva
+from .IndiceReservas import IndiceReservas
 from .Sucursal import Sucursal
 from .Tarifa import Tarifa
 from .Mantenimiento import Mantenimiento
@@ -0,0 +1,125 @@
+from __future__ import annotations
+import heapq
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+
+class TotalesVehiculo:
+    # Acumulados de un vehículo desde que entró en la flota: lo que ha facturado (reservas
+    # finalizadas), lo que ha costado mantenerlo (mantenimientos registrados) y cuánto se ha usado.
+
+    def __init__(self, vehiculo, alta: Optional[datetime] = None):
+        self.vehiculo = vehiculo
+        self.alta = alta or datetime.now()
+        self.ingresos = 0.0
+        self.coste_mantenimiento = 0.0
+        self.alquileres = 0
+        self.dias_alquilado = 0
+        self.km_recorridos = 0.0
+        self.mantenimientos = 0
+
+    @property
+    def beneficio(self) -> float:
+        return self.ingresos - self.coste_mantenimiento
+
+    def dias_en_flota(self, ahora: Optional[datetime] = None) -> int:
+        # Contamos el día del alta, para que un vehículo recién llegado no divida entre cero
+        return max(1, ((ahora or datetime.now()) - self.alta).days + 1)
+
+    def utilizacion(self, ahora: Optional[datetime] = None) -> float:
+        # Fracción de los días en la flota que ha estado alquilado
+        return min(1.0, self.dias_alquilado / self.dias_en_flota(ahora))
+
+
+class AgregadosVehiculo:
+    # Totales de rentabilidad de cada vehículo, actualizados al finalizar una reserva o registrar un
+    # mantenimiento, así que consultarlos no exige cruzar todas las reservas y mantenimientos.
+    # Para el ranking de los menos rentables guardamos una cola de prioridad por beneficio: cuando
+    # cambian los totales de un vehículo añadimos una entrada nueva con otra versión y la antigua se
+    # descarta al salir (igual que en el planificador de mantenimiento). Los k primeros salen en O(k log n).
+    # El servicio la protege con su cerrojo.
+
+    def __init__(self):
+        self._totales: Dict[UUID, TotalesVehiculo] = {}
+        # Cola de prioridad de (beneficio, orden, vehículo, versión)
+        self._cola: List[Tuple[float, int, UUID, int]] = []
+        self._versiones: Dict[UUID, int] = {}
+        self._orden = 0
+
+    def agregar(self, vehiculo, totales: Optional[TotalesVehiculo] = None):
+        # Empezamos a acumular un vehículo (con los totales que ya traiga, si viene de otro servicio)
+        if totales is None:
+            totales = TotalesVehiculo(vehiculo)
+        totales.vehiculo = vehiculo
+        self._totales[vehiculo.id] = totales
+        self._encolar(vehiculo.id)
+
+    def eliminar(self, vehiculo_id: UUID) -> Optional[TotalesVehiculo]:
+        # Dejamos de seguir un vehículo; devolvemos sus totales y sus entradas de la cola caducan
+        return self._totales.pop(vehiculo_id, None)
+
+    def retirar(self, vehiculo_id: UUID):
+        # Un vehículo retirado conserva sus totales pero ya no entra en el ranking
+        if vehiculo_id in self._totales:
+            self._versiones[vehiculo_id] += 1
+
+    def registrar_reserva(self, reserva, km_recorridos: float):
+        totales = self._totales.get(reserva.vehiculo.id)
+        if totales is None:
+            return
+        totales.ingresos += reserva.total_final or 0.0
+        totales.alquileres += 1
+        totales.dias_alquilado += reserva.dias
+        totales.km_recorridos += km_recorridos
+        self._encolar(reserva.vehiculo.id)
+
+    def registrar_mantenimiento(self, mantenimiento):
+        totales = self._totales.get(mantenimiento.vehiculo.id)
+        if totales is None:
+            return
+        totales.coste_mantenimiento += mantenimiento.coste
+        totales.mantenimientos += 1
+        self._encolar(mantenimiento.vehiculo.id)
+
+    def obtener(self, vehiculo_id: UUID) -> TotalesVehiculo:
+        totales = self._totales.get(vehiculo_id)
+        if totales is None:
+            raise ValueError("Vehículo no encontrado.")
+        return totales
+
+    def menos_rentables(self, limite: int = 10) -> List[TotalesVehiculo]:
+        # Vehículos en flota de menor a mayor beneficio. Solo sacamos de la cola lo que vamos a devolver
+        resultado, revisadas = [], []
+        while self._cola and len(resultado) < limite:
+            entrada = heapq.heappop(self._cola)
+            if not self._vigente(entrada):
+                continue  # entrada caducada: la descartamos
+            revisadas.append(entrada)
+            resultado.append(self._totales[entrada[2]])
+
+        # Las entradas vigentes vuelven a la cola: consultar no cambia el ranking
+        for entrada in revisadas:
+            heapq.heappush(self._cola, entrada)
+        return resultado
+
+    def _encolar(self, vehiculo_id: UUID):
+        totales = self._totales[vehiculo_id]
+        version = self._versiones.get(vehiculo_id, 0) + 1
+        self._versiones[vehiculo_id] = version
+        if totales.vehiculo.estado == "RETIRADO":
+            return
+        self._orden += 1
+        heapq.heappush(self._cola, (totales.beneficio, self._orden, vehiculo_id, version))
+        # Si se acumulan demasiadas entradas caducadas, reconstruimos la cola solo con las vigentes
+        if len(self._cola) > 4 * len(self._totales) + 1024:
+            self._cola = [e for e in self._cola if self._vigente(e)]
+            heapq.heapify(self._cola)
+
+    def _vigente(self, entrada) -> bool:
+        # Una entrada vale si el vehículo sigue en la flota y es la última versión de sus totales
+        _, _, vehiculo_id, version = entrada
+        return vehiculo_id in self._totales and self._versiones.get(vehiculo_id) == version
+
+    def __len__(self) -> int:
+        return len(self._totales)
@@ -1,46 +1,214 @@
 from __future__ import annotations
-from typing import Dict, Optional
+import gc
+import heapq
+import logging
+import mmap
+import os
+import pickle
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
 from uuid import UUID
 
 from models.Usuario import Usuario, Cliente, Administrador
-from models.Vehiculo import Vehiculo, Coche, Moto, Furgoneta
+from models.Vehiculo import Vehiculo, Coche, Moto, Furgoneta, normalizar_matricula
 from models.Reserva import Reserva
 from models.Sucursal import Sucursal
 from models.Tarifa import Tarifa
 from models.Mantenimiento import Mantenimiento
+from services.Eventos import Evento, BufferEventos
+from services.BuscadorVehiculos import BuscadorVehiculos
+from services.CatalogoBinario import escribir_catalogo
+from services.CalendarioVehiculos import CalendarioVehiculos
+from services.PlanificadorMantenimiento import PlanificadorMantenimiento
+from services.Excepciones import ConflictoMantenimiento, VehiculoNoDisponible
+from services.IndiceDisponibilidad import IndiceDisponibilidad
+from services.ListaEspera import ListaEspera, SolicitudEspera
+from services.IndiceEspacial import IndiceEspacial
+from services.AgregadosVehiculo import AgregadosVehiculo, TotalesVehiculo
+from services.ColeccionVersionada import ColeccionVersionada, Instantanea, RelojVersiones
+from services.MotorPrecios import DIAS_MAXIMOS, MotorPrecios, Temporada
+
+logger = logging.getLogger(__name__)
+
+# Colecciones principales del servicio: se pueden leer en instantáneas sin bloquear a los escritores
+COLECCIONES = ("usuarios", "vehiculos", "reservas", "sucursales", "tarifas", "mantenimientos")
+
+# Versión del formato de guardar_estado: hay que subirla cada vez que cambian los atributos guardados.
+# Un estado de otra versión no se convierte, se rechaza al cargarlo
+FORMATO_ESTADO = 1
 
 
 class AlquilerServicio:
     # Clase principal del sistema. Desde aquí gestionamos usuarios, vehículos, tarifas, reservas, sucursales y mantenimientos.
 
     def __init__(self):
-        # Creamos diccionarios para organizar los datos de forma sencilla
-        self.usuarios: Dict[UUID, Usuario] = {}        # UUID -> Usuario
-        self.vehiculos: Dict[UUID, Vehiculo] = {}      # UUID -> Vehículo
-        self.reservas: Dict[UUID, Reserva] = {}        # UUID -> Reserva
-        self.sucursales: Dict[UUID, Sucursal] = {}     # UUID -> Sucursal
-        self.tarifas: Dict[UUID, Tarifa] = {}          # UUID -> Tarifa
-        self.mantenimientos: Dict[UUID, Mantenimiento] = {}  # UUID -> Mantenimiento
+        # Creamos diccionarios para organizar los datos de forma sencilla. Son diccionarios versionados
+        # que comparten un reloj: los listados y exportaciones los recorren sobre una instantánea
+        # (ver services/ColeccionVersionada.py) mientras otros hilos siguen escribiendo
+        self._reloj = RelojVersiones()
+        self.usuarios: Dict[UUID, Usuario] = ColeccionVersionada(reloj=self._reloj)        # UUID -> Usuario
+        self.vehiculos: Dict[UUID, Vehiculo] = ColeccionVersionada(reloj=self._reloj)      # UUID -> Vehículo
+        self.reservas: Dict[UUID, Reserva] = ColeccionVersionada(reloj=self._reloj)        # UUID -> Reserva
+        self.sucursales: Dict[UUID, Sucursal] = ColeccionVersionada(reloj=self._reloj)     # UUID -> Sucursal
+        self.tarifas: Dict[UUID, Tarifa] = ColeccionVersionada(reloj=self._reloj)          # UUID -> Tarifa
+        self.mantenimientos: Dict[UUID, Mantenimiento] = ColeccionVersionada(reloj=self._reloj)  # UUID -> Mantenimiento
+
+        # Índice de matrículas normalizadas (matrícula -> UUID vehículo), garantiza que no se repitan
+        self._vehiculos_por_matricula: Dict[str, UUID] = {}
+
+        # Cerrojo para que las operaciones que modifican el estado no se pisen entre hilos
+        self._lock = threading.RLock()
+
+        # Reservas activas de cada vehículo (UUID vehículo -> {UUID reserva -> Reserva})
+        self._reservas_activas: Dict[UUID, Dict[UUID, Reserva]] = {}
+
+        # Índice de búsqueda por matrícula, marca y modelo
+        self.buscador = BuscadorVehiculos()
+
+        # Vehículos disponibles por sucursal y categoría, para proponer alternativas sin recorrer la flota
+        self.disponibilidad = IndiceDisponibilidad()
+
+        # Clientes esperando a que quede libre un vehículo de una categoría en una sucursal
+        self.lista_espera = ListaEspera()
+
+        # Sucursales con coordenadas, para buscar las más cercanas a un punto
+        self.mapa_sucursales = IndiceEspacial()
+
+        # Calendario de ocupación de cada vehículo (reservas activas y mantenimientos pendientes)
+        # y planificador del mantenimiento preventivo de la flota
+        self.calendario = CalendarioVehiculos()
+        self.planificador = PlanificadorMantenimiento(self.calendario)
+
+        # Ingresos, costes de mantenimiento y uso acumulados de cada vehículo, para su rentabilidad
+        self.agregados = AgregadosVehiculo()
+
+        # Precios dinámicos según la ocupación de cada sucursal y categoría y las temporadas
+        self.precios = MotorPrecios()
+
+        # Mantenimientos programados pendientes de empezar, ordenados por fecha de inicio
+        self._inicios_mantenimiento: List[Tuple[datetime, UUID]] = []
+
+        # Últimos eventos del dominio, numerados, y funciones suscritas a ellos
+        self.eventos = BufferEventos()
+        self._suscriptores: List[Callable[[Evento], None]] = []
+
+    # ---------- ESTADO PRECONSTRUIDO ----------
+    def guardar_estado(self, ruta: str):
+        # Guardamos en un fichero todo el estado del servicio (datos e índices) para poder
+        # arrancar nuevas instancias sin tener que volver a cargarlo operación a operación
+        temporal = f"{ruta}.tmp"
+        with self._lock, open(temporal, "wb") as fichero:
+            pickle.dump(self, fichero, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar_estado(cls, ruta: str) -> "AlquilerServicio":
+        # Cargamos un estado guardado con guardar_estado. Proyectamos el fichero en memoria
+        # (mmap) para deserializarlo directamente desde la caché de páginas del sistema
+        # Durante la carga se crean cientos de miles de objetos de golpe; pausamos el recolector
+        # de basura porque en ese momento solo añadiría trabajo (no hay nada que liberar)
+        gc_activo = gc.isenabled()
+        gc.disable()
+        try:
+            with open(ruta, "rb") as fichero, mmap.mmap(fichero.fileno(), 0, access=mmap.ACCESS_READ) as datos:
+                servicio = pickle.loads(datos)
+        finally:
+            if gc_activo:
+                gc.enable()
+        if not isinstance(servicio, cls):
+            raise ValueError("El fichero no contiene un estado del servicio de alquiler.")
+        return servicio
+
+    def exportar_catalogo(self, ruta: str):
+        # Publicamos el catálogo binario de solo lectura (vehículos, tarifas y sucursales) que usan
+        # las réplicas de consulta (ver services/CatalogoBinario.py)
+        escribir_catalogo(self, ruta)
+
+    def __getstate__(self):
+        # Los cerrojos, los suscriptores y el buffer de eventos pertenecen al proceso en marcha: no se guardan
+        estado = self.__dict__.copy()
+        for atributo in ("_lock", "_suscriptores", "eventos"):
+            estado.pop(atributo, None)
+        estado["_formato"] = FORMATO_ESTADO
+        return estado
+
+    def __setstate__(self, estado):
+        if estado.pop("_formato", None) != FORMATO_ESTADO:
+            raise ValueError("El estado guardado es de otra versión del servicio: hay que generarlo de nuevo.")
+        self.__dict__.update(estado)
+        self._lock = threading.RLock()
+        self._suscriptores = []
+        self.eventos = BufferEventos()
+
+    def instantanea(self) -> Dict[str, Instantanea]:
+        # Vistas de todas las colecciones en la misma versión, para listados largos y exportaciones:
+        # se toman en O(1) y se recorren sin cerrojos. Los objetos son los del servicio, así que
+        # sus atributos (el estado de un vehículo, por ejemplo) pueden cambiar durante el recorrido.
+        # La versión y los registros se leen con el reloj tomado, sin ninguna escritura entre medias
+        with self._reloj.lock:
+            version = self._reloj.actual
+            return {nombre: getattr(self, nombre).instantanea(version) for nombre in COLECCIONES}
+
+    # ---------- EVENTOS ----------
+    def suscribir(self, funcion: Callable[[Evento], None]):
+        # Registramos una función que recibirá cada evento que emita el servicio
+        self._suscriptores.append(funcion)
+
+    def _emitir(self, tipo: str, /, **datos):
+        # Guardamos el evento en el buffer y lo notificamos a todos los suscriptores.
+        # Un fallo en un suscriptor no debe deshacer la operación que ya se ha realizado.
+        evento = self.eventos.publicar(tipo, datos)
+        for funcion in self._suscriptores:
+            try:
+                funcion(evento)
+            except Exception:
+                logger.exception("Error al notificar el evento %s", tipo)
+        return evento
+
+    def _cambiar_estado_vehiculo(self, vehiculo: Vehiculo, nuevo_estado: str):
+        # Cambiamos el estado del vehículo y avisamos si realmente ha cambiado
+        anterior = vehiculo.estado
+        vehiculo.cambiar_estado(nuevo_estado)
+        self._notificar_cambio_estado(vehiculo, anterior)
+
+    def _notificar_cambio_estado(self, vehiculo: Vehiculo, anterior: str):
+        # Emitimos el cambio de estado de un vehículo (si lo ha habido)
+        if vehiculo.estado != anterior:
+            self.disponibilidad.actualizar(vehiculo)
+            self._emitir("VEHICULO_ESTADO_CAMBIADO", vehiculo_id=vehiculo.id,
+                         estado_anterior=anterior, estado=vehiculo.estado)
 
     # ---------- USUARIOS ----------
     def registrar_usuario(self, tipo: str, nombre: str, email: str, password: str, licencia=None, direccion=None):
         # Registramos un nuevo cliente o administrador
-        
-        # Verificamos que no exista un usuario duplicado por email
-        for usuario in self.usuarios.values():
-            if usuario.email.lower() == email.lower():
-                raise ValueError("Ya existe un usuario con ese email.")
-        
-        if tipo.lower() == "cliente":
-            if not licencia or not direccion:
-                raise ValueError("El cliente debe tener licencia y dirección.")
-            usuario = Cliente(nombre, email, password, licencia, direccion)
-        elif tipo.lower() in ("admin", "administrador"):
-            usuario = Administrador(nombre, email, password)
-        else:
-            raise ValueError("Tipo de usuario no válido. Usa 'cliente' o 'admin'.")
+        with self._lock:
+            # Verificamos que no exista un usuario duplicado por email
+            for usuario in self.usuarios.values():
+                if usuario.email.lower() == email.lower():
+                    raise ValueError("Ya existe un usuario con ese email.")
+
+            if tipo.lower() == "cliente":
+                if not licencia or not direccion:
+                    raise ValueError("El cliente debe tener licencia y dirección.")
+                usuario = Cliente(nombre, email, password, licencia, direccion)
+            elif tipo.lower() in ("admin", "administrador"):
+                usuario = Administrador(nombre, email, password)
+            else:
+                raise ValueError("Tipo de usuario no válido. Usa 'cliente' o 'admin'.")
 
-        self.usuarios[usuario.id] = usuario
+            self.usuarios[usuario.id] = usuario
+            # Sin el email: el buffer de eventos lo leen todos los usuarios autenticados
+            self._emitir("USUARIO_REGISTRADO", usuario_id=usuario.id, tipo=type(usuario).__name__.upper())
+        return usuario
+
+    def actualizar_password(self, usuario_id: UUID, password: str):
+        # Sustituimos el hash de la contraseña de un usuario (por ejemplo, al subir el coste de bcrypt)
+        with self._lock:
+            usuario = self.obtener_usuario(usuario_id)
+            usuario.password = password
+            # Sin el hash: solo queda constancia de que ha cambiado
+            self._emitir("USUARIO_PASSWORD_CAMBIADA", usuario_id=usuario.id)
         return usuario
 
     def obtener_usuario(self, usuario_id: UUID):
@@ -62,16 +230,110 @@ class AlquilerServicio:
         return list(self.usuarios.values())
 
     # ---------- SUCURSALES ----------
-    def agregar_sucursal(self, nombre: str, direccion: str, telefono: str):
+    def agregar_sucursal(self, nombre: str, direccion: str, telefono: str,
+                         latitud: Optional[float] = None, longitud: Optional[float] = None):
         # Creamos una nueva sucursal y la guardamos en el sistema
-        sucursal = Sucursal(nombre, direccion, telefono)
-        self.sucursales[sucursal.id] = sucursal
+        sucursal = Sucursal(nombre, direccion, telefono, latitud, longitud)
+        with self._lock:
+            self.sucursales[sucursal.id] = sucursal
+            self.mapa_sucursales.actualizar(sucursal.id, sucursal.latitud, sucursal.longitud, sucursal)
+            self._emitir("SUCURSAL_CREADA", sucursal_id=sucursal.id, nombre=sucursal.nombre,
+                         latitud=sucursal.latitud, longitud=sucursal.longitud)
+        return sucursal
+
+    def ubicar_sucursal(self, sucursal_id: UUID, latitud: Optional[float], longitud: Optional[float]):
+        # Fijamos o cambiamos las coordenadas de una sucursal (por ejemplo, las que se dieron de alta sin ellas)
+        with self._lock:
+            sucursal = self.obtener_sucursal(sucursal_id)
+            sucursal.ubicar(latitud, longitud)
+            self.mapa_sucursales.actualizar(sucursal.id, sucursal.latitud, sucursal.longitud, sucursal)
+            self._emitir("SUCURSAL_UBICADA", sucursal_id=sucursal.id, latitud=latitud, longitud=longitud)
         return sucursal
 
+    def sucursales_cercanas(self, latitud: float, longitud: float, categoria: Optional[str] = None,
+                            desde: Optional[str] = None, hasta: Optional[str] = None, limite: int = 5):
+        # Sucursales más cercanas a un punto que tienen vehículos disponibles (de la categoría pedida,
+        # si se indica, y libres entre 'desde' y 'hasta', si se indican), de más cerca a más lejos.
+        # Cada resultado: {"sucursal", "distancia_km", "vehiculos_disponibles"}
+        if not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+            raise ValueError("Coordenadas no válidas: latitud entre -90 y 90 y longitud entre -180 y 180.")
+        if limite < 1:
+            raise ValueError("El límite debe ser al menos 1.")
+        if (desde is None) != (hasta is None):
+            raise ValueError("Hay que indicar las fechas desde y hasta a la vez.")
+        periodo = self._parsear_periodo(desde, hasta) if desde is not None else None
+
+        with self._lock:
+            if categoria is not None:
+                self.obtener_tarifa(categoria)
+            resultado = []
+            for distancia, sucursal in self.mapa_sucursales.por_distancia(latitud, longitud):
+                disponibles = self._contar_disponibles(sucursal, categoria, periodo)
+                if disponibles:
+                    resultado.append({"sucursal": sucursal, "distancia_km": round(distancia, 3),
+                                      "vehiculos_disponibles": disponibles})
+                    if len(resultado) == limite:
+                        break
+        return resultado
+
+    def _contar_disponibles(self, sucursal: Sucursal, categoria: Optional[str],
+                            periodo: Optional[Tuple[datetime, datetime]]) -> int:
+        # Vehículos disponibles en la sucursal (de una categoría o de todas), libres en el periodo si se da
+        if categoria is not None:
+            vehiculos = self.disponibilidad.disponibles(sucursal.id, categoria)
+        else:
+            vehiculos = [v for v in sucursal.vehiculos.values() if v.estado == "DISPONIBLE"]
+        if periodo is None:
+            return len(vehiculos)
+        return sum(1 for v in vehiculos if self.calendario.esta_libre(v.id, *periodo))
+
+    def obtener_sucursal(self, sucursal_id: UUID):
+        # Devolvemos una sucursal por su ID
+        sucursal = self.sucursales.get(sucursal_id)
+        if not sucursal:
+            raise ValueError("Sucursal no encontrada.")
+        return sucursal
+
+    def listar_sucursales(self):
+        # Como el resto de listados: una lista nueva sacada de una instantánea de la colección
+        return self.sucursales.values()
+
     # ---------- VEHÍCULOS ----------
     def registrar_vehiculo(self, tipo: str, matricula: str, marca: str, modelo: str, año: int,
                            categoria: str, km: float, sucursal, **extras):
         # Registramos un vehículo en función de su tipo
+        vehiculo = self._crear_vehiculo(tipo, matricula, marca, modelo, año, categoria, km, sucursal, **extras)
+
+        # Comprobamos y reservamos la matrícula de forma atómica frente a otros registros concurrentes
+        with self._lock:
+            if normalizar_matricula(vehiculo.matricula) in self._vehiculos_por_matricula:
+                raise ValueError("Ya existe un vehículo con esa matrícula.")
+            self._indexar_vehiculo(vehiculo, sucursal)
+        return vehiculo
+
+    def importar_vehiculos(self, datos_vehiculos):
+        # Registramos un lote de vehículos (cada elemento con los mismos campos que registrar_vehiculo).
+        # O se importan todos o ninguno: si alguno no es válido o repite matrícula, no se registra nada.
+        vehiculos = [self._crear_vehiculo(**datos) for datos in datos_vehiculos]
+
+        with self._lock:
+            vistas = set()
+            repetidas = []
+            for vehiculo in vehiculos:
+                matricula = normalizar_matricula(vehiculo.matricula)
+                if matricula in vistas or matricula in self._vehiculos_por_matricula:
+                    repetidas.append(vehiculo.matricula)
+                vistas.add(matricula)
+            if repetidas:
+                raise ValueError(f"Matrículas duplicadas: {', '.join(repetidas)}.")
+
+            for vehiculo in vehiculos:
+                self._indexar_vehiculo(vehiculo, vehiculo.sucursal)
+        return vehiculos
+
+    def _crear_vehiculo(self, tipo: str, matricula: str, marca: str, modelo: str, año: int,
+                        categoria: str, km: float, sucursal, **extras):
+        # Creamos el objeto del tipo de vehículo adecuado (sin darlo de alta todavía)
         tipo = tipo.lower()
         if tipo == "coche":
             vehiculo = Coche(matricula, marca, modelo, año, categoria, km,
@@ -84,9 +346,6 @@ class AlquilerServicio:
                                  extras.get("carga", 1000), sucursal)
         else:
             raise ValueError("Tipo de vehículo no válido.")
-
-        self.vehiculos[vehiculo.id] = vehiculo
-        sucursal.agregar_vehiculo(vehiculo)
         return vehiculo
 
     def obtener_vehiculo(self, vehiculo_id: UUID):
@@ -96,18 +355,122 @@ class AlquilerServicio:
             raise ValueError("Vehículo no encontrado.")
         return vehiculo
 
+    def obtener_vehiculo_por_matricula(self, matricula: str):
+        # Buscamos un vehículo por su matrícula (sin importar mayúsculas, espacios o guiones)
+        vehiculo_id = self._vehiculos_por_matricula.get(normalizar_matricula(matricula))
+        if vehiculo_id is None:
+            raise ValueError("No existe ningún vehículo con esa matrícula.")
+        return self.vehiculos[vehiculo_id]
+
+    def listar_vehiculos(self):
+        return self.vehiculos.values()
+
     def listar_vehiculos_disponibles(self):
         # Mostramos los vehículos disponibles de todas las sucursales
         return [v for v in self.vehiculos.values() if v.estado == "DISPONIBLE"]
 
+    def buscar_vehiculos(self, texto: str, estado: Optional[str] = None,
+                         sucursal_id: Optional[UUID] = None, limite: int = 20):
+        # Buscamos vehículos por matrícula, marca o modelo (admite prefijos, útil para autocompletar)
+        return self.buscador.buscar(texto, estado, sucursal_id, limite)
+
+    def eliminar_vehiculo(self, vehiculo_id: UUID, cascada: bool = False):
+        # Damos de baja definitiva un vehículo y lo quitamos de todos los índices.
+        # Si tiene reservas activas, solo lo eliminamos con cascada=True (las cancelamos antes).
+        with self._lock:
+            vehiculo = self.obtener_vehiculo(vehiculo_id)
+            self._liberar_reservas_activas(vehiculo, cascada)
+            self._desindexar_vehiculo(vehiculo)
+            self.buscador.eliminar(vehiculo)
+            del self._vehiculos_por_matricula[normalizar_matricula(vehiculo.matricula)]
+            del self.vehiculos[vehiculo.id]
+            self.agregados.eliminar(vehiculo.id)
+            self._emitir("VEHICULO_ELIMINADO", vehiculo_id=vehiculo.id, matricula=vehiculo.matricula)
+        return vehiculo
+
+    def retirar_vehiculo(self, vehiculo_id: UUID, cascada: bool = False):
+        # Retiramos un vehículo de la flota sin borrarlo: sale del inventario de la sucursal
+        # y deja de poder alquilarse, pero lo conservamos para el historial de reservas
+        with self._lock:
+            vehiculo = self.obtener_vehiculo(vehiculo_id)
+            if vehiculo.estado == "RETIRADO":
+                raise ValueError("El vehículo ya está retirado.")
+            self._liberar_reservas_activas(vehiculo, cascada)
+            self._desindexar_vehiculo(vehiculo)
+            self._cambiar_estado_vehiculo(vehiculo, "RETIRADO")
+            self.agregados.retirar(vehiculo.id)
+        return vehiculo
+
+    def transferir_vehiculo(self, vehiculo_id: UUID, sucursal_destino_id: UUID):
+        # Movemos un vehículo del inventario de su sucursal al de otra
+        with self._lock:
+            vehiculo = self.obtener_vehiculo(vehiculo_id)
+            destino = self.obtener_sucursal(sucursal_destino_id)
+            if vehiculo.estado == "RETIRADO":
+                raise ValueError("El vehículo está retirado de la flota.")
+            if vehiculo.id in self._reservas_activas:
+                raise ValueError("No se puede transferir un vehículo con reservas activas.")
+            self._mover_vehiculo(vehiculo, destino)
+        return vehiculo
+
+    def _mover_vehiculo(self, vehiculo: Vehiculo, destino: Sucursal):
+        # Actualizamos los inventarios de origen y destino y avisamos del traslado
+        origen = vehiculo.sucursal
+        if origen is destino:
+            return
+        if origen:
+            origen.quitar_vehiculo(vehiculo)
+            self.precios.sumar_vehiculo(origen.id, vehiculo.categoria, -1)
+        destino.agregar_vehiculo(vehiculo)
+        self.precios.sumar_vehiculo(destino.id, vehiculo.categoria)
+        self.disponibilidad.actualizar(vehiculo)
+        self._emitir("VEHICULO_TRANSFERIDO", vehiculo_id=vehiculo.id,
+                     sucursal_origen_id=origen.id if origen else None,
+                     sucursal_destino_id=destino.id)
+
+    def _liberar_reservas_activas(self, vehiculo: Vehiculo, cascada: bool):
+        # Comprobamos las reservas activas del vehículo antes de darlo de baja
+        activas = list(self._reservas_activas.get(vehiculo.id, {}))
+        if activas and not cascada:
+            raise ValueError("El vehículo tiene reservas activas. Cancélalas antes o usa cascada.")
+        # Sin pasar por la lista de espera: el vehículo se va a dar de baja
+        for reserva_id in activas:
+            self._cancelar_reserva(reserva_id)
+
+    def _indexar_vehiculo(self, vehiculo: Vehiculo, sucursal: Sucursal):
+        # Damos de alta el vehículo en el sistema y en el inventario de su sucursal
+        self.vehiculos[vehiculo.id] = vehiculo
+        self._vehiculos_por_matricula[normalizar_matricula(vehiculo.matricula)] = vehiculo.id
+        sucursal.agregar_vehiculo(vehiculo)
+        self.precios.sumar_vehiculo(sucursal.id, vehiculo.categoria)
+        self.buscador.agregar(vehiculo)
+        self.planificador.agregar(vehiculo)
+        self.agregados.agregar(vehiculo)
+        self.disponibilidad.actualizar(vehiculo)
+        self._emitir("VEHICULO_REGISTRADO", vehiculo_id=vehiculo.id, matricula=vehiculo.matricula,
+                     categoria=vehiculo.categoria, sucursal_id=sucursal.id)
+
+    def _desindexar_vehiculo(self, vehiculo: Vehiculo):
+        # Quitamos el vehículo del inventario de su sucursal y de los índices auxiliares
+        if vehiculo.sucursal and vehiculo.id in vehiculo.sucursal.vehiculos:
+            vehiculo.sucursal.quitar_vehiculo(vehiculo)
+            self.precios.sumar_vehiculo(vehiculo.sucursal.id, vehiculo.categoria, -1)
+        self._reservas_activas.pop(vehiculo.id, None)
+        self.disponibilidad.quitar(vehiculo)
+        self.calendario.eliminar_vehiculo(vehiculo.id)
+        self.planificador.eliminar(vehiculo.id)
+
     # ---------- TARIFAS ----------
     def crear_tarifa(self, nombre: str, categoria: str, precio_diario: float,
                      km_incluidos: float = 300.0, coste_km_extra: float = 0.10,
                      recargo_retraso: float = 20.0, penalizacion_comb: float = 30.0):
         # Creamos una nueva tarifa y la añadimos al sistema
-        tarifa = Tarifa(nombre, categoria, precio_diario, km_incluidos,
-                        coste_km_extra, recargo_retraso, penalizacion_comb)
-        self.tarifas[tarifa.id] = tarifa
+        with self._lock:
+            tarifa = Tarifa(nombre, categoria, precio_diario, km_incluidos,
+                            coste_km_extra, recargo_retraso, penalizacion_comb)
+            self.tarifas[tarifa.id] = tarifa
+            self._emitir("TARIFA_CREADA", tarifa_id=tarifa.id, nombre=tarifa.nombre, categoria=tarifa.categoria,
+                         precio_diario=tarifa.precio_diario)
         return tarifa
 
     def obtener_tarifa(self, categoria: str):
@@ -117,80 +480,510 @@ class AlquilerServicio:
                 return tarifa
         raise ValueError("No existe una tarifa para esa categoría.")
 
+    def listar_tarifas(self):
+        return self.tarifas.values()
+
     # ---------- RESERVAS ----------
     def realizar_reserva(self, cliente_id: UUID, vehiculo_id: UUID,
                          fecha_inicio: str, fecha_fin: str, id_sucursal_devolucion: UUID):
         # Creamos una nueva reserva si el vehículo está disponible
-        cliente = self.usuarios.get(cliente_id)
-        vehiculo = self.vehiculos.get(vehiculo_id)
-        sucursal_recogida = vehiculo.sucursal if vehiculo else None
-        sucursal_devolucion = self.sucursales.get(id_sucursal_devolucion)
-
-        if not cliente or not isinstance(cliente, Cliente):
-            raise ValueError("El usuario debe ser un cliente válido.")
-        if not vehiculo or vehiculo.estado != "DISPONIBLE":
-            raise ValueError("El vehículo no está disponible.")
-        if not sucursal_devolucion:
-            raise ValueError("Sucursal de devolución no válida.")
-
-        # Obtenemos la tarifa correspondiente
-        tarifa = self.obtener_tarifa(vehiculo.categoria)
-        reserva = Reserva(cliente, vehiculo, fecha_inicio, fecha_fin, tarifa,
-                          sucursal_recogida, sucursal_devolucion)
-
-        # Asociamos la reserva con cliente, vehículo y sucursales
-        self.reservas[reserva.id] = reserva
-        cliente.agregar_reserva(reserva)
-        vehiculo.cambiar_estado("RESERVADO")
-        sucursal_recogida.registrar_reserva(reserva)
-        sucursal_devolucion.registrar_reserva(reserva)
+        with self._lock:
+            cliente = self.usuarios.get(cliente_id)
+            vehiculo = self.vehiculos.get(vehiculo_id)
+            sucursal_recogida = vehiculo.sucursal if vehiculo else None
+            sucursal_devolucion = self.sucursales.get(id_sucursal_devolucion)
+
+            if not cliente or not isinstance(cliente, Cliente):
+                raise ValueError("El usuario debe ser un cliente válido.")
+            if not vehiculo:
+                raise ValueError("El vehículo no está disponible.")
+            if vehiculo.estado != "DISPONIBLE":
+                # Junto con el rechazo devolvemos otros vehículos libres en esas fechas,
+                # para que el cliente no tenga que volver a pedir el listado de la flota
+                inicio, fin = self._parsear_periodo(fecha_inicio, fecha_fin)
+                raise VehiculoNoDisponible("El vehículo no está disponible.",
+                                           self._alternativas(vehiculo, inicio, fin))
+            if not sucursal_devolucion:
+                raise ValueError("Sucursal de devolución no válida.")
+
+            # Obtenemos la tarifa correspondiente y el precio según la ocupación y la temporada de esos días
+            tarifa = self.obtener_tarifa(vehiculo.categoria)
+            inicio, fin = self._parsear_periodo(fecha_inicio, fecha_fin)
+            cotizacion = self.precios.cotizar(tarifa, sucursal_recogida.id, inicio, fin)
+            reserva = Reserva(cliente, vehiculo, fecha_inicio, fecha_fin, tarifa,
+                              sucursal_recogida, sucursal_devolucion, precio_base=cotizacion["total"])
+
+            # Las fechas no pueden solaparse con un mantenimiento programado (ni con otra reserva)
+            self._comprobar_calendario(vehiculo, reserva.fecha_inicio, reserva.fecha_fin,
+                                       "El vehículo no está libre en esas fechas.")
+
+            # Asociamos la reserva con cliente, vehículo y sucursales
+            self.reservas[reserva.id] = reserva
+            self._reservas_activas.setdefault(vehiculo.id, {})[reserva.id] = reserva
+            self.calendario.agregar(vehiculo.id, reserva.id, reserva.fecha_inicio, reserva.fecha_fin)
+            self.precios.registrar_reserva(reserva)
+            cliente.agregar_reserva(reserva)
+            self._cambiar_estado_vehiculo(vehiculo, "RESERVADO")
+            sucursal_recogida.registrar_reserva(reserva)
+            sucursal_devolucion.registrar_reserva(reserva)
 
+            self._emitir("RESERVA_CREADA", reserva_id=reserva.id, cliente_id=cliente.id,
+                         vehiculo_id=vehiculo.id, sucursal_recogida_id=sucursal_recogida.id,
+                         sucursal_devolucion_id=sucursal_devolucion.id,
+                         fecha_inicio=fecha_inicio, fecha_fin=fecha_fin,
+                         total_estimado=reserva.total_estimado)
         return reserva
 
-    def finalizar_reserva(self, reserva_id: UUID, km_recorridos=0, retraso_dias=0,
-                          combustible_correcto=True, metodo_pago="Tarjeta"):
-        # Finalizamos una reserva activa y registramos el pago
+    def cotizar_reserva(self, sucursal_id: UUID, categoria: str, fecha_inicio: str, fecha_fin: str):
+        # Presupuesto día a día de un alquiler con precios dinámicos, sin reservar nada
+        with self._lock:
+            sucursal = self.obtener_sucursal(sucursal_id)
+            tarifa = self.obtener_tarifa(categoria)
+            inicio, fin = self._parsear_periodo(fecha_inicio, fecha_fin)
+            return self.precios.cotizar(tarifa, sucursal.id, inicio, fin)
+
+    def buscar_alternativas(self, vehiculo_id: UUID, fecha_inicio: str, fecha_fin: str, limite: int = 10):
+        # Vehículos que pueden sustituir a uno en esas fechas, ordenados de mejor a peor alternativa
+        if limite < 1:
+            raise ValueError("El límite debe ser al menos 1.")
+        with self._lock:
+            vehiculo = self.obtener_vehiculo(vehiculo_id)
+            inicio, fin = self._parsear_periodo(fecha_inicio, fecha_fin)
+            return self._alternativas(vehiculo, inicio, fin, limite)
+
+    def agregar_temporada(self, nombre: str, inicio: str, fin: str, multiplicador: float,
+                          sucursal_id: Optional[UUID] = None, categoria: Optional[str] = None):
+        # Configuramos una temporada de precios (se repite cada año entre las fechas "MM-DD")
+        with self._lock:
+            if sucursal_id is not None:
+                self.obtener_sucursal(sucursal_id)
+            temporada = self.precios.agregar_temporada(
+                Temporada(nombre, inicio, fin, multiplicador, sucursal_id, categoria))
+            self._emitir("TEMPORADA_CREADA", temporada_id=temporada.id, nombre=temporada.nombre,
+                         multiplicador=temporada.multiplicador, sucursal_id=sucursal_id, categoria=temporada.categoria)
+        return temporada
+
+    def listar_temporadas(self):
+        with self._lock:
+            return list(self.precios.temporadas.values())
+
+    def eliminar_temporada(self, temporada_id: UUID):
+        with self._lock:
+            self.precios.eliminar_temporada(temporada_id)
+            self._emitir("TEMPORADA_ELIMINADA", temporada_id=temporada_id)
+
+    def obtener_reserva(self, reserva_id: UUID):
+        # Devolvemos una reserva por su ID
         reserva = self.reservas.get(reserva_id)
         if not reserva:
             raise ValueError("La reserva no existe.")
+        return reserva
+
+    def listar_reservas(self):
+        return self.reservas.values()
+
+    def cancelar_reserva(self, reserva_id: UUID):
+        # Cancelamos una reserva activa y liberamos el vehículo para que se pueda volver a alquilar
+        # (o para dárselo al primero de la lista de espera)
+        with self._lock:
+            reserva = self._cancelar_reserva(reserva_id)
+            self._atender_lista_espera([reserva.vehiculo])
+        return reserva
+
+    def _cancelar_reserva(self, reserva_id: UUID):
+        reserva = self.obtener_reserva(reserva_id)
+        reserva.cancelar_reserva()
+        self._quitar_reserva_activa(reserva)
+
+        # El vehículo vuelve a estar disponible si seguía reservado por esta reserva
+        if reserva.vehiculo.estado == "RESERVADO":
+            self._cambiar_estado_vehiculo(reserva.vehiculo, "DISPONIBLE")
+
+        # La reserva sigue en el historial del cliente y de las sucursales (se puede filtrar con estado=CANCELADA)
+        self._emitir("RESERVA_CANCELADA", reserva_id=reserva.id, cliente_id=reserva.cliente.id,
+                     vehiculo_id=reserva.vehiculo.id)
+        return reserva
+
+    def listar_reservas_cliente(self, cliente_id: UUID, desde: Optional[str] = None,
+                                hasta: Optional[str] = None, estado: Optional[str] = None,
+                                offset: int = 0, limite: Optional[int] = None):
+        # Historial de reservas de un cliente en una ventana de fechas (por fecha de inicio)
+        cliente = self.obtener_usuario(cliente_id)
+        if not isinstance(cliente, Cliente):
+            raise ValueError("El usuario no es un cliente.")
+        return cliente.reservas.rango(self._parsear_fecha(desde), self._parsear_fecha(hasta),
+                                      estado, offset, limite)
+
+    def listar_reservas_sucursal(self, sucursal_id: UUID, desde: Optional[str] = None,
+                                 hasta: Optional[str] = None, estado: Optional[str] = None,
+                                 offset: int = 0, limite: Optional[int] = None):
+        # Historial de reservas de una sucursal (recogidas y devoluciones) en una ventana de fechas
+        sucursal = self.obtener_sucursal(sucursal_id)
+        return sucursal.reservas.rango(self._parsear_fecha(desde), self._parsear_fecha(hasta),
+                                       estado, offset, limite)
+
+    @staticmethod
+    def _parsear_fecha(fecha: Optional[str]):
+        # Convertimos una fecha "YYYY-MM-DD" opcional en datetime
+        if fecha is None:
+            return None
+        try:
+            return datetime.strptime(fecha, "%Y-%m-%d")
+        except ValueError:
+            raise ValueError(f"Fecha '{fecha}' no válida. Usa el formato YYYY-MM-DD.")
+
+    def _parsear_periodo(self, fecha_inicio: str, fecha_fin: str) -> Tuple[datetime, datetime]:
+        # Convertimos las fechas de un alquiler comprobando que el periodo no esté vacío
+        inicio = self._parsear_fecha(fecha_inicio)
+        fin = self._parsear_fecha(fecha_fin)
+        if inicio is None or fin is None:
+            raise ValueError("Hay que indicar las fechas de inicio y fin.")
+        if fin <= inicio:
+            raise ValueError("La fecha de fin debe ser posterior a la fecha de inicio.")
+        if (fin - inicio).days > DIAS_MAXIMOS:
+            raise ValueError(f"El alquiler no puede durar más de {DIAS_MAXIMOS} días.")
+        return inicio, fin
+
+    def finalizar_reserva(self, reserva_id: UUID, km_recorridos=0, retraso_dias=0,
+                          combustible_correcto=True, metodo_pago="Tarjeta"):
+        # Finalizamos una reserva activa y registramos el pago
+        with self._lock:
+            reserva = self._cerrar_reserva(reserva_id, km_recorridos, retraso_dias,
+                                           combustible_correcto, metodo_pago)
+
+            # Actualizamos el kilometraje y el estado del vehículo
+            self._aplicar_devoluciones([(reserva, km_recorridos)])
+            self._atender_lista_espera([reserva.vehiculo])
+
+            # Devolvemos un pequeño resumen del pago realizado
+            return self._resumen_pago(reserva)
+
+    def finalizar_reservas_lote(self, devoluciones):
+        # Finalizamos varias reservas de una vez (por ejemplo, al cierre de la sucursal).
+        # Cada devolución es un diccionario con "reserva_id" y, opcionalmente, los mismos
+        # parámetros que finalizar_reserva. Un fallo en una devolución no deshace las demás.
+        with self._lock:
+            resultados = []
+            cerradas = []
+
+            for devolucion in devoluciones:
+                reserva_id = devolucion.get("reserva_id")
+                km_recorridos = devolucion.get("km_recorridos", 0)
+                try:
+                    reserva = self._cerrar_reserva(
+                        reserva_id,
+                        km_recorridos,
+                        devolucion.get("retraso_dias", 0),
+                        devolucion.get("combustible_correcto", True),
+                        devolucion.get("metodo_pago", "Tarjeta"),
+                    )
+                except ValueError as exc:
+                    resultados.append({"reserva_id": reserva_id, "correcta": False, "error": str(exc)})
+                    continue
 
-        # Calculamos el total final con la nueva versión de Tarifa
-        total = reserva.finalizar_reserva(km_recorridos, retraso_dias, combustible_correcto)
+                cerradas.append((reserva, km_recorridos))
+                resultados.append({"reserva_id": reserva_id, "correcta": True, "pago": self._resumen_pago(reserva)})
 
-        # Actualizamos el kilometraje y el estado del vehículo
-        reserva.vehiculo.actualizar_kilometraje(km_recorridos)
-        reserva.vehiculo.cambiar_estado("DISPONIBLE")
+            # Actualizamos vehículos en una única pasada con todas las reservas cerradas
+            self._aplicar_devoluciones(cerradas)
+            self._atender_lista_espera([reserva.vehiculo for reserva, _ in cerradas])
+        return resultados
 
-        # Registramos el pago
+    def _cerrar_reserva(self, reserva_id: UUID, km_recorridos, retraso_dias,
+                        combustible_correcto, metodo_pago):
+        # Calculamos el total final y registramos el pago de una reserva
+        reserva = self.obtener_reserva(reserva_id)
+        reserva.finalizar_reserva(km_recorridos, retraso_dias, combustible_correcto)
         reserva.registrar_pago(metodo_pago)
+        self._emitir("PAGO_REGISTRADO", reserva_id=reserva.id, cliente_id=reserva.cliente.id,
+                     vehiculo_id=reserva.vehiculo.id, importe=reserva.total_final, metodo_pago=metodo_pago)
+        return reserva
+
+    def _aplicar_devoluciones(self, cerradas):
+        # Devolvemos los vehículos de las reservas cerradas: sumamos km y los dejamos disponibles
+        for reserva, km_recorridos in cerradas:
+            self._quitar_reserva_activa(reserva)
+            reserva.vehiculo.actualizar_kilometraje(km_recorridos)
+            self.planificador.registrar_km(reserva.vehiculo, km_recorridos, reserva.dias)
+            self.agregados.registrar_reserva(reserva, km_recorridos)
+            # Si se devuelve tarde y ya ha empezado un mantenimiento programado, sigue en mantenimiento
+            if reserva.vehiculo.estado != "MANTENIMIENTO":
+                self._cambiar_estado_vehiculo(reserva.vehiculo, "DISPONIBLE")
+            # El vehículo queda en la sucursal donde se ha devuelto
+            self._mover_vehiculo(reserva.vehiculo, reserva.sucursal_devolucion)
+            self._emitir("RESERVA_FINALIZADA", reserva_id=reserva.id, cliente_id=reserva.cliente.id,
+                         vehiculo_id=reserva.vehiculo.id, importe_total=reserva.total_final,
+                         metodo_pago=reserva.metodo_pago, dias=reserva.dias,
+                         km_recorridos=km_recorridos)
 
-        # Devolvemos un pequeño resumen del pago realizado
+    def _quitar_reserva_activa(self, reserva: Reserva):
+        # La reserva deja de contar como activa para su vehículo y deja libres sus fechas
+        if self.calendario.eliminar(reserva.id):
+            self.precios.quitar_reserva(reserva)
+        activas = self._reservas_activas.get(reserva.vehiculo.id)
+        if activas is not None:
+            activas.pop(reserva.id, None)
+            if not activas:
+                del self._reservas_activas[reserva.vehiculo.id]
+
+    def _resumen_pago(self, reserva: Reserva):
+        # Resumen del pago de una reserva finalizada
         return {
             "reserva_id": reserva.id,
             "cliente": reserva.cliente.nombre,
             "vehiculo": reserva.vehiculo.matricula,
             "importe_total": reserva.total_final,
-            "metodo_pago": metodo_pago,
+            "metodo_pago": reserva.metodo_pago,
             "pagada": reserva.pagada
         }
 
+    # ---------- LISTA DE ESPERA ----------
+    def solicitar_espera(self, cliente_id: UUID, sucursal_id: UUID, categoria: str, fecha_inicio: str,
+                         fecha_fin: str, id_sucursal_devolucion: Optional[UUID] = None) -> SolicitudEspera:
+        # Apuntamos al cliente en la cola de la sucursal y categoría. Si ya hay un vehículo libre se
+        # le asigna en el momento; si no, en cuanto una devolución, cancelación o fin de mantenimiento
+        # deje uno libre. Repetir la misma petición devuelve la solicitud que ya estaba en la cola.
+        with self._lock:
+            cliente = self.usuarios.get(cliente_id)
+            if not cliente or not isinstance(cliente, Cliente):
+                raise ValueError("El usuario debe ser un cliente válido.")
+            sucursal = self.obtener_sucursal(sucursal_id)
+            devolucion = self.obtener_sucursal(id_sucursal_devolucion) if id_sucursal_devolucion else sucursal
+            tarifa = self.obtener_tarifa(categoria)
+            inicio, fin = self._parsear_periodo(fecha_inicio, fecha_fin)
+
+            solicitud, nueva = self.lista_espera.encolar(cliente.id, sucursal.id, tarifa.categoria,
+                                                         inicio, fin, devolucion.id)
+            if nueva:
+                self._emitir("ESPERA_SOLICITADA", solicitud_id=solicitud.id, cliente_id=cliente.id,
+                             sucursal_id=sucursal.id, categoria=tarifa.categoria,
+                             fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+                self._asignar_esperas(sucursal.id, tarifa.categoria)
+        return solicitud
+
+    def obtener_espera(self, solicitud_id: UUID) -> SolicitudEspera:
+        return self.lista_espera.obtener(solicitud_id)
+
+    def posicion_espera(self, solicitud: SolicitudEspera) -> Optional[int]:
+        with self._lock:
+            return self.lista_espera.posicion(solicitud)
+
+    def cancelar_espera(self, solicitud_id: UUID) -> SolicitudEspera:
+        with self._lock:
+            solicitud = self.lista_espera.cancelar(solicitud_id)
+            self._emitir("ESPERA_CANCELADA", solicitud_id=solicitud.id, cliente_id=solicitud.cliente_id)
+        return solicitud
+
+    def _atender_lista_espera(self, vehiculos):
+        # Vehículos que pueden haber quedado libres: miramos la cola de su sucursal y categoría
+        with self._lock:
+            for vehiculo in vehiculos:
+                if (vehiculo.estado == "DISPONIBLE" and vehiculo.sucursal is not None
+                        and self.lista_espera.hay_pendientes(vehiculo.sucursal.id, vehiculo.categoria)):
+                    self._asignar_esperas(vehiculo.sucursal.id, vehiculo.categoria)
+
+    def _asignar_esperas(self, sucursal_id: UUID, categoria: str):
+        # Recorremos la cola por prioridad dando a cada solicitud el primer vehículo libre en sus
+        # fechas, hasta que no quedan vehículos disponibles de esa categoría en la sucursal
+        for solicitud in self.lista_espera.pendientes(sucursal_id, categoria):
+            libres = list(self.disponibilidad.disponibles(sucursal_id, categoria))
+            if not libres:
+                break
+            for vehiculo in libres:
+                if not self.calendario.esta_libre(vehiculo.id, solicitud.fecha_inicio, solicitud.fecha_fin):
+                    continue
+                try:
+                    reserva = self.realizar_reserva(solicitud.cliente_id, vehiculo.id,
+                                                    f"{solicitud.fecha_inicio:%Y-%m-%d}",
+                                                    f"{solicitud.fecha_fin:%Y-%m-%d}",
+                                                    solicitud.sucursal_devolucion_id)
+                except ValueError:
+                    continue
+                self.lista_espera.asignar(solicitud, reserva.id)
+                self._emitir("ESPERA_ASIGNADA", solicitud_id=solicitud.id, cliente_id=solicitud.cliente_id,
+                             reserva_id=reserva.id, vehiculo_id=vehiculo.id)
+                break
+
     # ---------- MANTENIMIENTOS ----------
     def registrar_mantenimiento(self, vehiculo_id: UUID, motivo: str,
                                 fecha_inicio: str, fecha_fin: str,
                                 coste: float, tipo: str = "REVISIÓN"):
-        # Registramos un nuevo mantenimiento y cambiamos el estado del vehículo
-        vehiculo = self.vehiculos.get(vehiculo_id)
-        if not vehiculo:
-            raise ValueError("Vehículo no encontrado.")
+        # Programamos un mantenimiento para unas fechas. Si se solapa con reservas activas u otros
+        # mantenimientos del vehículo lo rechazamos (indicando con qué choca y qué vehículos están libres).
+        # El vehículo pasa a mantenimiento cuando empieza la ventana, no al registrarlo.
+        with self._lock:
+            vehiculo = self.vehiculos.get(vehiculo_id)
+            if not vehiculo:
+                raise ValueError("Vehículo no encontrado.")
+            if vehiculo.estado == "RETIRADO":
+                raise ValueError("El vehículo está retirado de la flota.")
+
+            mantenimiento = Mantenimiento(vehiculo, motivo, fecha_inicio, fecha_fin, coste, tipo)
+            # En el calendario el último día del mantenimiento también cuenta como ocupado
+            fin_calendario = mantenimiento.fecha_fin + timedelta(days=1)
+            self._comprobar_calendario(vehiculo, mantenimiento.fecha_inicio, fin_calendario,
+                                       "El mantenimiento se solapa con otras reservas o mantenimientos del vehículo.")
 
-        mantenimiento = Mantenimiento(vehiculo, motivo, fecha_inicio, fecha_fin, coste, tipo)
-        self.mantenimientos[mantenimiento.id] = mantenimiento
+            self.mantenimientos[mantenimiento.id] = mantenimiento
+            self.calendario.agregar(vehiculo.id, mantenimiento.id, mantenimiento.fecha_inicio,
+                                    fin_calendario, "MANTENIMIENTO")
+            self.planificador.marcar_programado(vehiculo.id, mantenimiento.tipo)
+            self.agregados.registrar_mantenimiento(mantenimiento)
+            self._emitir("MANTENIMIENTO_PROGRAMADO", **self._datos_mantenimiento(mantenimiento))
+
+            # Si la ventana ya ha empezado, arranca ahora; si no, queda en la cola de inicios
+            heapq.heappush(self._inicios_mantenimiento, (mantenimiento.fecha_inicio, mantenimiento.id))
+            self.procesar_mantenimientos_programados()
         return mantenimiento
 
+    def listar_mantenimientos(self):
+        return self.mantenimientos.values()
+
+    def procesar_mantenimientos_programados(self, ahora: Optional[datetime] = None):
+        # Iniciamos los mantenimientos programados cuya ventana ya ha empezado. Solo miramos la
+        # cabeza de la cola (ordenada por fecha de inicio), así que no recorremos todos los mantenimientos.
+        # Si un vehículo todavía no puede entrar (por ejemplo, sigue alquilado), lo reintentamos más tarde.
+        ahora = ahora or datetime.now()
+        iniciados, aplazados = [], []
+        with self._lock:
+            while self._inicios_mantenimiento and self._inicios_mantenimiento[0][0] <= ahora:
+                entrada = heapq.heappop(self._inicios_mantenimiento)
+                mantenimiento = self.mantenimientos.get(entrada[1])
+                if (mantenimiento is None or mantenimiento.estado != "PROGRAMADO"
+                        or mantenimiento.vehiculo.id not in self.vehiculos):
+                    continue
+                vehiculo = mantenimiento.vehiculo
+                estado_anterior = vehiculo.estado
+                try:
+                    mantenimiento.iniciar_mantenimiento()
+                except ValueError:
+                    aplazados.append(entrada)
+                    continue
+                self._notificar_cambio_estado(vehiculo, estado_anterior)
+                self._emitir("MANTENIMIENTO_INICIADO", **self._datos_mantenimiento(mantenimiento))
+                iniciados.append(mantenimiento)
+
+            for entrada in aplazados:
+                heapq.heappush(self._inicios_mantenimiento, entrada)
+        return iniciados
+
     def finalizar_mantenimiento(self, mantenimiento_id: UUID):
         # Marcamos un mantenimiento como completado
-        mantenimiento = self.mantenimientos.get(mantenimiento_id)
-        if not mantenimiento:
-            raise ValueError("Mantenimiento no encontrado.")
-        mantenimiento.finalizar_mantenimiento()
+        with self._lock:
+            mantenimiento = self.mantenimientos.get(mantenimiento_id)
+            if not mantenimiento:
+                raise ValueError("Mantenimiento no encontrado.")
+
+            vehiculo = mantenimiento.vehiculo
+            estado_anterior = vehiculo.estado
+            mantenimiento.finalizar_mantenimiento()
+            # Si el vehículo ya tenía reservas para después, vuelve a quedar reservado
+            if vehiculo.estado == "DISPONIBLE" and vehiculo.id in self._reservas_activas:
+                vehiculo.cambiar_estado("RESERVADO")
+            self.calendario.eliminar(mantenimiento.id)
+            self.planificador.registrar_mantenimiento(mantenimiento)
+
+            self._notificar_cambio_estado(vehiculo, estado_anterior)
+            self._emitir("MANTENIMIENTO_FINALIZADO", mantenimiento_id=mantenimiento.id,
+                         vehiculo_id=vehiculo.id)
+            self._atender_lista_espera([vehiculo])
         return mantenimiento
+
+    def _comprobar_calendario(self, vehiculo: Vehiculo, inicio: datetime, fin: datetime, mensaje: str):
+        # Comprobamos en el calendario del vehículo que [inicio, fin) esté libre
+        solapes = self.calendario.solapes(vehiculo.id, inicio, fin)
+        if not solapes:
+            return
+        conflictos = []
+        for clave, _, _, tipo in solapes:
+            origen = self.reservas.get(clave) if tipo == "RESERVA" else self.mantenimientos.get(clave)
+            conflictos.append({"tipo": tipo, "id": clave,
+                               "fecha_inicio": origen.fecha_inicio, "fecha_fin": origen.fecha_fin})
+        raise ConflictoMantenimiento(mensaje, conflictos, self._alternativas(vehiculo, inicio, fin, 5))
+
+    def _alternativas(self, vehiculo: Vehiculo, inicio: datetime, fin: datetime, limite: int = 10):
+        # Vehículos disponibles y libres en [inicio, fin) que pueden sustituir al pedido, por orden:
+        # misma categoría en la misma sucursal, misma categoría en otras sucursales y categorías
+        # superiores (de la más barata a la más cara). Solo miramos los grupos del índice de
+        # disponibilidad y paramos al llegar al límite, así que no recorremos la flota.
+        origen = vehiculo.sucursal
+        otras = self._sucursales_cercanas(origen)
+        propias = [origen] if origen else []
+        niveles = [("MISMA_SUCURSAL", [vehiculo.categoria], propias),
+                   ("OTRA_SUCURSAL", [vehiculo.categoria], otras),
+                   ("CATEGORIA_SUPERIOR", self._categorias_superiores(vehiculo.categoria), propias + otras)]
+
+        alternativas = []
+        for motivo, categorias, sucursales in niveles:
+            for categoria in categorias:
+                tarifa = self._tarifa_de(categoria)
+                for sucursal in sucursales:
+                    for otro in self.disponibilidad.disponibles(sucursal.id, categoria):
+                        if otro is vehiculo or not self.calendario.esta_libre(otro.id, inicio, fin):
+                            continue
+                        precio = self.precios.cotizar(tarifa, sucursal.id, inicio, fin)["total"] if tarifa else None
+                        alternativas.append({"vehiculo": otro, "motivo": motivo, "precio_estimado": precio})
+                        if len(alternativas) == limite:
+                            return alternativas
+        return alternativas
+
+    def _sucursales_cercanas(self, sucursal: Optional[Sucursal]) -> List[Sucursal]:
+        # Resto de sucursales, en el orden en que conviene ofrecerlas: si la sucursal tiene
+        # coordenadas, de la más cercana a la más lejana, y al final las que no tienen
+        if sucursal is None or sucursal.latitud is None:
+            return [s for s in self.sucursales.values() if s is not sucursal]
+        cercanas = [s for _, s in self.mapa_sucursales.por_distancia(sucursal.latitud, sucursal.longitud)
+                    if s is not sucursal]
+        return cercanas + [s for s in self.sucursales.values() if s.latitud is None]
+
+    def _categorias_superiores(self, categoria: str) -> List[str]:
+        # Categorías con una tarifa más cara que la pedida, de la más barata a la más cara
+        base = self._tarifa_de(categoria)
+        if base is None:
+            return []
+        superiores = sorted((t for t in self.tarifas.values()
+                             if t.precio_diario > base.precio_diario
+                             and t.categoria.lower() != categoria.lower()),
+                            key=lambda t: t.precio_diario)
+        # Si hubiera varias tarifas de una misma categoría, la ofrecemos una sola vez
+        return list(dict.fromkeys(t.categoria.lower() for t in superiores))
+
+    def _tarifa_de(self, categoria: str) -> Optional[Tarifa]:
+        try:
+            return self.obtener_tarifa(categoria)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _datos_mantenimiento(mantenimiento: Mantenimiento) -> dict:
+        # Datos que acompañan a los eventos de un mantenimiento
+        return {
+            "mantenimiento_id": mantenimiento.id,
+            "vehiculo_id": mantenimiento.vehiculo.id,
+            "tipo": mantenimiento.tipo,
+            "coste": mantenimiento.coste,
+            "fecha_inicio": mantenimiento.fecha_inicio.strftime("%Y-%m-%d"),
+            "fecha_fin": mantenimiento.fecha_fin.strftime("%Y-%m-%d"),
+        }
+
+    def planificar_mantenimientos(self, desde: Optional[str] = None, horizonte_dias: int = 30, limite: int = 50):
+        # Revisiones e ITV que vencen en los próximos días, de la más urgente a la menos,
+        # con la ventana propuesta para cada una (ver services/PlanificadorMantenimiento.py)
+        if horizonte_dias < 0:
+            raise ValueError("El horizonte no puede ser negativo.")
+        with self._lock:
+            return self.planificador.plan(self._parsear_fecha(desde), horizonte_dias, limite)
+
+    # ---------- RENTABILIDAD ----------
+    def rentabilidad_vehiculo(self, vehiculo_id: UUID) -> TotalesVehiculo:
+        # Totales acumulados de un vehículo (también de los retirados, que conservan su historial)
+        with self._lock:
+            return self.agregados.obtener(vehiculo_id)
+
+    def vehiculos_menos_rentables(self, limite: int = 10) -> List[TotalesVehiculo]:
+        # Vehículos en flota de menor a mayor beneficio (ingresos menos coste de mantenimiento):
+        # los primeros candidatos a retirar (ver services/AgregadosVehiculo.py)
+        if limite < 1:
+            raise ValueError("El límite debe ser al menos 1.")
+        with self._lock:
+            return self.agregados.menos_rentables(limite)
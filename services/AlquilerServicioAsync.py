@@ -0,0 +1,261 @@
+from __future__ import annotations
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Tuple
+from uuid import UUID
+
+from models.Usuario import Usuario
+from services.AlquilerServicio import AlquilerServicio
+from services.AgregadosVehiculo import TotalesVehiculo
+from services.Eventos import Evento
+from services.ListaEspera import SolicitudEspera
+
+# Función que se espera antes de cada modificación (con el nombre de la operación): si lanza una
+# excepción, la modificación no se hace
+Admitir = Callable[[str], Awaitable[None]]
+
+
+class AlquilerServicioAsync:
+    # Fachada asyncio del servicio de alquiler para los endpoints 'async def'. Las operaciones del
+    # servicio trabajan en memoria y tardan microsegundos, así que las ejecutamos en el propio bucle
+    # de eventos en lugar de mandarlas al pool de hilos de Starlette (saltar a un hilo cuesta más que
+    # la operación y el pool limita cuántas peticiones se atienden a la vez):
+    #
+    # - Las modificaciones pasan por un cerrojo asyncio y, si hay función de admisión, la esperan antes
+    #   de tocar nada (por ejemplo, a que el registro de auditoría tenga sitio): si la rechaza, el
+    #   servicio queda como estaba. Los hilos que usen el servicio directamente siguen protegidos por
+    #   su propio cerrojo.
+    # - Las consultas no toman el cerrojo (el servicio lee sobre instantáneas).
+    # - Los hashes bcrypt (decenas de milisegundos de CPU) van a un pool propio con un hilo por núcleo:
+    #   bcrypt suelta el GIL, así que no paran el bucle ni ocupan los hilos del resto de la API.
+
+    def __init__(self, servicio: AlquilerServicio,
+                 hashear: Callable[[str], str],
+                 verificar: Callable[[str, str], Tuple[bool, Optional[str]]],
+                 admitir: Optional[Admitir] = None,
+                 hilos_hash: Optional[int] = None):
+        self.servicio = servicio
+        self._hashear = hashear
+        # Devuelve si la contraseña es correcta y, si el hash usa un coste antiguo, el hash nuevo
+        self._verificar = verificar
+        self._admitir = admitir
+        self._lock = asyncio.Lock()
+        self._pool_hash = ThreadPoolExecutor(max_workers=hilos_hash or os.cpu_count() or 1,
+                                             thread_name_prefix="bcrypt")
+
+    def cerrar(self):
+        self._pool_hash.shutdown(wait=False, cancel_futures=True)
+
+    async def _modificar(self, operacion: Callable, *args, **kwargs):
+        # Los ValueError del servicio llegan tal cual al endpoint. La admisión va antes de la operación
+        # y, con el cerrojo tomado, ninguna otra modificación de la fachada se cuela entre las dos
+        async with self._lock:
+            if self._admitir is not None:
+                await self._admitir(operacion.__name__)
+            return operacion(*args, **kwargs)
+
+    # ---------- CONTRASEÑAS ----------
+    async def hash_password(self, password: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self._pool_hash, self._hashear, password)
+
+    async def autenticar(self, email: str, password: str) -> Optional[Usuario]:
+        # Usuario con ese email y contraseña, o None. Si su hash usa un coste antiguo, lo rehacemos
+        usuario = self.servicio.obtener_usuario_por_email(email)
+        if usuario is None:
+            return None
+        valida, nuevo_hash = await asyncio.get_running_loop().run_in_executor(
+            self._pool_hash, self._verificar, password, usuario.password)
+        if not valida:
+            return None
+        if nuevo_hash:
+            await self.actualizar_password(usuario.id, nuevo_hash)
+        return usuario
+
+    # ---------- USUARIOS ----------
+    async def registrar_usuario(self, tipo: str, nombre: str, email: str, password: str, licencia=None, direccion=None):
+        # 'password' es el hash (ver hash_password), igual que en el servicio
+        return await self._modificar(self.servicio.registrar_usuario, tipo, nombre, email, password, licencia, direccion)
+
+    async def actualizar_password(self, usuario_id: UUID, password: str):
+        return await self._modificar(self.servicio.actualizar_password, usuario_id, password)
+
+    async def obtener_usuario(self, usuario_id: UUID):
+        return self.servicio.obtener_usuario(usuario_id)
+
+    async def obtener_usuario_por_email(self, email: str) -> Optional[Usuario]:
+        return self.servicio.obtener_usuario_por_email(email)
+
+    async def listar_usuarios(self) -> List[Usuario]:
+        return self.servicio.listar_usuarios()
+
+    # ---------- SUCURSALES ----------
+    async def agregar_sucursal(self, nombre: str, direccion: str, telefono: str,
+                               latitud: Optional[float] = None, longitud: Optional[float] = None):
+        return await self._modificar(self.servicio.agregar_sucursal, nombre, direccion, telefono, latitud, longitud)
+
+    async def ubicar_sucursal(self, sucursal_id: UUID, latitud: Optional[float], longitud: Optional[float]):
+        return await self._modificar(self.servicio.ubicar_sucursal, sucursal_id, latitud, longitud)
+
+    async def sucursales_cercanas(self, latitud: float, longitud: float, categoria: Optional[str] = None,
+                                  desde: Optional[str] = None, hasta: Optional[str] = None, limite: int = 5):
+        return self.servicio.sucursales_cercanas(latitud, longitud, categoria, desde, hasta, limite)
+
+    async def obtener_sucursal(self, sucursal_id: UUID):
+        return self.servicio.obtener_sucursal(sucursal_id)
+
+    async def existe_sucursal(self, sucursal_id: UUID) -> bool:
+        return sucursal_id in self.servicio.sucursales
+
+    async def listar_sucursales(self):
+        return self.servicio.listar_sucursales()
+
+    # ---------- VEHÍCULOS ----------
+    async def registrar_vehiculo(self, tipo: str, matricula: str, marca: str, modelo: str, año: int,
+                                 categoria: str, km: float, sucursal, **extras):
+        return await self._modificar(self.servicio.registrar_vehiculo, tipo, matricula, marca, modelo, año,
+                                     categoria, km, sucursal, **extras)
+
+    async def importar_vehiculos(self, datos_vehiculos):
+        return await self._modificar(self.servicio.importar_vehiculos, datos_vehiculos)
+
+    async def obtener_vehiculo(self, vehiculo_id: UUID):
+        return self.servicio.obtener_vehiculo(vehiculo_id)
+
+    async def existe_vehiculo(self, vehiculo_id: UUID) -> bool:
+        return vehiculo_id in self.servicio.vehiculos
+
+    async def obtener_vehiculo_por_matricula(self, matricula: str):
+        return self.servicio.obtener_vehiculo_por_matricula(matricula)
+
+    async def listar_vehiculos(self):
+        return self.servicio.listar_vehiculos()
+
+    async def listar_vehiculos_disponibles(self):
+        return self.servicio.listar_vehiculos_disponibles()
+
+    async def buscar_vehiculos(self, texto: str, estado: Optional[str] = None,
+                               sucursal_id: Optional[UUID] = None, limite: int = 20):
+        return self.servicio.buscar_vehiculos(texto, estado, sucursal_id, limite)
+
+    async def eliminar_vehiculo(self, vehiculo_id: UUID, cascada: bool = False):
+        return await self._modificar(self.servicio.eliminar_vehiculo, vehiculo_id, cascada)
+
+    async def retirar_vehiculo(self, vehiculo_id: UUID, cascada: bool = False):
+        return await self._modificar(self.servicio.retirar_vehiculo, vehiculo_id, cascada)
+
+    async def transferir_vehiculo(self, vehiculo_id: UUID, sucursal_destino_id: UUID):
+        return await self._modificar(self.servicio.transferir_vehiculo, vehiculo_id, sucursal_destino_id)
+
+    # ---------- TARIFAS ----------
+    async def crear_tarifa(self, nombre: str, categoria: str, precio_diario: float, km_incluidos: float = 300.0,
+                           coste_km_extra: float = 0.1, recargo_retraso: float = 20.0,
+                           penalizacion_comb: float = 30.0):
+        return await self._modificar(self.servicio.crear_tarifa, nombre, categoria, precio_diario, km_incluidos,
+                                     coste_km_extra, recargo_retraso, penalizacion_comb)
+
+    async def listar_tarifas(self):
+        return self.servicio.listar_tarifas()
+
+    async def cotizar_reserva(self, sucursal_id: UUID, categoria: str, fecha_inicio: str, fecha_fin: str):
+        return self.servicio.cotizar_reserva(sucursal_id, categoria, fecha_inicio, fecha_fin)
+
+    async def agregar_temporada(self, nombre: str, inicio: str, fin: str, multiplicador: float,
+                                sucursal_id: Optional[UUID] = None, categoria: Optional[str] = None):
+        return await self._modificar(self.servicio.agregar_temporada, nombre, inicio, fin, multiplicador,
+                                     sucursal_id, categoria)
+
+    async def eliminar_temporada(self, temporada_id: UUID):
+        return await self._modificar(self.servicio.eliminar_temporada, temporada_id)
+
+    async def listar_temporadas(self):
+        return self.servicio.listar_temporadas()
+
+    # ---------- RESERVAS ----------
+    async def realizar_reserva(self, cliente_id: UUID, vehiculo_id: UUID,
+                               fecha_inicio: str, fecha_fin: str, id_sucursal_devolucion: UUID):
+        return await self._modificar(self.servicio.realizar_reserva, cliente_id, vehiculo_id,
+                                     fecha_inicio, fecha_fin, id_sucursal_devolucion)
+
+    async def buscar_alternativas(self, vehiculo_id: UUID, fecha_inicio: str, fecha_fin: str, limite: int = 10):
+        return self.servicio.buscar_alternativas(vehiculo_id, fecha_inicio, fecha_fin, limite)
+
+    async def obtener_reserva(self, reserva_id: UUID):
+        return self.servicio.obtener_reserva(reserva_id)
+
+    async def listar_reservas(self):
+        return self.servicio.listar_reservas()
+
+    async def cancelar_reserva(self, reserva_id: UUID):
+        return await self._modificar(self.servicio.cancelar_reserva, reserva_id)
+
+    async def listar_reservas_cliente(self, cliente_id: UUID, desde: Optional[str] = None,
+                                      hasta: Optional[str] = None, estado: Optional[str] = None,
+                                      offset: int = 0, limite: Optional[int] = None):
+        return self.servicio.listar_reservas_cliente(cliente_id, desde, hasta, estado, offset, limite)
+
+    async def listar_reservas_sucursal(self, sucursal_id: UUID, desde: Optional[str] = None,
+                                       hasta: Optional[str] = None, estado: Optional[str] = None,
+                                       offset: int = 0, limite: Optional[int] = None):
+        return self.servicio.listar_reservas_sucursal(sucursal_id, desde, hasta, estado, offset, limite)
+
+    async def finalizar_reserva(self, reserva_id: UUID, km_recorridos=0, retraso_dias=0,
+                                combustible_correcto=True, metodo_pago="Tarjeta"):
+        return await self._modificar(self.servicio.finalizar_reserva, reserva_id, km_recorridos, retraso_dias,
+                                     combustible_correcto, metodo_pago)
+
+    async def finalizar_reservas_lote(self, devoluciones):
+        return await self._modificar(self.servicio.finalizar_reservas_lote, devoluciones)
+
+    # ---------- LISTA DE ESPERA ----------
+    async def solicitar_espera(self, cliente_id: UUID, sucursal_id: UUID, categoria: str, fecha_inicio: str,
+                               fecha_fin: str, id_sucursal_devolucion: Optional[UUID] = None) -> SolicitudEspera:
+        return await self._modificar(self.servicio.solicitar_espera, cliente_id, sucursal_id, categoria,
+                                     fecha_inicio, fecha_fin, id_sucursal_devolucion)
+
+    async def obtener_espera(self, solicitud_id: UUID) -> SolicitudEspera:
+        return self.servicio.obtener_espera(solicitud_id)
+
+    async def posicion_espera(self, solicitud: SolicitudEspera) -> Optional[int]:
+        return self.servicio.posicion_espera(solicitud)
+
+    async def cancelar_espera(self, solicitud_id: UUID) -> SolicitudEspera:
+        return await self._modificar(self.servicio.cancelar_espera, solicitud_id)
+
+    # ---------- MANTENIMIENTOS ----------
+    async def registrar_mantenimiento(self, vehiculo_id: UUID, motivo: str, fecha_inicio: str, fecha_fin: str,
+                                      coste: float, tipo: str = "REVISIÓN"):
+        return await self._modificar(self.servicio.registrar_mantenimiento, vehiculo_id, motivo,
+                                     fecha_inicio, fecha_fin, coste, tipo)
+
+    async def listar_mantenimientos(self):
+        return self.servicio.listar_mantenimientos()
+
+    async def procesar_mantenimientos_programados(self, ahora: Optional[datetime] = None):
+        return await self._modificar(self.servicio.procesar_mantenimientos_programados, ahora)
+
+    async def finalizar_mantenimiento(self, mantenimiento_id: UUID):
+        return await self._modificar(self.servicio.finalizar_mantenimiento, mantenimiento_id)
+
+    async def planificar_mantenimientos(self, desde: Optional[str] = None, horizonte_dias: int = 30,
+                                        limite: int = 50):
+        return self.servicio.planificar_mantenimientos(desde, horizonte_dias, limite)
+
+    # ---------- RENTABILIDAD ----------
+    async def rentabilidad_vehiculo(self, vehiculo_id: UUID) -> TotalesVehiculo:
+        return self.servicio.rentabilidad_vehiculo(vehiculo_id)
+
+    async def vehiculos_menos_rentables(self, limite: int = 10) -> List[TotalesVehiculo]:
+        return self.servicio.vehiculos_menos_rentables(limite)
+
+    # ---------- EVENTOS ----------
+    async def ultima_secuencia_eventos(self) -> int:
+        return self.servicio.eventos.ultima_secuencia
+
+    async def leer_eventos(self, desde: int, limite: int = 500) -> Tuple[List[Evento], bool]:
+        # Eventos posteriores a 'desde' y si se han perdido algunos (ver BufferEventos.leer_desde)
+        return self.servicio.eventos.leer_desde(desde, limite)
+
+    async def esperar_eventos(self, secuencia: int, timeout: float) -> bool:
+        return await self.servicio.eventos.esperar(secuencia, timeout)
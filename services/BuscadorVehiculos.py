@@ -0,0 +1,135 @@
+from __future__ import annotations
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from models.Vehiculo import Vehiculo, normalizar_matricula
+
+# Carácter mayor que cualquier otro, para delimitar el final de un rango de prefijos
+_FIN_PREFIJO = "\uffff"
+
+
+def _tokenizar(texto: str) -> List[str]:
+    # Pasamos el texto a minúsculas, quitamos tildes y lo partimos en palabras alfanuméricas
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.findall(r"[a-z0-9]+", texto)
+
+
+def _rango_prefijo(ordenados: list, prefijo: str, en_tupla: bool = False):
+    # Posiciones [inicio, fin) de los elementos de una lista ordenada que empiezan por el prefijo.
+    # Con en_tupla=True los elementos son tuplas y el prefijo se aplica a su primer campo.
+    inferior, superior = prefijo, prefijo + _FIN_PREFIJO
+    if en_tupla:
+        inferior, superior = (inferior,), (superior,)
+    return bisect_left(ordenados, inferior), bisect_left(ordenados, superior)
+
+
+class BuscadorVehiculos:
+    # Índice en memoria para buscar vehículos por matrícula, marca o modelo (también por prefijo).
+    # Lo mantenemos de forma incremental al registrar y eliminar vehículos, así que cada búsqueda
+    # solo toca los vehículos que coinciden y no toda la flota.
+
+    def __init__(self):
+        # Vehículos indexados (UUID -> Vehículo)
+        self._vehiculos: Dict[UUID, Vehiculo] = {}
+        # Índice invertido: palabra de marca/modelo -> IDs de vehículos
+        self._indice: Dict[str, Set[UUID]] = {}
+        # Palabras ordenadas, para encontrar las que empiezan por un prefijo con búsqueda binaria
+        self._vocabulario: List[str] = []
+        # Matrículas normalizadas ordenadas junto al ID del vehículo
+        self._matriculas: List[Tuple[str, UUID]] = []
+        # Palabras con las que indexamos cada vehículo, para poder quitarlo después
+        self._palabras: Dict[UUID, Set[str]] = {}
+
+    def agregar(self, vehiculo: Vehiculo):
+        # Indexamos un vehículo nuevo
+        if vehiculo.id in self._vehiculos:
+            return
+        self._vehiculos[vehiculo.id] = vehiculo
+        insort(self._matriculas, (normalizar_matricula(vehiculo.matricula), vehiculo.id))
+
+        palabras = set(_tokenizar(vehiculo.marca) + _tokenizar(vehiculo.modelo))
+        self._palabras[vehiculo.id] = palabras
+        for palabra in palabras:
+            ids = self._indice.get(palabra)
+            if ids is None:
+                ids = self._indice[palabra] = set()
+                insort(self._vocabulario, palabra)
+            ids.add(vehiculo.id)
+
+    def eliminar(self, vehiculo: Vehiculo):
+        # Quitamos un vehículo del índice
+        if self._vehiculos.pop(vehiculo.id, None) is None:
+            return
+        posicion = bisect_left(self._matriculas, (normalizar_matricula(vehiculo.matricula), vehiculo.id))
+        del self._matriculas[posicion]
+
+        for palabra in self._palabras.pop(vehiculo.id):
+            ids = self._indice[palabra]
+            ids.discard(vehiculo.id)
+            if not ids:
+                # Si ningún vehículo usa ya la palabra, la quitamos también del vocabulario
+                del self._indice[palabra]
+                del self._vocabulario[bisect_left(self._vocabulario, palabra)]
+
+    def buscar(self, texto: str, estado: Optional[str] = None,
+               sucursal_id: Optional[UUID] = None, limite: int = 20) -> List[Vehiculo]:
+        # Buscamos vehículos cuya matrícula, marca o modelo empiecen por cada término del texto.
+        # Todos los términos deben coincidir; estado y sucursal filtran además el resultado.
+        terminos = _tokenizar(texto)
+        if not terminos:
+            return []
+        estado = estado.upper() if estado else None
+
+        # Para cada término reunimos los grupos de IDs que coinciden (sin unirlos todavía)
+        grupos_por_termino = [self._coincidencias(termino) for termino in terminos]
+
+        # Si el texto completo es una matrícula escrita con separadores ("1234 ABC"), también cuenta
+        matricula = normalizar_matricula(texto)
+        if len(terminos) > 1 and matricula:
+            inicio, fin = _rango_prefijo(self._matriculas, matricula, en_tupla=True)
+            por_matricula = [self._matriculas[i][1] for i in range(inicio, fin)]
+        else:
+            por_matricula = []
+
+        # Recorremos el término más selectivo y comprobamos el resto de términos y los filtros
+        grupos_por_termino.sort(key=lambda grupos: sum(len(g) for g in grupos))
+        principal, resto = grupos_por_termino[0], grupos_por_termino[1:]
+
+        resultado: List[Vehiculo] = []
+        vistos: Set[UUID] = set()
+        candidatos = [por_matricula] + principal
+        for grupo in candidatos:
+            for vehiculo_id in grupo:
+                if vehiculo_id in vistos:
+                    continue
+                vistos.add(vehiculo_id)
+                if grupo is not por_matricula and not all(
+                        any(vehiculo_id in g for g in grupos) for grupos in resto):
+                    continue
+                vehiculo = self._vehiculos[vehiculo_id]
+                if estado and vehiculo.estado != estado:
+                    continue
+                if sucursal_id and (not vehiculo.sucursal or vehiculo.sucursal.id != sucursal_id):
+                    continue
+                resultado.append(vehiculo)
+                if len(resultado) >= limite:
+                    return resultado
+        return resultado
+
+    def _coincidencias(self, termino: str):
+        # Grupos de IDs que coinciden con un término: primero por matrícula y luego por palabras
+        grupos = []
+        inicio, fin = _rango_prefijo(self._matriculas, termino.upper(), en_tupla=True)
+        if inicio < fin:
+            # Diccionario en vez de conjunto: conserva el orden de las matrículas y comprueba en O(1)
+            grupos.append(dict.fromkeys(self._matriculas[i][1] for i in range(inicio, fin)))
+        inicio, fin = _rango_prefijo(self._vocabulario, termino)
+        grupos.extend(self._indice[self._vocabulario[i]] for i in range(inicio, fin))
+        return grupos
+
+    def __len__(self) -> int:
+        return len(self._vehiculos)
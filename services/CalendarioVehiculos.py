@@ -0,0 +1,115 @@
+from __future__ import annotations
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+# Intervalo de ocupación de un vehículo: (inicio, fin, clave). El fin no está incluido.
+Intervalo = Tuple[datetime, datetime, UUID]
+
+_UN_DIA = timedelta(days=1)
+
+
+class CalendarioVehiculos:
+    # Calendario de ocupación de cada vehículo: reservas activas y mantenimientos pendientes como
+    # intervalos [inicio, fin) ordenados por inicio. Con búsqueda binaria respondemos si un vehículo
+    # está libre en unas fechas, qué lo ocupa o qué huecos tiene, sin recorrer todas las reservas.
+    # También llevamos cuántas reservas hay cada día en toda la flota (la demanda), para poder
+    # elegir los días más tranquilos cuando hay que parar un vehículo.
+
+    def __init__(self):
+        # Intervalos de cada vehículo, ordenados por fecha de inicio
+        self._intervalos: Dict[UUID, List[Intervalo]] = {}
+        # Clave (ID de reserva o mantenimiento) -> (vehículo, inicio, fin, tipo)
+        self._por_clave: Dict[UUID, Tuple[UUID, datetime, datetime, str]] = {}
+        # Duración del intervalo más largo de cada vehículo: acota hacia atrás la búsqueda de solapes
+        self._duracion_maxima: Dict[UUID, timedelta] = {}
+        # Número de reservas que ocupan cada día, en toda la flota
+        self._demanda: Dict[datetime, int] = {}
+
+    def agregar(self, vehiculo_id: UUID, clave: UUID, inicio: datetime, fin: datetime, tipo: str = "RESERVA"):
+        # Añadimos un intervalo al calendario del vehículo (si la clave ya estaba, lo sustituimos)
+        if fin <= inicio:
+            raise ValueError("El intervalo debe terminar después de empezar.")
+        self.eliminar(clave)
+        insort(self._intervalos.setdefault(vehiculo_id, []), (inicio, fin, clave))
+        self._por_clave[clave] = (vehiculo_id, inicio, fin, tipo)
+        if fin - inicio > self._duracion_maxima.get(vehiculo_id, timedelta(0)):
+            self._duracion_maxima[vehiculo_id] = fin - inicio
+        if tipo == "RESERVA":
+            self._sumar_demanda(inicio, fin, 1)
+
+    def eliminar(self, clave: UUID) -> bool:
+        # Quitamos un intervalo por su clave; devolvemos False si no estaba
+        datos = self._por_clave.pop(clave, None)
+        if datos is None:
+            return False
+        vehiculo_id, inicio, fin, tipo = datos
+        intervalos = self._intervalos[vehiculo_id]
+        del intervalos[bisect_left(intervalos, (inicio, fin, clave))]
+        if not intervalos:
+            del self._intervalos[vehiculo_id]
+            self._duracion_maxima.pop(vehiculo_id, None)
+        if tipo == "RESERVA":
+            self._sumar_demanda(inicio, fin, -1)
+        return True
+
+    def eliminar_vehiculo(self, vehiculo_id: UUID):
+        # Olvidamos todo el calendario de un vehículo (al darlo de baja)
+        for _, _, clave in list(self._intervalos.get(vehiculo_id, ())):
+            self.eliminar(clave)
+
+    def obtener(self, clave: UUID) -> Optional[Tuple[UUID, datetime, datetime, str]]:
+        # Devolvemos (vehículo, inicio, fin, tipo) del intervalo con esa clave
+        return self._por_clave.get(clave)
+
+    def solapes(self, vehiculo_id: UUID, inicio: datetime, fin: datetime,
+                tipo: Optional[str] = None) -> List[Tuple[UUID, datetime, datetime, str]]:
+        # Intervalos del vehículo que se solapan con [inicio, fin), ordenados por inicio.
+        # Solo pueden solaparse los que empiezan antes de 'fin' y, como mucho, una duración
+        # máxima antes de 'inicio', así que buscamos directamente en ese tramo.
+        intervalos = self._intervalos.get(vehiculo_id)
+        if not intervalos:
+            return []
+        primero = bisect_left(intervalos, (inicio - self._duracion_maxima[vehiculo_id],))
+        ultimo = bisect_left(intervalos, (fin,))
+        resultado = []
+        for i in range(primero, ultimo):
+            otro_inicio, otro_fin, clave = intervalos[i]
+            if otro_fin > inicio:
+                datos = self._por_clave[clave]
+                if tipo is None or datos[3] == tipo:
+                    resultado.append((clave, otro_inicio, otro_fin, datos[3]))
+        return resultado
+
+    def esta_libre(self, vehiculo_id: UUID, inicio: datetime, fin: datetime) -> bool:
+        return not self.solapes(vehiculo_id, inicio, fin)
+
+    def huecos(self, vehiculo_id: UUID, desde: datetime, hasta: datetime) -> List[Tuple[datetime, datetime]]:
+        # Tramos [inicio, fin) en los que el vehículo está libre entre 'desde' y 'hasta'
+        huecos = []
+        cursor = desde
+        for _, inicio, fin, _ in self.solapes(vehiculo_id, desde, hasta):
+            if inicio > cursor:
+                huecos.append((cursor, inicio))
+            cursor = max(cursor, fin)
+        if cursor < hasta:
+            huecos.append((cursor, hasta))
+        return huecos
+
+    def demanda(self, dia: datetime) -> int:
+        # Número de reservas de toda la flota que ocupan ese día
+        return self._demanda.get(dia, 0)
+
+    def _sumar_demanda(self, inicio: datetime, fin: datetime, cantidad: int):
+        dia = inicio
+        while dia < fin:
+            total = self._demanda.get(dia, 0) + cantidad
+            if total:
+                self._demanda[dia] = total
+            else:
+                self._demanda.pop(dia, None)
+            dia += _UN_DIA
+
+    def __len__(self) -> int:
+        return len(self._por_clave)
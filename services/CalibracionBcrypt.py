@@ -0,0 +1,43 @@
+from __future__ import annotations
+import time
+
+# Coste mínimo que aceptamos aunque la máquina sea lenta (recomendación actual de OWASP para bcrypt)
+RONDAS_MINIMAS = 12
+# Coste máximo: por encima cada login tardaría segundos incluso en máquinas rápidas
+RONDAS_MAXIMAS = 16
+# Coste con el que medimos la máquina: bajo, para que calibrar no retrase el arranque
+RONDAS_MEDIDA = 8
+
+# bcrypt solo usa los primeros 72 bytes de la contraseña
+LONGITUD_MAXIMA_BYTES = 72
+
+
+def cortar_password(password: str) -> str:
+    # Cortamos la contraseña a 72 bytes (no caracteres) sin partir ningún carácter por la mitad.
+    # Es lo mismo que hacía bcrypt por su cuenta, así que los hashes existentes siguen valiendo.
+    datos = password.encode("utf-8")
+    if len(datos) <= LONGITUD_MAXIMA_BYTES:
+        return password
+    return datos[:LONGITUD_MAXIMA_BYTES].decode("utf-8", errors="ignore")
+
+
+def medir_hash_ms(rondas: int, repeticiones: int = 3) -> float:
+    # Milisegundos de un hash bcrypt con ese coste (el mejor de varias repeticiones, para quitar ruido)
+    import bcrypt
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        bcrypt.hashpw(b"calibracion-bcrypt", bcrypt.gensalt(rondas))
+        duracion = (time.perf_counter() - inicio) * 1000
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return mejor
+
+
+def calibrar_rondas(objetivo_ms: float, minimo: int = RONDAS_MINIMAS, maximo: int = RONDAS_MAXIMAS) -> int:
+    # Elegimos el mayor coste cuyo hash no supera el tiempo objetivo en esta máquina.
+    # Medimos con un coste bajo y extrapolamos: cada ronda más duplica el tiempo del hash.
+    base_ms = medir_hash_ms(RONDAS_MEDIDA)
+    rondas = RONDAS_MEDIDA
+    while rondas < maximo and base_ms * 2 ** (rondas + 1 - RONDAS_MEDIDA) <= objetivo_ms:
+        rondas += 1
+    return max(minimo, rondas)
@@ -0,0 +1,371 @@
+from __future__ import annotations
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from models.Vehiculo import Coche, Moto, Furgoneta, normalizar_matricula
+
+# Formato del catálogo binario (todo en little-endian):
+#   cabecera | registros de cada tabla (ancho fijo) | índices ordenados | tabla de cadenas
+# Los textos (matrícula, marca, modelo, categoría...) no van dentro de los registros: cada campo
+# guarda (desplazamiento, longitud) dentro de la tabla de cadenas, donde cada texto distinto se
+# escribe una sola vez. Así todos los registros de una tabla miden lo mismo y el registro i está
+# en inicio + i * tamaño, sin tener que recorrer el fichero.
+
+_MAGICO = b"ALQCAT02"
+
+# Secciones del fichero, en el orden en que aparecen en la cabecera
+_SECCIONES = ("vehiculos", "vehiculos_por_id", "vehiculos_por_matricula",
+              "tarifas", "sucursales", "sucursales_por_id", "cadenas")
+
+# Mágico + (desplazamiento, número de elementos) por sección
+_CABECERA = struct.Struct("<8s" + "QI" * len(_SECCIONES))
+
+# id, tipo, matrícula, marca, modelo, categoría, estado, nombre de sucursal, tipo de motor (cadenas),
+# año, km, puertas, cilindrada, capacidad de carga y máscara de campos opcionales presentes
+_VEHICULO = struct.Struct("<16s" + "II" * 8 + "idiidB")
+# id, nombre, categoría (cadenas) y los importes de la tarifa
+_TARIFA = struct.Struct("<16s" + "II" * 2 + "ddddd")
+# id, nombre, dirección, teléfono (cadenas), número de vehículos y de reservas, latitud y longitud
+# (NaN si la sucursal no tiene coordenadas)
+_SUCURSAL = struct.Struct("<16s" + "II" * 3 + "IIdd")
+# Entradas de los índices: id -> posición y matrícula normalizada (cadena) -> posición
+_INDICE_ID = struct.Struct("<16sI")
+_INDICE_CADENA = struct.Struct("<III")
+
+# Bits de la máscara de opcionales de un vehículo
+_CON_PUERTAS, _CON_MOTOR, _CON_CILINDRADA, _CON_CARGA = 1, 2, 4, 8
+
+# Cada cuántos segundos como mucho comprobamos si se ha publicado un catálogo nuevo
+_INTERVALO_COMPROBACION = 1.0
+
+
+def _texto_uuid(identificador: bytes) -> str:
+    # Igual que str(UUID(bytes=...)) pero sin crear el objeto UUID (se nota en los listados grandes)
+    h = identificador.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+class _TablaCadenas:
+    # Tabla de cadenas del escritor: cada texto distinto se guarda una vez y se referencia por posición
+
+    def __init__(self):
+        self._posiciones: Dict[str, Tuple[int, int]] = {}
+        self.datos = bytearray()
+
+    def referencia(self, texto: Optional[str]) -> Tuple[int, int]:
+        if texto is None:
+            return 0, 0
+        posicion = self._posiciones.get(texto)
+        if posicion is None:
+            codificado = texto.encode("utf-8")
+            posicion = self._posiciones[texto] = (len(self.datos), len(codificado))
+            self.datos += codificado
+        return posicion
+
+
+def escribir_catalogo(servicio, ruta: str):
+    # Generamos el catálogo a partir del estado actual del servicio. Se escribe en un fichero
+    # temporal y se sustituye de golpe, así las réplicas que tienen abierto el anterior no ven
+    # nunca un fichero a medias.
+    cadenas = _TablaCadenas()
+    vehiculos, indice_vehiculos, indice_matriculas = bytearray(), [], []
+    tarifas, sucursales, indice_sucursales = bytearray(), bytearray(), []
+
+    # Leemos de una instantánea del servicio (todas las colecciones en la misma versión):
+    # los escritores no esperan mientras generamos el fichero
+    vista = servicio.instantanea()
+    for posicion, v in enumerate(vista["vehiculos"].values()):
+        tipo, puertas, motor, cilindrada, carga, presentes = "generico", 0, None, 0, 0.0, 0
+        if isinstance(v, Coche):
+            tipo, puertas, motor = "coche", v.puertas, v.tipo_motor
+            presentes = (_CON_PUERTAS if puertas is not None else 0) | (_CON_MOTOR if motor is not None else 0)
+        elif isinstance(v, Moto):
+            tipo, cilindrada = "moto", v.cilindrada
+            presentes = _CON_CILINDRADA if cilindrada is not None else 0
+        elif isinstance(v, Furgoneta):
+            tipo, carga = "furgoneta", v.capacidad_carga
+            presentes = _CON_CARGA if carga is not None else 0
+
+        vehiculos += _VEHICULO.pack(
+            v.id.bytes,
+            *cadenas.referencia(tipo),
+            *cadenas.referencia(v.matricula),
+            *cadenas.referencia(v.marca),
+            *cadenas.referencia(v.modelo),
+            *cadenas.referencia(v.categoria),
+            *cadenas.referencia(v.estado),
+            *cadenas.referencia(v.sucursal.nombre if v.sucursal else "Sin asignar"),
+            *cadenas.referencia(motor),
+            int(v.año), float(v.km), int(puertas or 0), int(cilindrada or 0), float(carga or 0.0),
+            presentes,
+        )
+        indice_vehiculos.append((v.id.bytes, posicion))
+        indice_matriculas.append((normalizar_matricula(v.matricula), posicion))
+
+    for t in vista["tarifas"].values():
+        tarifas += _TARIFA.pack(
+            t.id.bytes,
+            *cadenas.referencia(t.nombre),
+            *cadenas.referencia(t.categoria),
+            float(t.precio_diario), float(t.km_incluidos), float(t.coste_km_extra),
+            float(t.recargo_retraso), float(t.penalizacion_comb),
+        )
+
+    for posicion, s in enumerate(vista["sucursales"].values()):
+        sucursales += _SUCURSAL.pack(
+            s.id.bytes,
+            *cadenas.referencia(s.nombre),
+            *cadenas.referencia(s.direccion),
+            *cadenas.referencia(s.telefono),
+            len(s.vehiculos), len(s.reservas),
+            math.nan if s.latitud is None else s.latitud,
+            math.nan if s.longitud is None else s.longitud,
+        )
+        indice_sucursales.append((s.id.bytes, posicion))
+
+    # Índices ordenados para buscar por id o por matrícula con búsqueda binaria
+    indice_vehiculos.sort()
+    indice_sucursales.sort()
+    indice_matriculas.sort()
+    secciones = {
+        "vehiculos": (vehiculos, len(indice_vehiculos)),
+        "vehiculos_por_id": (b"".join(_INDICE_ID.pack(*e) for e in indice_vehiculos), len(indice_vehiculos)),
+        "vehiculos_por_matricula": (
+            b"".join(_INDICE_CADENA.pack(*cadenas.referencia(m), p) for m, p in indice_matriculas),
+            len(indice_matriculas),
+        ),
+        "tarifas": (tarifas, len(tarifas) // _TARIFA.size),
+        "sucursales": (sucursales, len(indice_sucursales)),
+        "sucursales_por_id": (b"".join(_INDICE_ID.pack(*e) for e in indice_sucursales), len(indice_sucursales)),
+        "cadenas": (cadenas.datos, len(cadenas.datos)),
+    }
+
+    cabecera, desplazamiento = [_MAGICO], _CABECERA.size
+    for nombre in _SECCIONES:
+        datos, elementos = secciones[nombre]
+        cabecera += [desplazamiento, elementos]
+        desplazamiento += len(datos)
+
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "wb") as fichero:
+        fichero.write(_CABECERA.pack(*cabecera))
+        for nombre in _SECCIONES:
+            fichero.write(secciones[nombre][0])
+    os.replace(temporal, ruta)
+
+
+class _Imagen:
+    # Un catálogo concreto proyectado en memoria. Las páginas del fichero las comparte el sistema
+    # operativo entre todos los procesos que lo abren, así que cada worker no tiene su propia copia.
+
+    def __init__(self, ruta: str):
+        with open(ruta, "rb") as fichero:
+            self.identidad = os.fstat(fichero.fileno())
+            self._mapa = mmap.mmap(fichero.fileno(), 0, access=mmap.ACCESS_READ)
+        self.datos = memoryview(self._mapa)
+
+        if self.datos.nbytes < _CABECERA.size:
+            raise ValueError("El fichero no es un catálogo válido.")
+        campos = _CABECERA.unpack_from(self.datos)
+        if campos[0] != _MAGICO:
+            raise ValueError("El fichero no es un catálogo válido.")
+        self.secciones = {nombre: (campos[1 + 2 * i], campos[2 + 2 * i]) for i, nombre in enumerate(_SECCIONES)}
+        self._cadenas = self.secciones["cadenas"][0]
+        # Textos ya decodificados de los campos que se repiten mucho (marca, categoría, estado...)
+        self._repetidas: Dict[int, str] = {}
+
+    def cadena(self, desplazamiento: int, longitud: int) -> str:
+        inicio = self._cadenas + desplazamiento
+        return str(self.datos[inicio:inicio + longitud], "utf-8")
+
+    def repetida(self, desplazamiento: int, longitud: int) -> str:
+        # Para campos con pocos valores distintos: decodificamos cada texto una sola vez
+        texto = self._repetidas.get(desplazamiento)
+        if texto is None:
+            texto = self._repetidas[desplazamiento] = self.cadena(desplazamiento, longitud)
+        return texto
+
+    def registros(self, seccion: str, formato: struct.Struct):
+        # Recorremos los registros de una tabla directamente sobre el fichero proyectado
+        inicio, elementos = self.secciones[seccion]
+        return formato.iter_unpack(self.datos[inicio:inicio + elementos * formato.size])
+
+    def registro(self, seccion: str, formato: struct.Struct, posicion: int) -> tuple:
+        return formato.unpack_from(self.datos, self.secciones[seccion][0] + posicion * formato.size)
+
+    def buscar_id(self, seccion: str, identificador: UUID) -> Optional[int]:
+        # Búsqueda binaria en un índice de (id, posición) ordenado por los bytes del id
+        inicio, elementos = self.secciones[seccion]
+        clave = identificador.bytes
+        bajo, alto = 0, elementos
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            actual, posicion = _INDICE_ID.unpack_from(self.datos, inicio + medio * _INDICE_ID.size)
+            if actual == clave:
+                return posicion
+            if actual < clave:
+                bajo = medio + 1
+            else:
+                alto = medio
+        return None
+
+    def buscar_cadena(self, seccion: str, clave: str) -> Optional[int]:
+        # Búsqueda binaria en un índice de (cadena, posición) ordenado por la cadena
+        inicio, elementos = self.secciones[seccion]
+        bajo, alto = 0, elementos
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            desplazamiento, longitud, posicion = _INDICE_CADENA.unpack_from(self.datos, inicio + medio * _INDICE_CADENA.size)
+            actual = self.cadena(desplazamiento, longitud)
+            if actual == clave:
+                return posicion
+            if actual < clave:
+                bajo = medio + 1
+            else:
+                alto = medio
+        return None
+
+    def vehiculo(self, campos: tuple) -> dict:
+        # Mismo diccionario (campos, orden y tipos) que genera la API para VehiculoRead
+        r = self.repetida
+        presentes = campos[22]
+        return {
+            "id": _texto_uuid(campos[0]),
+            "tipo": r(campos[1], campos[2]),
+            "matricula": self.cadena(campos[3], campos[4]),
+            "marca": r(campos[5], campos[6]),
+            "modelo": r(campos[7], campos[8]),
+            "año": campos[17],
+            "categoria": r(campos[9], campos[10]),
+            "km": campos[18],
+            "estado": r(campos[11], campos[12]),
+            "sucursal_nombre": r(campos[13], campos[14]),
+            "puertas": campos[19] if presentes & _CON_PUERTAS else None,
+            "tipo_motor": r(campos[15], campos[16]) if presentes & _CON_MOTOR else None,
+            "cilindrada": campos[20] if presentes & _CON_CILINDRADA else None,
+            "capacidad_carga": campos[21] if presentes & _CON_CARGA else None,
+        }
+
+    def tarifa(self, campos: tuple) -> dict:
+        # Mismo diccionario que genera la API para TarifaRead
+        return {
+            "id": _texto_uuid(campos[0]),
+            "nombre": self.cadena(campos[1], campos[2]),
+            "categoria": self.cadena(campos[3], campos[4]),
+            "precio_diario": campos[5],
+            "km_incluidos": campos[6],
+            "coste_km_extra": campos[7],
+            "recargo_retraso": campos[8],
+            "penalizacion_comb": campos[9],
+        }
+
+    def sucursal(self, campos: tuple) -> dict:
+        # Mismo diccionario que genera la API para SucursalRead
+        return {
+            "id": _texto_uuid(campos[0]),
+            "nombre": self.cadena(campos[1], campos[2]),
+            "direccion": self.cadena(campos[3], campos[4]),
+            "telefono": self.cadena(campos[5], campos[6]),
+            "num_vehiculos": campos[7],
+            "num_reservas": campos[8],
+            "latitud": None if math.isnan(campos[9]) else campos[9],
+            "longitud": None if math.isnan(campos[10]) else campos[10],
+        }
+
+
+class CatalogoBinario:
+    # Catálogo de solo lectura (vehículos, tarifas y sucursales) para las réplicas que solo sirven consultas.
+    # En lugar de tener en memoria un objeto por vehículo, cada consulta lee los registros directamente del
+    # fichero proyectado y construye solo los diccionarios de la respuesta.
+    # Si se publica un catálogo nuevo en la misma ruta (con escribir_catalogo), se detecta y se pasa a usar
+    # sin reiniciar; las consultas que estaban en curso terminan con el anterior.
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._imagen = _Imagen(ruta)
+        self._ultima_comprobacion = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _actual(self) -> _Imagen:
+        # Como mucho una vez por segundo, miramos si el fichero de la ruta ha cambiado
+        ahora = time.monotonic()
+        if ahora - self._ultima_comprobacion >= _INTERVALO_COMPROBACION:
+            with self._lock:
+                if ahora - self._ultima_comprobacion >= _INTERVALO_COMPROBACION:
+                    self._ultima_comprobacion = ahora
+                    self._recargar_si_cambia()
+        return self._imagen
+
+    def _recargar_si_cambia(self):
+        try:
+            identidad = os.stat(self.ruta)
+        except OSError:
+            # Si el fichero desaparece seguimos sirviendo el último catálogo cargado
+            return
+        anterior = self._imagen.identidad
+        if (identidad.st_ino, identidad.st_mtime_ns, identidad.st_size) != \
+                (anterior.st_ino, anterior.st_mtime_ns, anterior.st_size):
+            # No cerramos la imagen anterior: se libera sola cuando nadie la está usando
+            self._imagen = _Imagen(self.ruta)
+
+    # ---------- VEHÍCULOS ----------
+    def vehiculos(self) -> List[dict]:
+        imagen = self._actual()
+        return [imagen.vehiculo(campos) for campos in imagen.registros("vehiculos", _VEHICULO)]
+
+    def vehiculos_disponibles(self) -> List[dict]:
+        imagen = self._actual()
+        filas = (imagen.vehiculo(campos) for campos in imagen.registros("vehiculos", _VEHICULO))
+        return [fila for fila in filas if fila["estado"] == "DISPONIBLE"]
+
+    def vehiculo(self, vehiculo_id: UUID) -> Optional[dict]:
+        imagen = self._actual()
+        posicion = imagen.buscar_id("vehiculos_por_id", vehiculo_id)
+        if posicion is None:
+            return None
+        return imagen.vehiculo(imagen.registro("vehiculos", _VEHICULO, posicion))
+
+    def vehiculo_por_matricula(self, matricula: str) -> Optional[dict]:
+        imagen = self._actual()
+        posicion = imagen.buscar_cadena("vehiculos_por_matricula", normalizar_matricula(matricula))
+        if posicion is None:
+            return None
+        return imagen.vehiculo(imagen.registro("vehiculos", _VEHICULO, posicion))
+
+    # ---------- TARIFAS ----------
+    def tarifas(self) -> List[dict]:
+        imagen = self._actual()
+        return [imagen.tarifa(campos) for campos in imagen.registros("tarifas", _TARIFA)]
+
+    # ---------- SUCURSALES ----------
+    def sucursales(self) -> List[dict]:
+        imagen = self._actual()
+        return [imagen.sucursal(campos) for campos in imagen.registros("sucursales", _SUCURSAL)]
+
+    def sucursal(self, sucursal_id: UUID) -> Optional[dict]:
+        imagen = self._actual()
+        posicion = imagen.buscar_id("sucursales_por_id", sucursal_id)
+        if posicion is None:
+            return None
+        return imagen.sucursal(imagen.registro("sucursales", _SUCURSAL, posicion))
+
+    def __len__(self) -> int:
+        # Número de vehículos del catálogo
+        return self._actual().secciones["vehiculos"][1]
+
+
+if __name__ == "__main__":
+    # Generamos el catálogo a partir de un estado guardado con AlquilerServicio.guardar_estado:
+    #   python -m services.CatalogoBinario estado.bin catalogo.bin
+    import sys
+    from services.AlquilerServicio import AlquilerServicio
+
+    if len(sys.argv) != 3:
+        sys.exit("Uso: python -m services.CatalogoBinario <estado> <catalogo>")
+    escribir_catalogo(AlquilerServicio.cargar_estado(sys.argv[1]), sys.argv[2])
@@ -0,0 +1,216 @@
+from __future__ import annotations
+import threading
+from typing import Dict, Iterator, List, Optional
+
+
+class RelojVersiones:
+    # Contador de versiones compartido por las colecciones de un servicio, con el cerrojo que
+    # serializa sus escrituras. Cada escritura trabaja con la versión siguiente y solo la publica
+    # en 'actual' al terminar: una instantánea tomada en la versión publicada nunca ve una
+    # escritura a medias, y es coherente entre todas las colecciones que comparten el reloj.
+
+    def __init__(self):
+        self.actual = 0
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        return {"actual": self.actual}
+
+    def __setstate__(self, estado):
+        self.actual = estado["actual"]
+        self.lock = threading.RLock()
+
+
+class _Entrada:
+    # Valor de una clave en el registro: visible desde la versión 'alta' hasta la 'baja' (sin incluir)
+    __slots__ = ("clave", "valor", "alta", "baja")
+
+    def __init__(self, clave, valor, alta: int):
+        self.clave = clave
+        self.valor = valor
+        self.alta = alta
+        self.baja: Optional[int] = None
+
+
+class Instantanea:
+    # Vista inmutable de una colección tal y como estaba en una versión. Se toma en O(1) y se puede
+    # recorrer sin cerrojos mientras otros hilos siguen escribiendo en la colección.
+
+    __slots__ = ("_registro", "_longitud", "version", "_tamaño")
+
+    def __init__(self, registro: List[_Entrada], longitud: int, version: int):
+        self._registro = registro
+        self._longitud = longitud
+        self.version = version
+        self._tamaño: Optional[int] = None
+
+    def _entradas(self) -> List[_Entrada]:
+        # Las entradas añadidas después de la instantánea quedan fuera por posición y versión de alta;
+        # las dadas de baja después siguen visibles porque su versión de baja es posterior
+        version = self.version
+        return [e for e in self._registro[:self._longitud]
+                if e.alta <= version and (e.baja is None or e.baja > version)]
+
+    def keys(self) -> List:
+        return [e.clave for e in self._entradas()]
+
+    def values(self) -> List:
+        return [e.valor for e in self._entradas()]
+
+    def items(self) -> List:
+        return [(e.clave, e.valor) for e in self._entradas()]
+
+    def __iter__(self) -> Iterator:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        if self._tamaño is None:
+            self._tamaño = len(self._entradas())
+        return self._tamaño
+
+
+class ColeccionVersionada(dict):
+    # Diccionario que además guarda un registro de versiones (solo se añade al final) para poder
+    # leer instantáneas. Las consultas por clave son las del diccionario normal; los recorridos
+    # (values, items, keys, for) van siempre sobre una instantánea, así que nunca fallan con
+    # "dictionary changed size during iteration" aunque otro hilo esté insertando o borrando.
+    # Cuando el registro acumula muchas entradas dadas de baja se compacta en una lista nueva:
+    # las instantáneas ya tomadas conservan la lista antigua y no se ven afectadas. La compactación
+    # se hace después de publicar la versión y conserva las bajas posteriores a la compactación
+    # anterior, así que cualquier versión desde entonces se sigue pudiendo leer completa; las más
+    # antiguas se rechazan en lugar de devolver una vista incompleta.
+
+    def __init__(self, datos=None, reloj: Optional[RelojVersiones] = None):
+        super().__init__()
+        self.reloj = reloj or RelojVersiones()
+        self._registro: List[_Entrada] = []
+        # Entrada vigente de cada clave (clave -> _Entrada)
+        self._vigentes: Dict[object, _Entrada] = {}
+        # Versión más antigua que el registro puede mostrar completa, versión de la última
+        # compactación y escrituras desde entonces
+        self._minima = 0
+        self._corte = self.reloj.actual
+        self._escrituras = 0
+        if datos:
+            # Carga inicial de una vez (por ejemplo, al cargar un estado guardado): todas las entradas
+            # entran con la versión ya publicada, sin avanzar el reloj por cada una
+            with self.reloj.lock:
+                version = self.reloj.actual
+                for clave, valor in dict(datos).items():
+                    entrada = _Entrada(clave, valor, version)
+                    self._registro.append(entrada)
+                    self._vigentes[clave] = entrada
+                    dict.__setitem__(self, clave, valor)
+
+    def instantanea(self, version: Optional[int] = None) -> Instantanea:
+        # Vista de la colección en la versión actual (o en una versión concreta ya alcanzada).
+        # Primero el registro y después la versión y la longitud: si se compacta entre medias nos
+        # quedamos con la lista antigua, y todo lo escrito hasta la versión leída ya está en la lista
+        registro = self._registro
+        if version is None:
+            version = self.reloj.actual
+        elif version < self._minima:
+            raise ValueError(f"La versión {version} ya no está disponible (la más antigua es {self._minima}).")
+        return Instantanea(registro, len(registro), version)
+
+    # ---------- ESCRITURAS ----------
+    def __setitem__(self, clave, valor):
+        with self.reloj.lock:
+            version = self.reloj.actual + 1
+            anterior = self._vigentes.get(clave)
+            if anterior is not None:
+                anterior.baja = version
+            entrada = _Entrada(clave, valor, version)
+            self._registro.append(entrada)
+            self._vigentes[clave] = entrada
+            dict.__setitem__(self, clave, valor)
+            self.reloj.actual = version
+            self._compactar_si_hace_falta()
+
+    def __delitem__(self, clave):
+        with self.reloj.lock:
+            dict.__delitem__(self, clave)
+            version = self.reloj.actual + 1
+            self._vigentes.pop(clave).baja = version
+            self.reloj.actual = version
+            self._compactar_si_hace_falta()
+
+    def pop(self, clave, *por_defecto):
+        with self.reloj.lock:
+            if clave not in self:
+                if por_defecto:
+                    return por_defecto[0]
+                raise KeyError(clave)
+            valor = dict.pop(self, clave)
+            version = self.reloj.actual + 1
+            self._vigentes.pop(clave).baja = version
+            self.reloj.actual = version
+            self._compactar_si_hace_falta()
+            return valor
+
+    def setdefault(self, clave, valor=None):
+        with self.reloj.lock:
+            if clave in self:
+                return dict.__getitem__(self, clave)
+            self[clave] = valor
+            return valor
+
+    def update(self, *args, **kwargs):
+        for clave, valor in dict(*args, **kwargs).items():
+            self[clave] = valor
+
+    def popitem(self):
+        with self.reloj.lock:
+            clave = next(reversed(self._vigentes), None)
+            if clave is None:
+                raise KeyError("popitem(): la colección está vacía")
+            return clave, self.pop(clave)
+
+    def clear(self):
+        with self.reloj.lock:
+            version = self.reloj.actual + 1
+            for entrada in self._vigentes.values():
+                entrada.baja = version
+            # Lista nueva: las instantáneas ya tomadas siguen con la antigua, pero las versiones
+            # anteriores ya no se pueden pedir
+            self._minima = self._corte = version
+            self._escrituras = 0
+            self._vigentes = {}
+            self._registro = []
+            dict.clear(self)
+            self.reloj.actual = version
+
+    def _compactar_si_hace_falta(self):
+        # Con más escrituras desde la última compactación que claves vigentes, creamos un registro
+        # nuevo con las vigentes y las dadas de baja después de la compactación anterior (cada
+        # escritura da de baja como mucho una entrada, así que el registro no pasa de unas tres
+        # veces las claves vigentes). Se llama con la versión ya publicada. La versión mínima se
+        # cambia antes que el registro: quien lea el registro nuevo ya ve la mínima nueva
+        self._escrituras += 1
+        if self._escrituras > len(self._vigentes) + 1024:
+            corte = self._corte
+            self._minima = corte
+            self._registro = [e for e in self._registro if e.baja is None or e.baja > corte]
+            self._corte = self.reloj.actual
+            self._escrituras = 0
+
+    # ---------- LECTURAS ----------
+    def keys(self):
+        return self.instantanea().keys()
+
+    def values(self):
+        return self.instantanea().values()
+
+    def items(self):
+        return self.instantanea().items()
+
+    def __iter__(self):
+        return iter(self.instantanea().keys())
+
+    def copy(self) -> dict:
+        return dict(self.items())
+
+    def __reduce__(self):
+        # Al guardar el estado solo guardamos los datos y el reloj (compartido con las demás
+        # colecciones del servicio); el registro de versiones se rehace al cargar
+        return (self.__class__, (dict(self.items()), self.reloj))
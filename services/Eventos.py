@@ -0,0 +1,111 @@
+from __future__ import annotations
+import asyncio
+import threading
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+
+def _a_json(valor):
+    # Convertimos los valores que no son nativos de JSON (UUID, fechas...) a texto
+    if valor is None or isinstance(valor, (bool, int, float, str)):
+        return valor
+    return str(valor)
+
+
+class Evento:
+    # Clase que representa un cambio en el dominio (vehículo transferido, reserva finalizada...).
+    # El servicio los emite para que otros componentes (agregados, notificaciones) se enteren sin tener que consultar.
+
+    def __init__(self, tipo: str, datos: dict, secuencia: int = 0):
+        # Guardamos el tipo de evento, sus datos, su número de secuencia y cuándo se produjo
+        self.secuencia = secuencia
+        self.tipo = tipo
+        self.datos = datos
+        self.fecha = datetime.now()
+
+    def a_dict(self) -> dict:
+        # Representación serializable del evento (los UUID se convierten a texto)
+        return {
+            "secuencia": self.secuencia,
+            "tipo": self.tipo,
+            "fecha": self.fecha.isoformat(),
+            "datos": {clave: _a_json(valor) for clave, valor in self.datos.items()},
+        }
+
+    def __str__(self):
+        return f"[Evento#{self.secuencia}] {self.tipo} | {self.fecha:%Y-%m-%d %H:%M:%S} | {self.datos}"
+
+
+class BufferEventos:
+    # Buffer circular de tamaño fijo con los últimos eventos publicados, numerados de forma consecutiva.
+    # Los clientes leen a partir del último número de secuencia que conocen, así que todos comparten
+    # el mismo buffer (no hay una cola por suscriptor) y uno lento no frena a los demás: si se queda
+    # más atrás que la capacidad del buffer, se le avisa para que vuelva a sincronizarse.
+
+    def __init__(self, capacidad: int = 10000):
+        if capacidad <= 0:
+            raise ValueError("La capacidad del buffer debe ser positiva.")
+        self.capacidad = capacidad
+        self._eventos: List[Evento] = [None] * capacidad
+        self._ultima_secuencia = 0
+        self._lock = threading.Lock()
+        # Un aviso por bucle asyncio para despertar a los clientes que esperan eventos nuevos
+        self._avisos: Dict[asyncio.AbstractEventLoop, asyncio.Event] = {}
+
+    @property
+    def ultima_secuencia(self) -> int:
+        return self._ultima_secuencia
+
+    def publicar(self, tipo: str, datos: dict) -> Evento:
+        # Añadimos un evento (sobrescribiendo el más antiguo si el buffer está lleno)
+        with self._lock:
+            self._ultima_secuencia += 1
+            evento = Evento(tipo, datos, self._ultima_secuencia)
+            self._eventos[evento.secuencia % self.capacidad] = evento
+            avisos = list(self._avisos)
+
+        # Despertamos a los clientes en espera; se hace dentro de cada bucle porque
+        # podemos estar publicando desde un hilo distinto
+        for loop in avisos:
+            try:
+                loop.call_soon_threadsafe(self._renovar_aviso, loop)
+            except RuntimeError:
+                # El bucle ya se cerró: lo olvidamos
+                with self._lock:
+                    self._avisos.pop(loop, None)
+        return evento
+
+    def leer_desde(self, secuencia: int, limite: int = 500) -> Tuple[List[Evento], bool]:
+        # Devolvemos los eventos posteriores a 'secuencia' (como mucho 'limite') y si se han
+        # perdido eventos porque el cliente se quedó más atrás de lo que guarda el buffer
+        with self._lock:
+            primera = max(1, self._ultima_secuencia - self.capacidad + 1)
+            perdidos = secuencia + 1 < primera
+            inicio = max(secuencia + 1, primera)
+            fin = min(self._ultima_secuencia, inicio + limite - 1)
+            eventos = [self._eventos[s % self.capacidad] for s in range(inicio, fin + 1)]
+        return eventos, perdidos
+
+    async def esperar(self, secuencia: int, timeout: float) -> bool:
+        # Esperamos (sin bloquear el bucle) a que haya eventos posteriores a 'secuencia'.
+        # Devolvemos False si se agota el tiempo sin novedades.
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._ultima_secuencia > secuencia:
+                return True
+            aviso = self._avisos.get(loop)
+            if aviso is None:
+                aviso = self._avisos[loop] = asyncio.Event()
+        try:
+            await asyncio.wait_for(aviso.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _renovar_aviso(self, loop: asyncio.AbstractEventLoop):
+        # Se ejecuta en el propio bucle: activamos el aviso actual y dejamos uno nuevo para la siguiente espera
+        with self._lock:
+            aviso = self._avisos.get(loop)
+            self._avisos[loop] = asyncio.Event()
+        if aviso is not None:
+            aviso.set()
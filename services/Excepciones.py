@@ -0,0 +1,25 @@
+from __future__ import annotations
+from typing import List
+
+
+class ConflictoMantenimiento(ValueError):
+    # Las fechas pedidas para un mantenimiento o una reserva se solapan con otras reservas
+    # o mantenimientos del vehículo. Además del mensaje, indicamos qué intervalos chocan
+    # y qué vehículos equivalentes están libres en esas fechas, para poder ofrecer una salida.
+
+    def __init__(self, mensaje: str, conflictos: List[dict], alternativas: List[dict]):
+        super().__init__(mensaje)
+        # Cada conflicto: {"tipo": "RESERVA" | "MANTENIMIENTO", "id", "fecha_inicio", "fecha_fin"}
+        self.conflictos = conflictos
+        # Vehículos libres en esas fechas que pueden sustituirlo (mismo formato que VehiculoNoDisponible)
+        self.alternativas = alternativas
+
+
+class VehiculoNoDisponible(ValueError):
+    # El vehículo pedido no se puede reservar. Acompañamos el rechazo con otros vehículos libres
+    # en esas fechas, ya ordenados, para que el cliente pueda elegir uno sin volver a buscar.
+
+    def __init__(self, mensaje: str, alternativas: List[dict]):
+        super().__init__(mensaje)
+        # Cada alternativa: {"vehiculo", "motivo", "precio_estimado"}
+        self.alternativas = alternativas
@@ -0,0 +1,58 @@
+from __future__ import annotations
+from typing import Dict, Iterable, Tuple
+from uuid import UUID
+
+
+class IndiceDisponibilidad:
+    # Vehículos disponibles agrupados por sucursal y categoría. El servicio lo mantiene al día cada vez
+    # que un vehículo cambia de estado o de sucursal, así que para encontrar coches libres de una
+    # categoría en una sucursal vamos directamente a su grupo en lugar de recorrer toda la flota.
+
+    def __init__(self):
+        # UUID sucursal -> categoría (en minúsculas) -> {UUID vehículo -> Vehículo}
+        self._grupos: Dict[UUID, Dict[str, Dict[UUID, object]]] = {}
+        # Grupo en el que está cada vehículo indexado: UUID vehículo -> (UUID sucursal, categoría)
+        self._ubicacion: Dict[UUID, Tuple[UUID, str]] = {}
+
+    def actualizar(self, vehiculo):
+        # Colocamos el vehículo en su grupo si está disponible en el inventario de una sucursal,
+        # o lo sacamos del índice si no lo está
+        sucursal = vehiculo.sucursal
+        if vehiculo.estado == "DISPONIBLE" and sucursal is not None and vehiculo.id in sucursal.vehiculos:
+            nueva = (sucursal.id, vehiculo.categoria.lower())
+        else:
+            nueva = None
+
+        actual = self._ubicacion.get(vehiculo.id)
+        if actual == nueva:
+            return
+        if actual is not None:
+            self._sacar(vehiculo.id, actual)
+        if nueva is not None:
+            self._grupos.setdefault(nueva[0], {}).setdefault(nueva[1], {})[vehiculo.id] = vehiculo
+            self._ubicacion[vehiculo.id] = nueva
+
+    def quitar(self, vehiculo):
+        actual = self._ubicacion.get(vehiculo.id)
+        if actual is not None:
+            self._sacar(vehiculo.id, actual)
+
+    def _sacar(self, vehiculo_id: UUID, ubicacion: Tuple[UUID, str]):
+        sucursal_id, categoria = ubicacion
+        categorias = self._grupos[sucursal_id]
+        del categorias[categoria][vehiculo_id]
+        if not categorias[categoria]:
+            del categorias[categoria]
+            if not categorias:
+                del self._grupos[sucursal_id]
+        del self._ubicacion[vehiculo_id]
+
+    def disponibles(self, sucursal_id: UUID, categoria: str) -> Iterable:
+        # Vehículos disponibles de esa categoría en esa sucursal (en orden de llegada al grupo)
+        return self._grupos.get(sucursal_id, {}).get(categoria.lower(), {}).values()
+
+    def contar(self, sucursal_id: UUID, categoria: str) -> int:
+        return len(self._grupos.get(sucursal_id, {}).get(categoria.lower(), {}))
+
+    def __len__(self) -> int:
+        return len(self._ubicacion)
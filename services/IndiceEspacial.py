@@ -0,0 +1,135 @@
+from __future__ import annotations
+import heapq
+import math
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from uuid import UUID
+
+# Radio medio de la Tierra
+RADIO_TIERRA_KM = 6371.0088
+
+# Lado de cada celda de la rejilla, en grados (unos 28 km de norte a sur)
+TAMAÑO_CELDA = 0.25
+
+
+def distancia_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # Distancia sobre la superficie de la Tierra (fórmula del haversine)
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dlat = p2 - p1
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlon / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class IndiceEspacial:
+    # Rejilla de celdas de latitud y longitud con los objetos (sucursales) que caen en cada una.
+    # Altas, bajas y cambios de posición tocan solo su celda, así que se mantiene al día sin
+    # reconstruirlo. Para buscar los más cercanos recorremos anillos de celdas alrededor del punto,
+    # de dentro hacia fuera, y damos cada objeto en cuanto ninguno de los anillos sin mirar puede
+    # tener otro más cerca: las búsquedas solo miran las celdas próximas aunque haya miles de objetos.
+
+    def __init__(self, tamaño_celda: float = TAMAÑO_CELDA):
+        self.tamaño_celda = tamaño_celda
+        # Número de columnas que dan la vuelta al mundo (la longitud 180 es la misma que la -180)
+        # y última fila (la del polo norte)
+        self._columnas = max(1, round(360 / tamaño_celda))
+        self._ultima_fila = math.floor(180 / tamaño_celda)
+        # (fila, columna) -> {UUID -> (latitud, longitud, objeto)}
+        self._celdas: Dict[Tuple[int, int], Dict[UUID, Tuple[float, float, object]]] = {}
+        # Celda de cada objeto indexado
+        self._ubicacion: Dict[UUID, Tuple[int, int]] = {}
+
+    def _celda(self, latitud: float, longitud: float) -> Tuple[int, int]:
+        fila = min(math.floor((latitud + 90) / self.tamaño_celda), self._ultima_fila)
+        columna = math.floor((longitud + 180) / self.tamaño_celda) % self._columnas
+        return fila, columna
+
+    def actualizar(self, objeto_id: UUID, latitud: Optional[float], longitud: Optional[float], objeto):
+        # Colocamos el objeto en la celda de sus coordenadas (o lo quitamos si ya no tiene)
+        self.quitar(objeto_id)
+        if latitud is None or longitud is None:
+            return
+        celda = self._celda(latitud, longitud)
+        self._celdas.setdefault(celda, {})[objeto_id] = (latitud, longitud, objeto)
+        self._ubicacion[objeto_id] = celda
+
+    def quitar(self, objeto_id: UUID):
+        celda = self._ubicacion.pop(objeto_id, None)
+        if celda is not None:
+            contenido = self._celdas[celda]
+            del contenido[objeto_id]
+            if not contenido:
+                del self._celdas[celda]
+
+    def por_distancia(self, latitud: float, longitud: float) -> Iterator[Tuple[float, object]]:
+        # Objetos de más cerca a más lejos, como (distancia en km, objeto). Es un generador:
+        # quien solo necesite los primeros deja de pedir y no se miran más celdas
+        if not self._ubicacion:
+            return
+        fila, columna = self._celda(latitud, longitud)
+        candidatos: List[Tuple[float, int, object]] = []
+        vistas: Set[Tuple[int, int]] = set()
+        encontrados = 0
+        desempate = 0
+        anillo = 0
+        while True:
+            # Cuando ya hemos mirado tantas celdas como celdas ocupadas hay en todo el índice (objetos
+            # muy dispersos o lejanos), es más barato recorrer directamente las ocupadas que quedan
+            if (2 * anillo + 1) ** 2 >= len(self._celdas):
+                celdas = [c for c in self._celdas if c not in vistas]
+            else:
+                celdas = self._anillo(fila, columna, anillo)
+            for celda in celdas:
+                if celda in vistas:
+                    continue
+                vistas.add(celda)
+                for lat, lon, objeto in self._celdas.get(celda, {}).values():
+                    desempate += 1
+                    heapq.heappush(candidatos, (distancia_km(latitud, longitud, lat, lon), desempate, objeto))
+                    encontrados += 1
+
+            # Todo lo que quede fuera de los anillos ya mirados está al menos a esta distancia
+            if encontrados == len(self._ubicacion):
+                limite = math.inf
+            else:
+                limite = self._distancia_minima_fuera(latitud, anillo)
+            while candidatos and candidatos[0][0] <= limite:
+                distancia, _, objeto = heapq.heappop(candidatos)
+                yield distancia, objeto
+            if not candidatos and encontrados == len(self._ubicacion):
+                return
+            anillo += 1
+
+    def cercanos(self, latitud: float, longitud: float, k: int,
+                 filtro: Optional[Callable[[object], bool]] = None) -> List[Tuple[float, object]]:
+        # Los k objetos más cercanos que cumplan el filtro (si lo hay)
+        resultado = []
+        for distancia, objeto in self.por_distancia(latitud, longitud):
+            if filtro is None or filtro(objeto):
+                resultado.append((distancia, objeto))
+                if len(resultado) == k:
+                    break
+        return resultado
+
+    def _anillo(self, fila: int, columna: int, radio: int) -> Iterator[Tuple[int, int]]:
+        # Celdas a distancia exactamente 'radio' (en celdas) de la central. Las columnas dan la
+        # vuelta al llegar a ±180 grados; las filas más allá de los polos no existen
+        if radio == 0:
+            yield fila, columna
+            return
+        for df in range(max(-radio, -fila), min(radio, self._ultima_fila - fila) + 1):
+            paso = 1 if abs(df) == radio else 2 * radio
+            for dc in range(-radio, radio + 1, paso):
+                yield fila + df, (columna + dc) % self._columnas
+
+    def _distancia_minima_fuera(self, latitud: float, anillo: int) -> float:
+        # Cota inferior de la distancia a cualquier punto fuera de los anillos 0..'anillo': está al
+        # menos 'grados' más allá en latitud o en longitud. Por el haversine, una separación Δλ en
+        # longitud entre latitudes de valor absoluto como mucho φ da d >= 2R·asin(cos φ · sin(Δλ/2)),
+        # que además es menor que la de una separación igual en latitud (R·Δφ), así que vale para las dos
+        grados = min(anillo * self.tamaño_celda, 180.0)
+        lat_extrema = min(90.0, abs(latitud) + grados + self.tamaño_celda)
+        seno = math.cos(math.radians(lat_extrema)) * math.sin(math.radians(grados) / 2)
+        return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, seno))
+
+    def __len__(self) -> int:
+        return len(self._ubicacion)
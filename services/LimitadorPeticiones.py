@@ -0,0 +1,152 @@
+from __future__ import annotations
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cuántas cubetas guardamos como mucho en memoria. Al llenarse olvidamos las que llevan más tiempo
+# sin usarse (una cubeta olvidada vuelve a empezar llena, igual que la de un cliente nuevo)
+MAX_CUBETAS = 100_000
+
+# Cubeta a consumir: (clave, capacidad, fichas repuestas por segundo)
+Consumo = Tuple[str, float, float]
+
+
+class Limite:
+    # Cubeta de fichas: admite ráfagas de hasta 'capacidad' peticiones y repone 'por_minuto' fichas cada minuto
+
+    def __init__(self, capacidad: int, por_minuto: float):
+        if capacidad < 1 or por_minuto <= 0:
+            raise ValueError("La capacidad y el ritmo del límite deben ser positivos.")
+        self.capacidad = capacidad
+        self.por_minuto = por_minuto
+
+    @property
+    def por_segundo(self) -> float:
+        return self.por_minuto / 60.0
+
+
+class AlmacenLocal:
+    # Cubetas en memoria del proceso, en un diccionario LRU acotado. Cada worker lleva sus propias
+    # cuentas; también sirve como sustituto del almacén compartido en pruebas.
+
+    def __init__(self, max_cubetas: int = MAX_CUBETAS, reloj=time.monotonic):
+        self.max_cubetas = max_cubetas
+        self._reloj = reloj
+        # Clave -> (fichas, instante de la última actualización)
+        self._cubetas: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consumir(self, consumos: List[Consumo]) -> float:
+        # Gastamos una ficha de cada cubeta, todas o ninguna. Devolvemos 0 si la petición pasa
+        # o los segundos que faltan hasta que haya ficha en todas
+        with self._lock:
+            ahora = self._reloj()
+            fichas = []
+            espera = 0.0
+            for clave, capacidad, ritmo in consumos:
+                actuales, ultima = self._cubetas.get(clave, (capacidad, ahora))
+                actuales = min(capacidad, actuales + (ahora - ultima) * ritmo)
+                if actuales < 1:
+                    espera = max(espera, (1 - actuales) / ritmo)
+                fichas.append(actuales)
+            if espera:
+                return espera
+            for (clave, _, _), actuales in zip(consumos, fichas):
+                self._cubetas[clave] = (actuales - 1, ahora)
+                self._cubetas.move_to_end(clave)
+            while len(self._cubetas) > self.max_cubetas:
+                self._cubetas.popitem(last=False)
+            return 0.0
+
+    def __len__(self) -> int:
+        return len(self._cubetas)
+
+
+# Misma lógica que AlmacenLocal.consumir, ejecutada de forma atómica dentro de Redis.
+# Usamos el reloj de Redis para que todos los workers cuenten con la misma hora.
+_SCRIPT_REDIS = """
+local t = redis.call('TIME')
+local ahora = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local espera = 0
+local fichas = {}
+for i, clave in ipairs(KEYS) do
+    local capacidad = tonumber(ARGV[2 * i - 1])
+    local ritmo = tonumber(ARGV[2 * i])
+    local datos = redis.call('HMGET', clave, 'f', 'u')
+    local actuales = tonumber(datos[1]) or capacidad
+    local ultima = tonumber(datos[2]) or ahora
+    actuales = math.min(capacidad, actuales + math.max(0, ahora - ultima) * ritmo)
+    if actuales < 1 then
+        espera = math.max(espera, (1 - actuales) / ritmo)
+    end
+    fichas[i] = actuales
+end
+if espera == 0 then
+    for i, clave in ipairs(KEYS) do
+        local capacidad = tonumber(ARGV[2 * i - 1])
+        local ritmo = tonumber(ARGV[2 * i])
+        redis.call('HSET', clave, 'f', fichas[i] - 1, 'u', ahora)
+        -- Una cubeta que se ha llenado del todo ya no aporta nada: dejamos que caduque
+        redis.call('PEXPIRE', clave, math.ceil(capacidad / ritmo * 1000))
+    end
+end
+return tostring(espera)
+"""
+
+
+class AlmacenRedis:
+    # Cubetas compartidas por todos los workers en Redis, para que los límites valgan para
+    # el conjunto y no para cada proceso. Redis es opcional: solo se importa al usar este almacén.
+
+    def __init__(self, cliente, prefijo: str = "alquiler:limite:"):
+        self.prefijo = prefijo
+        self._script = cliente.register_script(_SCRIPT_REDIS)
+
+    @classmethod
+    def desde_url(cls, url: str, **opciones) -> "AlmacenRedis":
+        import redis
+        return cls(redis.Redis.from_url(url), **opciones)
+
+    def consumir(self, consumos: List[Consumo]) -> float:
+        claves = [self.prefijo + clave for clave, _, _ in consumos]
+        argumentos = [valor for _, capacidad, ritmo in consumos for valor in (capacidad, ritmo)]
+        try:
+            return float(self._script(keys=claves, args=argumentos))
+        except Exception:
+            # Si Redis no responde dejamos pasar la petición: mejor sin límite que sin servicio
+            logger.exception("No se pudo consultar el límite de peticiones en Redis")
+            return 0.0
+
+
+class LimitadorPeticiones:
+    # Límite de peticiones por ruta con cubetas de fichas: una por cada cliente (IP o usuario del token)
+    # y, opcionalmente, otra para toda la ruta que frena también los abusos repartidos entre muchos clientes.
+
+    def __init__(self, almacen=None):
+        self.almacen = almacen if almacen is not None else AlmacenLocal()
+        # Ruta -> (límite por cliente, límite total de la ruta)
+        self._reglas: Dict[str, Tuple[Limite, Optional[Limite]]] = {}
+
+    def configurar(self, ruta: str, por_cliente: Limite, total: Optional[Limite] = None):
+        self._reglas[ruta] = (por_cliente, total)
+
+    def comprobar(self, ruta: str, cliente: str) -> float:
+        # Devolvemos 0 si la petición puede pasar o los segundos que el cliente debe esperar
+        regla = self._reglas.get(ruta)
+        if regla is None:
+            return 0.0
+        por_cliente, total = regla
+        consumos = [(f"{ruta}|{cliente}", por_cliente.capacidad, por_cliente.por_segundo)]
+        if total is not None:
+            consumos.append((ruta, total.capacidad, total.por_segundo))
+        return self.almacen.consumir(consumos)
+
+    @staticmethod
+    def reintentar_en(espera: float) -> str:
+        # Valor de la cabecera Retry-After: segundos enteros, redondeando hacia arriba
+        return str(max(1, math.ceil(espera)))
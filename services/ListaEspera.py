@@ -0,0 +1,119 @@
+from __future__ import annotations
+from bisect import insort
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+# Solicitudes ya resueltas (asignadas, canceladas o caducadas) que recordamos para que el cliente
+# pueda consultar su resultado. Por encima, olvidamos las más antiguas
+MAX_RESUELTAS = 100_000
+
+
+class SolicitudEspera:
+    # Petición de un cliente que espera a que quede libre un vehículo de una categoría en una
+    # sucursal para unas fechas. Empieza PENDIENTE y termina ASIGNADA (con su reserva), CANCELADA
+    # o CADUCADA (si llega la fecha de recogida sin vehículo).
+
+    def __init__(self, cliente_id: UUID, sucursal_id: UUID, categoria: str, fecha_inicio: datetime,
+                 fecha_fin: datetime, sucursal_devolucion_id: UUID, secuencia: int):
+        self.id: UUID = uuid4()
+        self.cliente_id = cliente_id
+        self.sucursal_id = sucursal_id
+        self.categoria = categoria
+        self.fecha_inicio = fecha_inicio
+        self.fecha_fin = fecha_fin
+        self.sucursal_devolucion_id = sucursal_devolucion_id
+        self.secuencia = secuencia
+        self.creada = datetime.now()
+        self.estado = "PENDIENTE"
+        self.reserva_id: Optional[UUID] = None
+
+    @property
+    def clave(self) -> tuple:
+        # Misma petición del mismo cliente: los reintentos no crean solicitudes nuevas
+        return (self.cliente_id, self.sucursal_id, self.categoria.lower(),
+                self.fecha_inicio, self.fecha_fin, self.sucursal_devolucion_id)
+
+
+class ListaEspera:
+    # Colas de espera por sucursal y categoría. Cada cola está ordenada por prioridad: primero la
+    # recogida más próxima y, a igualdad, la que llegó antes. Cuando queda libre un vehículo, el
+    # servicio recorre solo la cola de su sucursal y categoría. El servicio la protege con su cerrojo.
+
+    def __init__(self):
+        self._secuencia = 0
+        # (UUID sucursal, categoría en minúsculas) -> [(fecha_inicio, secuencia, UUID solicitud)] ordenada
+        self._colas: Dict[Tuple[UUID, str], List[Tuple[datetime, int, UUID]]] = {}
+        self._pendientes: Dict[UUID, SolicitudEspera] = {}
+        self._por_clave: Dict[tuple, UUID] = {}
+        self._resueltas: "OrderedDict[UUID, SolicitudEspera]" = OrderedDict()
+
+    def encolar(self, cliente_id: UUID, sucursal_id: UUID, categoria: str, fecha_inicio: datetime,
+                fecha_fin: datetime, sucursal_devolucion_id: UUID) -> Tuple[SolicitudEspera, bool]:
+        # Devolvemos la solicitud y si es nueva (un reintento devuelve la que ya estaba en la cola)
+        self._secuencia += 1
+        solicitud = SolicitudEspera(cliente_id, sucursal_id, categoria, fecha_inicio, fecha_fin,
+                                    sucursal_devolucion_id, self._secuencia)
+        existente = self._por_clave.get(solicitud.clave)
+        if existente is not None:
+            return self._pendientes[existente], False
+        self._pendientes[solicitud.id] = solicitud
+        self._por_clave[solicitud.clave] = solicitud.id
+        insort(self._colas.setdefault((sucursal_id, categoria.lower()), []),
+               (fecha_inicio, solicitud.secuencia, solicitud.id))
+        return solicitud, True
+
+    def obtener(self, solicitud_id: UUID) -> SolicitudEspera:
+        solicitud = self._pendientes.get(solicitud_id) or self._resueltas.get(solicitud_id)
+        if solicitud is None:
+            raise ValueError("Solicitud de espera no encontrada.")
+        return solicitud
+
+    def hay_pendientes(self, sucursal_id: UUID, categoria: str) -> bool:
+        return (sucursal_id, categoria.lower()) in self._colas
+
+    def pendientes(self, sucursal_id: UUID, categoria: str, ahora: Optional[datetime] = None) -> List[SolicitudEspera]:
+        # Solicitudes pendientes de la cola por orden de prioridad. De paso caducamos las que ya
+        # no se pueden atender porque su fecha de recogida ha pasado (están al principio de la cola)
+        cola = self._colas.get((sucursal_id, categoria.lower()), [])
+        hoy = (ahora or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+        while cola and cola[0][0] < hoy:
+            self._resolver(self._pendientes[cola[0][2]], "CADUCADA")
+        return [self._pendientes[solicitud_id] for _, _, solicitud_id in cola]
+
+    def posicion(self, solicitud: SolicitudEspera) -> Optional[int]:
+        # Posición en su cola (1 = la siguiente en recibir vehículo), o None si ya no está pendiente
+        if solicitud.estado != "PENDIENTE":
+            return None
+        cola = self._colas[(solicitud.sucursal_id, solicitud.categoria.lower())]
+        return cola.index((solicitud.fecha_inicio, solicitud.secuencia, solicitud.id)) + 1
+
+    def asignar(self, solicitud: SolicitudEspera, reserva_id: UUID):
+        solicitud.reserva_id = reserva_id
+        self._resolver(solicitud, "ASIGNADA")
+
+    def cancelar(self, solicitud_id: UUID) -> SolicitudEspera:
+        solicitud = self._pendientes.get(solicitud_id)
+        if solicitud is None:
+            self.obtener(solicitud_id)
+            raise ValueError("La solicitud de espera ya no está pendiente.")
+        self._resolver(solicitud, "CANCELADA")
+        return solicitud
+
+    def _resolver(self, solicitud: SolicitudEspera, estado: str):
+        # Sacamos la solicitud de su cola y la guardamos entre las resueltas
+        clave_cola = (solicitud.sucursal_id, solicitud.categoria.lower())
+        cola = self._colas[clave_cola]
+        cola.remove((solicitud.fecha_inicio, solicitud.secuencia, solicitud.id))
+        if not cola:
+            del self._colas[clave_cola]
+        del self._pendientes[solicitud.id]
+        del self._por_clave[solicitud.clave]
+        solicitud.estado = estado
+        self._resueltas[solicitud.id] = solicitud
+        if len(self._resueltas) > MAX_RESUELTAS:
+            self._resueltas.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._pendientes)
@@ -0,0 +1,186 @@
+from __future__ import annotations
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+# Multiplicador según la ocupación de la sucursal y categoría ese día: (ocupación por debajo de la cual aplica, multiplicador).
+# Por encima del último umbral se aplica el último multiplicador.
+TRAMOS_OCUPACION: List[Tuple[float, float]] = [
+    (0.50, 1.00),
+    (0.70, 1.10),
+    (0.85, 1.25),
+    (1.00, 1.40),
+]
+
+# Duración máxima de un alquiler o de un presupuesto, en días
+DIAS_MAXIMOS = 365
+
+# Multiplicadores guardados como mucho por cada sucursal y categoría (al pasar de ahí se olvidan
+# los que se calcularon primero)
+DIAS_EN_MEMORIA = 2 * DIAS_MAXIMOS
+
+_UN_DIA = timedelta(days=1)
+
+
+class Temporada:
+    # Periodo del año con un multiplicador de precio (por ejemplo, verano o Navidad). Se repite
+    # todos los años entre las fechas indicadas como "MM-DD" (puede cruzar el fin de año) y puede
+    # limitarse a una sucursal o a una categoría.
+
+    def __init__(self, nombre: str, inicio: str, fin: str, multiplicador: float,
+                 sucursal_id: Optional[UUID] = None, categoria: Optional[str] = None):
+        self.id: UUID = uuid4()
+        self.nombre = nombre.strip()
+        self.inicio = self._parsear_dia(inicio)
+        self.fin = self._parsear_dia(fin)
+        self.multiplicador = multiplicador
+        self.sucursal_id = sucursal_id
+        self.categoria = categoria.strip() if categoria else None
+
+        if not self.nombre:
+            raise ValueError("El nombre de la temporada no puede estar vacío.")
+        if self.multiplicador <= 0:
+            raise ValueError("El multiplicador de la temporada debe ser positivo.")
+
+    @staticmethod
+    def _parsear_dia(texto: str) -> Tuple[int, int]:
+        # Convertimos "MM-DD" en (mes, día); usamos un año bisiesto para admitir el 29 de febrero
+        try:
+            fecha = datetime.strptime(f"2024-{texto}", "%Y-%m-%d")
+        except ValueError:
+            raise ValueError(f"Fecha de temporada '{texto}' no válida. Usa el formato MM-DD.")
+        return fecha.month, fecha.day
+
+    def aplica(self, dia: datetime, sucursal_id: UUID, categoria: str) -> bool:
+        # Indicamos si la temporada cubre ese día para esa sucursal y categoría
+        if self.sucursal_id is not None and self.sucursal_id != sucursal_id:
+            return False
+        if self.categoria is not None and self.categoria.lower() != categoria.lower():
+            return False
+        actual = (dia.month, dia.day)
+        if self.inicio <= self.fin:
+            return self.inicio <= actual <= self.fin
+        # La temporada cruza el fin de año (por ejemplo, del 20 de diciembre al 7 de enero)
+        return actual >= self.inicio or actual <= self.fin
+
+    def __str__(self):
+        return (f"[Temporada#{self.id}] {self.nombre} | {self.inicio[0]:02d}-{self.inicio[1]:02d} a "
+                f"{self.fin[0]:02d}-{self.fin[1]:02d} | x{self.multiplicador}")
+
+
+class MotorPrecios:
+    # Precios dinámicos por encima de la tarifa: el precio de cada día es el precio diario de la tarifa
+    # por un multiplicador que depende de la ocupación de la sucursal y categoría ese día y de las
+    # temporadas configuradas.
+    # La ocupación se lleva con contadores que se actualizan al crear, cancelar o cerrar reservas
+    # y al mover vehículos, y los multiplicadores de cada día se guardan ya calculados. Cuando cambia
+    # una reserva solo se recalculan los días afectados, así que un presupuesto cuesta O(días).
+
+    def __init__(self, tramos: Optional[List[Tuple[float, float]]] = None):
+        self.tramos = tramos or TRAMOS_OCUPACION
+        self.temporadas: Dict[UUID, Temporada] = {}
+        # Vehículos de cada (sucursal, categoría) y reservas que ocupan cada (sucursal, categoría, día)
+        self._flota: Dict[Tuple[UUID, str], int] = {}
+        self._reservados: Dict[Tuple[UUID, str, datetime], int] = {}
+        # Multiplicadores ya calculados: (sucursal, categoría) -> {día -> multiplicador}
+        self._multiplicadores: Dict[Tuple[UUID, str], Dict[datetime, float]] = {}
+
+    # ---------- OCUPACIÓN ----------
+    def sumar_vehiculo(self, sucursal_id: UUID, categoria: str, cantidad: int = 1):
+        # Un vehículo entra (o sale, con cantidad negativa) del inventario de una sucursal.
+        # Cambia la ocupación de todos los días de esa sucursal y categoría.
+        clave = (sucursal_id, categoria.lower())
+        total = self._flota.get(clave, 0) + cantidad
+        if total > 0:
+            self._flota[clave] = total
+        else:
+            self._flota.pop(clave, None)
+        self._multiplicadores.pop(clave, None)
+
+    def registrar_reserva(self, reserva):
+        self._sumar_reserva(reserva, 1)
+
+    def quitar_reserva(self, reserva):
+        self._sumar_reserva(reserva, -1)
+
+    def _sumar_reserva(self, reserva, cantidad: int):
+        # La reserva ocupa los días [inicio, fin) en su sucursal de recogida: actualizamos esos
+        # contadores y olvidamos solo los multiplicadores de esos días
+        sucursal_id = reserva.sucursal_recogida.id
+        categoria = reserva.vehiculo.categoria.lower()
+        memoria = self._multiplicadores.get((sucursal_id, categoria))
+        dia = reserva.fecha_inicio
+        while dia < reserva.fecha_fin:
+            clave = (sucursal_id, categoria, dia)
+            total = self._reservados.get(clave, 0) + cantidad
+            if total > 0:
+                self._reservados[clave] = total
+            else:
+                self._reservados.pop(clave, None)
+            if memoria is not None:
+                memoria.pop(dia, None)
+            dia += _UN_DIA
+
+    def ocupacion(self, sucursal_id: UUID, categoria: str, dia: datetime) -> float:
+        # Parte de la flota de esa sucursal y categoría que está reservada ese día (0 si no hay flota)
+        categoria = categoria.lower()
+        flota = self._flota.get((sucursal_id, categoria), 0)
+        if flota == 0:
+            return 0.0
+        return self._reservados.get((sucursal_id, categoria, dia), 0) / flota
+
+    # ---------- TEMPORADAS ----------
+    def agregar_temporada(self, temporada: Temporada) -> Temporada:
+        self.temporadas[temporada.id] = temporada
+        self._multiplicadores.clear()
+        return temporada
+
+    def eliminar_temporada(self, temporada_id: UUID):
+        if self.temporadas.pop(temporada_id, None) is None:
+            raise ValueError("Temporada no encontrada.")
+        self._multiplicadores.clear()
+
+    # ---------- PRECIOS ----------
+    def multiplicador(self, sucursal_id: UUID, categoria: str, dia: datetime) -> float:
+        # Multiplicador de un día, calculado una vez y guardado hasta que cambie algo que le afecte
+        memoria = self._multiplicadores.setdefault((sucursal_id, categoria.lower()), {})
+        valor = memoria.get(dia)
+        if valor is None:
+            if len(memoria) >= DIAS_EN_MEMORIA:
+                del memoria[next(iter(memoria))]
+            valor = memoria[dia] = self._calcular_multiplicador(sucursal_id, categoria, dia)
+        return valor
+
+    def _calcular_multiplicador(self, sucursal_id: UUID, categoria: str, dia: datetime) -> float:
+        ocupacion = self.ocupacion(sucursal_id, categoria, dia)
+        por_ocupacion = self.tramos[-1][1]
+        for umbral, valor in self.tramos:
+            if ocupacion < umbral:
+                por_ocupacion = valor
+                break
+        # Si varias temporadas coinciden, aplicamos la más alta (no se acumulan)
+        por_temporada = max((t.multiplicador for t in self.temporadas.values()
+                             if t.aplica(dia, sucursal_id, categoria)), default=1.0)
+        return round(por_ocupacion * por_temporada, 4)
+
+    def cotizar(self, tarifa, sucursal_id: UUID, inicio: datetime, fin: datetime) -> dict:
+        # Precio del alquiler entre inicio y fin (sin incluir el día de devolución), día a día
+        if fin <= inicio:
+            raise ValueError("La fecha de fin debe ser posterior a la fecha de inicio.")
+        if (fin - inicio).days > DIAS_MAXIMOS:
+            raise ValueError(f"El alquiler no puede durar más de {DIAS_MAXIMOS} días.")
+        detalle = []
+        dia = inicio
+        while dia < fin:
+            multiplicador = self.multiplicador(sucursal_id, tarifa.categoria, dia)
+            detalle.append({"fecha": dia, "multiplicador": multiplicador,
+                            "precio": round(tarifa.precio_diario * multiplicador, 2)})
+            dia += _UN_DIA
+        return {
+            "categoria": tarifa.categoria,
+            "sucursal_id": sucursal_id,
+            "dias": len(detalle),
+            "precio_diario": tarifa.precio_diario,
+            "total": round(sum(d["precio"] for d in detalle), 2),
+            "detalle": detalle,
+        }
@@ -0,0 +1,713 @@
+from __future__ import annotations
+import gc
+import heapq
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+from uuid import UUID
+
+from models.Vehiculo import Vehiculo, normalizar_matricula
+from models.Reserva import Reserva
+from services.AlquilerServicio import AlquilerServicio
+from services.AgregadosVehiculo import TotalesVehiculo
+
+logger = logging.getLogger(__name__)
+
+
+def _resumen_vehiculo(vehiculo: Vehiculo) -> dict:
+    # Lo que devuelve una partición de un vehículo: datos planos, sin arrastrar sucursal ni reservas
+    # (los datos propios de cada tipo de vehículo van como None si no los tiene)
+    return {
+        "id": vehiculo.id,
+        "clase": type(vehiculo).__name__,
+        "matricula": vehiculo.matricula,
+        "marca": vehiculo.marca,
+        "modelo": vehiculo.modelo,
+        "año": vehiculo.año,
+        "categoria": vehiculo.categoria,
+        "km": vehiculo.km,
+        "estado": vehiculo.estado,
+        "sucursal_id": vehiculo.sucursal.id if vehiculo.sucursal else None,
+        "sucursal_nombre": vehiculo.sucursal.nombre if vehiculo.sucursal else None,
+        "puertas": getattr(vehiculo, "puertas", None),
+        "tipo_motor": getattr(vehiculo, "tipo_motor", None),
+        "cilindrada": getattr(vehiculo, "cilindrada", None),
+        "capacidad_carga": getattr(vehiculo, "capacidad_carga", None),
+    }
+
+
+def _resumen_reserva(reserva: Reserva) -> dict:
+    return {
+        "id": reserva.id,
+        "cliente_id": reserva.cliente.id,
+        "cliente_nombre": reserva.cliente.nombre,
+        "vehiculo_id": reserva.vehiculo.id,
+        "vehiculo_matricula": reserva.vehiculo.matricula,
+        "sucursal_recogida_id": reserva.sucursal_recogida.id,
+        "sucursal_recogida_nombre": reserva.sucursal_recogida.nombre,
+        "sucursal_devolucion_id": reserva.sucursal_devolucion.id,
+        "sucursal_devolucion_nombre": reserva.sucursal_devolucion.nombre,
+        "fecha_inicio": reserva.fecha_inicio,
+        "fecha_fin": reserva.fecha_fin,
+        "dias": reserva.dias,
+        "estado": reserva.estado,
+        "total_estimado": reserva.total_estimado,
+        "total_final": reserva.total_final,
+        "pagada": reserva.pagada,
+    }
+
+
+def _resumen_totales(totales: TotalesVehiculo) -> dict:
+    # Totales de rentabilidad de un vehículo, con el vehículo resumido
+    return {
+        "vehiculo": _resumen_vehiculo(totales.vehiculo),
+        "ingresos": totales.ingresos,
+        "coste_mantenimiento": totales.coste_mantenimiento,
+        "beneficio": totales.beneficio,
+        "alquileres": totales.alquileres,
+        "dias_alquilado": totales.dias_alquilado,
+        "km_recorridos": totales.km_recorridos,
+        "mantenimientos": totales.mantenimientos,
+        "dias_en_flota": totales.dias_en_flota(),
+        "utilizacion": totales.utilizacion(),
+    }
+
+
+class _Particion:
+    # Lo que corre dentro de cada proceso: un AlquilerServicio con el inventario, las reservas y los
+    # mantenimientos de sus sucursales, más copias de lo que comparten todas las particiones
+    # (usuarios, tarifas y la lista de sucursales, para poder devolver un vehículo en cualquiera).
+    # Cada reserva vive solo en la partición que tiene el vehículo.
+
+    def __init__(self, servicio: AlquilerServicio):
+        self.servicio = servicio
+        # Sucursales cuyo inventario pertenece a esta partición
+        self.propias: Set[UUID] = set()
+        # Traspasos preparados y pendientes de confirmar (UUID vehículo -> vehículo o datos)
+        self._salidas: Dict[UUID, Vehiculo] = {}
+        self._entradas: Dict[UUID, tuple] = {}
+
+    # ---------- REPARTO ----------
+    def recortar(self, propias: Set[UUID], principal: bool):
+        # Partiendo del estado completo, nos quedamos con los vehículos de nuestras sucursales
+        # (y, en la partición principal, con los que no tienen sucursal) y con sus reservas y mantenimientos
+        servicio = self.servicio
+        self.propias = set(propias)
+        with servicio._lock:
+            nuestros = {v.id for v in servicio.vehiculos.values()
+                        if (v.sucursal.id in self.propias if v.sucursal else principal)}
+
+            for reserva in servicio.reservas.values():
+                if reserva.vehiculo.id in nuestros:
+                    continue
+                if reserva.estado == "ACTIVA":
+                    servicio._quitar_reserva_activa(reserva)
+                reserva.cliente.eliminar_reserva(reserva)
+                reserva.sucursal_recogida.eliminar_reserva(reserva)
+                reserva.sucursal_devolucion.eliminar_reserva(reserva)
+                del servicio.reservas[reserva.id]
+
+            for mantenimiento in servicio.mantenimientos.values():
+                if mantenimiento.vehiculo.id not in nuestros:
+                    del servicio.mantenimientos[mantenimiento.id]
+            servicio._inicios_mantenimiento = [e for e in servicio._inicios_mantenimiento
+                                               if e[1] in servicio.mantenimientos]
+
+            for vehiculo in servicio.vehiculos.values():
+                if vehiculo.id not in nuestros:
+                    self._olvidar_vehiculo(vehiculo)
+
+            return self.reparto()
+
+    def reparto(self):
+        # Lo que el enrutador necesita saber de esta partición: sus sucursales, vehículos y reservas,
+        # y los traspasos preparados que aún no se han confirmado ni cancelado
+        servicio = self.servicio
+        with servicio._lock:
+            return {
+                "propias": set(self.propias),
+                "vehiculos": {v.id: normalizar_matricula(v.matricula) for v in servicio.vehiculos.values()},
+                "reservas": list(servicio.reservas),
+                "salidas": list(self._salidas),
+                "entradas": list(self._entradas),
+            }
+
+    # ---------- ESTADO GUARDADO ----------
+    def guardar(self, ruta: str):
+        # Guardamos la partición entera (servicio, sucursales propias y traspasos a medias), como
+        # AlquilerServicio.guardar_estado
+        temporal = f"{ruta}.tmp"
+        with self.servicio._lock, open(temporal, "wb") as fichero:
+            pickle.dump(self, fichero, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta)
+
+    @staticmethod
+    def cargar(ruta: str) -> "_Particion":
+        # Como en AlquilerServicio.cargar_estado, sin el recolector de basura durante la carga
+        gc_activo = gc.isenabled()
+        gc.disable()
+        try:
+            with open(ruta, "rb") as fichero:
+                particion = pickle.load(fichero)
+        finally:
+            if gc_activo:
+                gc.enable()
+        if not isinstance(particion, _Particion):
+            raise ValueError("El fichero no contiene una partición del servicio de alquiler.")
+        return particion
+
+    def replicar(self, objeto):
+        # Alta de un usuario, una tarifa o una sucursal con el mismo id que en el resto de particiones
+        coleccion = {"Cliente": "usuarios", "Administrador": "usuarios",
+                     "Tarifa": "tarifas", "Sucursal": "sucursales"}[type(objeto).__name__]
+        getattr(self.servicio, coleccion)[objeto.id] = objeto
+        if coleccion == "sucursales":
+            self.servicio.mapa_sucursales.actualizar(objeto.id, objeto.latitud, objeto.longitud, objeto)
+
+    def adoptar(self, sucursal_id: UUID):
+        self.servicio.obtener_sucursal(sucursal_id)
+        self.propias.add(sucursal_id)
+
+    def actualizar_password(self, usuario_id: UUID, password: str):
+        self.servicio.actualizar_password(usuario_id, password)
+
+    # ---------- OPERACIONES ----------
+    def registrar_vehiculo(self, tipo, matricula, marca, modelo, año, categoria, km, sucursal_id, extras):
+        if sucursal_id not in self.propias:
+            raise ValueError("La sucursal no pertenece a esta partición.")
+        sucursal = self.servicio.obtener_sucursal(sucursal_id)
+        vehiculo = self.servicio.registrar_vehiculo(tipo, matricula, marca, modelo, año, categoria, km,
+                                                    sucursal, **extras)
+        return _resumen_vehiculo(vehiculo)
+
+    def realizar_reserva(self, cliente_id, vehiculo_id, fecha_inicio, fecha_fin, id_sucursal_devolucion):
+        if vehiculo_id in self._salidas:
+            raise ValueError("El vehículo se está traspasando a otra sucursal.")
+        reserva = self.servicio.realizar_reserva(cliente_id, vehiculo_id, fecha_inicio, fecha_fin,
+                                                 id_sucursal_devolucion)
+        return _resumen_reserva(reserva)
+
+    def cancelar_reserva(self, reserva_id: UUID):
+        return _resumen_reserva(self.servicio.cancelar_reserva(reserva_id))
+
+    def obtener_reserva(self, reserva_id: UUID):
+        return _resumen_reserva(self.servicio.obtener_reserva(reserva_id))
+
+    def finalizar_reserva(self, reserva_id: UUID, km_recorridos, retraso_dias, combustible_correcto, metodo_pago):
+        # Además del pago, indicamos si el vehículo ha quedado en una sucursal de otra partición
+        pago = self.servicio.finalizar_reserva(reserva_id, km_recorridos, retraso_dias,
+                                               combustible_correcto, metodo_pago)
+        vehiculo = self.servicio.reservas[reserva_id].vehiculo
+        traspaso = None
+        if vehiculo.sucursal is not None and vehiculo.sucursal.id not in self.propias:
+            traspaso = (vehiculo.id, vehiculo.sucursal.id)
+        return pago, traspaso
+
+    def transferir_vehiculo(self, vehiculo_id: UUID, sucursal_destino_id: UUID):
+        return _resumen_vehiculo(self.servicio.transferir_vehiculo(vehiculo_id, sucursal_destino_id))
+
+    def cotizar_reserva(self, sucursal_id, categoria, fecha_inicio, fecha_fin):
+        return self.servicio.cotizar_reserva(sucursal_id, categoria, fecha_inicio, fecha_fin)
+
+    def listar_vehiculos_disponibles(self):
+        return [_resumen_vehiculo(v) for v in self.servicio.listar_vehiculos_disponibles()
+                if v.id not in self._salidas]
+
+    def listar_reservas_cliente(self, cliente_id, desde, hasta, estado):
+        return [_resumen_reserva(r) for r in self.servicio.listar_reservas_cliente(cliente_id, desde, hasta, estado)]
+
+    def listar_reservas_sucursal(self, sucursal_id, desde, hasta, estado):
+        return [_resumen_reserva(r) for r in self.servicio.listar_reservas_sucursal(sucursal_id, desde, hasta, estado)]
+
+    def rentabilidad_vehiculo(self, vehiculo_id: UUID):
+        return _resumen_totales(self.servicio.rentabilidad_vehiculo(vehiculo_id))
+
+    def vehiculos_menos_rentables(self, limite: int):
+        return [_resumen_totales(t) for t in self.servicio.vehiculos_menos_rentables(limite)
+                if t.vehiculo.id not in self._salidas]
+
+    def lote(self, operaciones):
+        # Varias operaciones en un solo mensaje: un fallo en una no deshace las demás
+        resultados = []
+        for operacion, args in operaciones:
+            try:
+                resultados.append(("ok", _operacion(self, operacion)(*args)))
+            except ValueError as exc:
+                resultados.append(("error", str(exc)))
+        return resultados
+
+    # ---------- TRASPASO EN DOS FASES ----------
+    def preparar_salida(self, vehiculo_id: UUID):
+        # Fase 1 en el origen: el vehículo solo puede irse si no tiene nada pendiente aquí. Queda
+        # bloqueado (no se puede reservar) y devolvemos sus datos para darlo de alta en el destino
+        servicio = self.servicio
+        with servicio._lock:
+            vehiculo = servicio.obtener_vehiculo(vehiculo_id)
+            if vehiculo.id in self._salidas:
+                raise ValueError("El vehículo ya se está traspasando.")
+            if vehiculo.estado != "DISPONIBLE" or vehiculo.id in servicio._reservas_activas:
+                raise ValueError("El vehículo tiene reservas o mantenimientos pendientes.")
+            if servicio.calendario.solapes(vehiculo.id, datetime.now(), datetime.max):
+                raise ValueError("El vehículo tiene mantenimientos programados.")
+            self._salidas[vehiculo.id] = vehiculo
+            servicio.disponibilidad.quitar(vehiculo)
+            atributos = {k: v for k, v in vars(vehiculo).items() if k != "sucursal"}
+            # Los totales de rentabilidad viajan con el vehículo
+            totales = {k: v for k, v in vars(servicio.agregados.obtener(vehiculo.id)).items() if k != "vehiculo"}
+            return type(vehiculo), atributos, totales
+
+    def confirmar_salida(self, vehiculo_id: UUID):
+        with self.servicio._lock:
+            self._olvidar_vehiculo(self._salidas.pop(vehiculo_id))
+
+    def cancelar_salida(self, vehiculo_id: UUID):
+        vehiculo = self._salidas.pop(vehiculo_id, None)
+        if vehiculo is not None:
+            self.servicio.disponibilidad.actualizar(vehiculo)
+
+    def preparar_entrada(self, datos, sucursal_id: UUID):
+        # Fase 1 en el destino: comprobamos que podemos darlo de alta y lo apartamos hasta la confirmación
+        clase, atributos, totales = datos
+        if sucursal_id not in self.propias:
+            raise ValueError("La sucursal no pertenece a esta partición.")
+        if (atributos["id"] in self.servicio.vehiculos or atributos["id"] in self._entradas
+                or normalizar_matricula(atributos["matricula"]) in self.servicio._vehiculos_por_matricula):
+            raise ValueError("Ya existe un vehículo con esa matrícula.")
+        self._entradas[atributos["id"]] = (clase, atributos, totales, sucursal_id)
+
+    def confirmar_entrada(self, vehiculo_id: UUID):
+        # Fase 2 en el destino: el mismo vehículo (mismo id, km y estado) entra en el inventario.
+        # El planificador empieza a contar desde aquí, como con un vehículo recién registrado
+        clase, atributos, totales, sucursal_id = self._entradas.pop(vehiculo_id)
+        vehiculo = clase.__new__(clase)
+        vehiculo.__dict__.update(atributos)
+        vehiculo.sucursal = None
+        acumulados = TotalesVehiculo.__new__(TotalesVehiculo)
+        acumulados.__dict__.update(totales)
+        with self.servicio._lock:
+            self.servicio._indexar_vehiculo(vehiculo, self.servicio.obtener_sucursal(sucursal_id))
+            self.servicio.agregados.agregar(vehiculo, acumulados)
+
+    def cancelar_entrada(self, vehiculo_id: UUID):
+        self._entradas.pop(vehiculo_id, None)
+
+    def _olvidar_vehiculo(self, vehiculo: Vehiculo):
+        # Sacamos el vehículo de esta partición sin eventos de baja: sigue existiendo en otra.
+        # Sus reservas ya cerradas se quedan aquí como historial
+        servicio = self.servicio
+        servicio._desindexar_vehiculo(vehiculo)
+        servicio.buscador.eliminar(vehiculo)
+        servicio._vehiculos_por_matricula.pop(normalizar_matricula(vehiculo.matricula), None)
+        servicio.vehiculos.pop(vehiculo.id, None)
+        servicio.agregados.eliminar(vehiculo.id)
+
+
+def _operacion(particion: _Particion, nombre: str):
+    if nombre.startswith("_"):
+        raise ValueError(f"Operación '{nombre}' no válida.")
+    return getattr(particion, nombre)
+
+
+def _trabajar(conexion, ruta_estado: Optional[str], ruta_particion: Optional[str] = None):
+    # Bucle de cada proceso: recibe (operación, argumentos) y contesta (estado, resultado).
+    # Los ValueError son errores de negocio y vuelven como tales; cualquier otro fallo se registra aquí.
+    # Arranca desde su propia partición guardada o, si no hay, desde el estado completo (o vacío)
+    if ruta_particion:
+        particion = _Particion.cargar(ruta_particion)
+    else:
+        particion = _Particion(AlquilerServicio.cargar_estado(ruta_estado) if ruta_estado else AlquilerServicio())
+    while True:
+        try:
+            operacion, args = conexion.recv()
+        except EOFError:
+            break
+        if operacion is None:
+            break
+        try:
+            conexion.send(("ok", _operacion(particion, operacion)(*args)))
+        except ValueError as exc:
+            conexion.send(("error", str(exc)))
+        except Exception as exc:
+            logger.exception("Fallo en la partición al ejecutar %s", operacion)
+            conexion.send(("fallo", repr(exc)))
+    conexion.close()
+
+
+class ServicioParticionado:
+    # Reparte el estado del servicio de alquiler por sucursales entre varios procesos, cada uno con
+    # su propio AlquilerServicio (y su propio intérprete), y enruta cada operación a la partición que
+    # tiene la sucursal o el vehículo. Así el rendimiento crece con el número de núcleos en lugar de
+    # quedarse en lo que da un único intérprete.
+    #
+    # - Usuarios, tarifas y sucursales se dan de alta aquí (en 'comun') y se copian a todas las particiones.
+    # - Vehículos, reservas y mantenimientos viven en una sola partición: la de la sucursal del vehículo.
+    # - Los listados de varias sucursales o de un cliente se piden a todas las particiones a la vez.
+    # - Si un vehículo se devuelve en una sucursal de otra partición, se traspasa en dos fases:
+    #   las dos particiones preparan (el origen lo bloquea, el destino comprueba que puede darlo de
+    #   alta) y solo si ambas aceptan se confirma; si no, se cancela y el vehículo sigue en el origen,
+    #   que lo gestiona desde su copia de la sucursal hasta la siguiente devolución.
+    # - guardar_estado guarda lo común y cada partición en un directorio. Al arrancar desde él, los
+    #   traspasos que quedaron a medias se confirman o se cancelan (ver _recuperar_traspasos).
+    #
+    # Las operaciones son seguras entre hilos: cada partición tiene su propio cerrojo, así que
+    # peticiones a particiones distintas se atienden a la vez. Los resultados son diccionarios
+    # planos (ver _resumen_vehiculo y _resumen_reserva), no los objetos del dominio.
+
+    def __init__(self, particiones: Optional[int] = None, ruta_estado: Optional[str] = None):
+        # 'ruta_estado' es un estado completo (AlquilerServicio.guardar_estado), que se reparte entre
+        # las particiones, o un directorio guardado con guardar_estado, con el mismo reparto de antes
+        guardado = ruta_estado is not None and os.path.isdir(ruta_estado)
+        if guardado:
+            ficheros = []
+            while os.path.exists(os.path.join(ruta_estado, f"particion-{len(ficheros)}.bin")):
+                ficheros.append(os.path.join(ruta_estado, f"particion-{len(ficheros)}.bin"))
+            if not ficheros:
+                raise ValueError("El directorio no contiene un estado particionado.")
+            if particiones and particiones != len(ficheros):
+                raise ValueError(f"El estado guardado tiene {len(ficheros)} particiones.")
+            self.particiones = len(ficheros)
+            self.comun = AlquilerServicio.cargar_estado(os.path.join(ruta_estado, "comun.bin"))
+        else:
+            ficheros = [None] * (particiones or os.cpu_count() or 1)
+            self.particiones = len(ficheros)
+            # Usuarios, tarifas y sucursales (sin vehículos ni reservas)
+            self.comun = AlquilerServicio.cargar_estado(ruta_estado) if ruta_estado else AlquilerServicio()
+
+        contexto = multiprocessing.get_context("spawn")
+        self._conexiones = []
+        self._procesos = []
+        for fichero in ficheros:
+            local, remota = contexto.Pipe()
+            proceso = contexto.Process(target=_trabajar, args=(remota, None if guardado else ruta_estado, fichero),
+                                       daemon=True)
+            proceso.start()
+            remota.close()
+            self._conexiones.append(local)
+            self._procesos.append(proceso)
+        self._cerrojos = [threading.Lock() for _ in range(self.particiones)]
+
+        # Mapas de enrutado, protegidos por self._lock
+        self._lock = threading.Lock()
+        self._sucursal_particion: Dict[UUID, int] = {}
+        self._vehiculo_particion: Dict[UUID, int] = {}
+        self._reserva_particion: Dict[UUID, int] = {}
+        # Matrícula normalizada -> UUID del vehículo (None mientras se está registrando)
+        self._matriculas: Dict[str, Optional[UUID]] = {}
+        # Altas de datos comunes y guardar_estado no se mezclan: lo guardado en 'comun' y en las
+        # particiones es siempre lo mismo
+        self._cerrojo_comun = threading.Lock()
+
+        if guardado:
+            repartos = self._a_todas("reparto")
+        else:
+            for sucursal in self.comun.sucursales.values():
+                self._sucursal_particion[sucursal.id] = self._particion_con_menos_sucursales()
+            propias = [set() for _ in range(self.particiones)]
+            for sucursal_id, particion in self._sucursal_particion.items():
+                propias[particion].add(sucursal_id)
+            repartos = self._difundir([("recortar", (propias[p], p == 0)) for p in range(self.particiones)])
+        for particion, reparto in enumerate(repartos):
+            for sucursal_id in reparto["propias"]:
+                self._sucursal_particion[sucursal_id] = particion
+            for vehiculo_id, matricula in reparto["vehiculos"].items():
+                self._vehiculo_particion[vehiculo_id] = particion
+                self._matriculas[matricula] = vehiculo_id
+            for reserva_id in reparto["reservas"]:
+                self._reserva_particion[reserva_id] = particion
+        if not guardado:
+            _Particion(self.comun).recortar(set(), False)
+        self._recuperar_traspasos(repartos)
+
+    def _recuperar_traspasos(self, repartos: List[dict]):
+        # Traspasos que quedaron a medias en el estado guardado (el enrutador paró entre dos fases).
+        # El destino confirma antes que el origen, así que si el destino ya tiene el vehículo el
+        # traspaso estaba decidido y solo falta soltarlo en el origen; si no, lo cancelamos en las
+        # dos y el vehículo vuelve a estar disponible en el origen
+        for origen, reparto in enumerate(repartos):
+            for vehiculo_id in reparto["salidas"]:
+                destino = next((p for p, otro in enumerate(repartos)
+                                if p != origen and vehiculo_id in otro["vehiculos"]), None)
+                if destino is None:
+                    self._enviar(origen, "cancelar_salida", vehiculo_id)
+                    self._vehiculo_particion[vehiculo_id] = origen
+                    logger.warning("Traspaso del vehículo %s cancelado al arrancar", vehiculo_id)
+                else:
+                    self._enviar(origen, "confirmar_salida", vehiculo_id)
+                    self._vehiculo_particion[vehiculo_id] = destino
+                    logger.warning("Traspaso del vehículo %s confirmado al arrancar", vehiculo_id)
+        for destino, reparto in enumerate(repartos):
+            for vehiculo_id in reparto["entradas"]:
+                self._enviar(destino, "cancelar_entrada", vehiculo_id)
+
+    # ---------- COMUNICACIÓN ----------
+    def _enviar(self, particion: int, operacion: str, *args):
+        with self._cerrojos[particion]:
+            conexion = self._conexiones[particion]
+            conexion.send((operacion, args))
+            return self._resultado(particion, conexion.recv())
+
+    def _difundir(self, mensajes: List[tuple]) -> list:
+        # Un mensaje por partición (None para saltarla): enviamos todos antes de esperar respuestas,
+        # así las particiones trabajan a la vez. Tomamos los cerrojos siempre en el mismo orden
+        implicadas = [p for p, mensaje in enumerate(mensajes) if mensaje is not None]
+        for p in implicadas:
+            self._cerrojos[p].acquire()
+        try:
+            for p in implicadas:
+                self._conexiones[p].send(mensajes[p])
+            respuestas = {p: self._conexiones[p].recv() for p in implicadas}
+        finally:
+            for p in implicadas:
+                self._cerrojos[p].release()
+        return [self._resultado(p, respuestas[p]) if p in respuestas else None for p in range(len(mensajes))]
+
+    def _a_todas(self, operacion: str, *args) -> list:
+        return self._difundir([(operacion, args)] * self.particiones)
+
+    @staticmethod
+    def _resultado(particion: int, respuesta):
+        estado, valor = respuesta
+        if estado == "error":
+            raise ValueError(valor)
+        if estado == "fallo":
+            raise RuntimeError(f"Fallo en la partición {particion}: {valor}")
+        return valor
+
+    # ---------- ESTADO GUARDADO ----------
+    def guardar_estado(self, directorio: str):
+        # Guardamos lo común y cada partición (con sus traspasos a medias) en un directorio, para
+        # volver a arrancar con ServicioParticionado(ruta_estado=directorio). Todas las particiones
+        # guardan a la vez, sin atender otra cosa mientras tanto, así que el estado es coherente
+        os.makedirs(directorio, exist_ok=True)
+        with self._cerrojo_comun:
+            self._difundir([("guardar", (os.path.join(directorio, f"particion-{p}.bin"),))
+                            for p in range(self.particiones)])
+            self.comun.guardar_estado(os.path.join(directorio, "comun.bin"))
+        # Particiones de un estado anterior con más procesos
+        sobrante = self.particiones
+        while os.path.exists(os.path.join(directorio, f"particion-{sobrante}.bin")):
+            os.remove(os.path.join(directorio, f"particion-{sobrante}.bin"))
+            sobrante += 1
+
+    def cerrar(self):
+        for conexion, cerrojo in zip(self._conexiones, self._cerrojos):
+            with cerrojo:
+                try:
+                    conexion.send((None, ()))
+                except OSError:
+                    pass
+                conexion.close()
+        for proceso in self._procesos:
+            proceso.join(timeout=5)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    # ---------- ENRUTADO ----------
+    def _particion_con_menos_sucursales(self) -> int:
+        cuentas = [0] * self.particiones
+        for particion in self._sucursal_particion.values():
+            cuentas[particion] += 1
+        return cuentas.index(min(cuentas))
+
+    def _particion_de(self, mapa: Dict[UUID, int], clave: UUID, mensaje: str) -> int:
+        particion = mapa.get(clave)
+        if particion is None:
+            raise ValueError(mensaje)
+        return particion
+
+    def particion_de_sucursal(self, sucursal_id: UUID) -> int:
+        return self._particion_de(self._sucursal_particion, sucursal_id, "Sucursal no encontrada.")
+
+    def particion_de_vehiculo(self, vehiculo_id: UUID) -> int:
+        return self._particion_de(self._vehiculo_particion, vehiculo_id, "Vehículo no encontrado.")
+
+    def particion_de_reserva(self, reserva_id: UUID) -> int:
+        return self._particion_de(self._reserva_particion, reserva_id, "Reserva no encontrada.")
+
+    # ---------- DATOS COMUNES ----------
+    def registrar_usuario(self, tipo: str, nombre: str, email: str, password: str, licencia=None, direccion=None):
+        with self._cerrojo_comun:
+            with self._lock:
+                usuario = self.comun.registrar_usuario(tipo, nombre, email, password, licencia, direccion)
+            self._a_todas("replicar", usuario)
+        return usuario
+
+    def actualizar_password(self, usuario_id: UUID, password: str):
+        with self._cerrojo_comun:
+            usuario = self.comun.actualizar_password(usuario_id, password)
+            self._a_todas("actualizar_password", usuario_id, password)
+        return usuario
+
+    def obtener_usuario_por_email(self, email: str):
+        return self.comun.obtener_usuario_por_email(email)
+
+    def crear_tarifa(self, *args, **kwargs):
+        with self._cerrojo_comun:
+            tarifa = self.comun.crear_tarifa(*args, **kwargs)
+            self._a_todas("replicar", tarifa)
+        return tarifa
+
+    def agregar_sucursal(self, nombre: str, direccion: str, telefono: str,
+                         latitud: Optional[float] = None, longitud: Optional[float] = None):
+        # La sucursal nueva va a la partición que menos tiene; todas reciben una copia
+        with self._cerrojo_comun:
+            sucursal = self.comun.agregar_sucursal(nombre, direccion, telefono, latitud, longitud)
+            self._a_todas("replicar", sucursal)
+            with self._lock:
+                particion = self._particion_con_menos_sucursales()
+                self._sucursal_particion[sucursal.id] = particion
+            self._enviar(particion, "adoptar", sucursal.id)
+        return sucursal
+
+    # ---------- VEHÍCULOS ----------
+    def registrar_vehiculo(self, tipo: str, matricula: str, marca: str, modelo: str, año: int,
+                           categoria: str, km: float, sucursal_id: UUID, **extras):
+        particion = self.particion_de_sucursal(sucursal_id)
+        clave = normalizar_matricula(matricula)
+        # Apartamos la matrícula para que otra partición no registre la misma a la vez
+        with self._lock:
+            if clave in self._matriculas:
+                raise ValueError("Ya existe un vehículo con esa matrícula.")
+            self._matriculas[clave] = None
+        try:
+            vehiculo = self._enviar(particion, "registrar_vehiculo", tipo, matricula, marca, modelo, año,
+                                    categoria, km, sucursal_id, extras)
+        except Exception:
+            with self._lock:
+                del self._matriculas[clave]
+            raise
+        with self._lock:
+            self._matriculas[clave] = vehiculo["id"]
+            self._vehiculo_particion[vehiculo["id"]] = particion
+        return vehiculo
+
+    def listar_vehiculos_disponibles(self):
+        return [v for vehiculos in self._a_todas("listar_vehiculos_disponibles") for v in vehiculos]
+
+    def transferir_vehiculo(self, vehiculo_id: UUID, sucursal_destino_id: UUID):
+        origen = self.particion_de_vehiculo(vehiculo_id)
+        destino = self.particion_de_sucursal(sucursal_destino_id)
+        if origen == destino:
+            return self._enviar(origen, "transferir_vehiculo", vehiculo_id, sucursal_destino_id)
+        self._traspasar(origen, vehiculo_id, sucursal_destino_id, estricto=True)
+        return self._enviar(destino, "transferir_vehiculo", vehiculo_id, sucursal_destino_id)
+
+    def _traspasar(self, origen: int, vehiculo_id: UUID, sucursal_id: UUID, estricto: bool = False) -> bool:
+        # Traspaso en dos fases de un vehículo entre particiones. Sin 'estricto', si alguna
+        # partición no acepta devolvemos False y el vehículo se queda en el origen
+        destino = self.particion_de_sucursal(sucursal_id)
+        try:
+            datos = self._enviar(origen, "preparar_salida", vehiculo_id)
+        except ValueError:
+            if estricto:
+                raise
+            return False
+        try:
+            self._enviar(destino, "preparar_entrada", datos, sucursal_id)
+        except ValueError:
+            self._enviar(origen, "cancelar_salida", vehiculo_id)
+            if estricto:
+                raise
+            return False
+        except Exception:
+            self._enviar(origen, "cancelar_salida", vehiculo_id)
+            raise
+
+        # Las dos han aceptado: confirmamos primero en el destino y cambiamos el enrutado antes de
+        # soltarlo en el origen, así nunca hay un momento en que el vehículo no esté en ninguna
+        self._enviar(destino, "confirmar_entrada", vehiculo_id)
+        with self._lock:
+            self._vehiculo_particion[vehiculo_id] = destino
+        self._enviar(origen, "confirmar_salida", vehiculo_id)
+        return True
+
+    # ---------- RESERVAS ----------
+    def realizar_reserva(self, cliente_id: UUID, vehiculo_id: UUID,
+                         fecha_inicio: str, fecha_fin: str, id_sucursal_devolucion: UUID):
+        particion = self.particion_de_vehiculo(vehiculo_id)
+        reserva = self._enviar(particion, "realizar_reserva", cliente_id, vehiculo_id,
+                               fecha_inicio, fecha_fin, id_sucursal_devolucion)
+        with self._lock:
+            self._reserva_particion[reserva["id"]] = particion
+        return reserva
+
+    def realizar_reservas(self, peticiones):
+        # Varias reservas de una vez (cada petición con los parámetros de realizar_reserva): cada
+        # partición recibe las suyas en un solo mensaje y todas trabajan a la vez. Un fallo en una
+        # reserva no deshace las demás
+        resultados: List[Optional[dict]] = [None] * len(peticiones)
+        lotes = [[] for _ in range(self.particiones)]
+        posiciones = [[] for _ in range(self.particiones)]
+        for i, peticion in enumerate(peticiones):
+            particion = self._vehiculo_particion.get(peticion["vehiculo_id"])
+            if particion is None:
+                resultados[i] = {"correcta": False, "error": "Vehículo no encontrado."}
+                continue
+            args = (peticion["cliente_id"], peticion["vehiculo_id"], peticion["fecha_inicio"],
+                    peticion["fecha_fin"], peticion["id_sucursal_devolucion"])
+            lotes[particion].append(("realizar_reserva", args))
+            posiciones[particion].append(i)
+
+        respuestas = self._difundir([("lote", (lote,)) if lote else None for lote in lotes])
+        with self._lock:
+            for particion, respuesta in enumerate(respuestas):
+                for i, (estado, valor) in zip(posiciones[particion], respuesta or ()):
+                    if estado == "ok":
+                        self._reserva_particion[valor["id"]] = particion
+                        resultados[i] = {"correcta": True, "reserva": valor}
+                    else:
+                        resultados[i] = {"correcta": False, "error": valor}
+        return resultados
+
+    def obtener_reserva(self, reserva_id: UUID):
+        return self._enviar(self.particion_de_reserva(reserva_id), "obtener_reserva", reserva_id)
+
+    def cancelar_reserva(self, reserva_id: UUID):
+        return self._enviar(self.particion_de_reserva(reserva_id), "cancelar_reserva", reserva_id)
+
+    def finalizar_reserva(self, reserva_id: UUID, km_recorridos=0, retraso_dias=0,
+                          combustible_correcto=True, metodo_pago="Tarjeta"):
+        # La reserva se cierra en su partición; si el vehículo se ha devuelto en una sucursal de
+        # otra partición, después lo traspasamos (el pago ya está hecho aunque el traspaso no se haga)
+        particion = self.particion_de_reserva(reserva_id)
+        pago, traspaso = self._enviar(particion, "finalizar_reserva", reserva_id, km_recorridos,
+                                      retraso_dias, combustible_correcto, metodo_pago)
+        if traspaso:
+            self._traspasar(particion, *traspaso)
+        return pago
+
+    def cotizar_reserva(self, sucursal_id: UUID, categoria: str, fecha_inicio: str, fecha_fin: str):
+        return self._enviar(self.particion_de_sucursal(sucursal_id), "cotizar_reserva",
+                            sucursal_id, categoria, fecha_inicio, fecha_fin)
+
+    def listar_reservas_cliente(self, cliente_id: UUID, desde: Optional[str] = None,
+                                hasta: Optional[str] = None, estado: Optional[str] = None):
+        # Cada partición tiene las reservas del cliente con sus vehículos: las juntamos por fecha
+        partes = self._a_todas("listar_reservas_cliente", cliente_id, desde, hasta, estado)
+        return sorted((r for parte in partes for r in parte), key=lambda r: r["fecha_inicio"])
+
+    def listar_reservas_sucursal(self, sucursal_id: UUID, desde: Optional[str] = None,
+                                 hasta: Optional[str] = None, estado: Optional[str] = None):
+        # Las devoluciones en una sucursal pueden estar en la partición de la sucursal de recogida
+        self.particion_de_sucursal(sucursal_id)
+        partes = self._a_todas("listar_reservas_sucursal", sucursal_id, desde, hasta, estado)
+        return sorted((r for parte in partes for r in parte), key=lambda r: r["fecha_inicio"])
+
+    # ---------- RENTABILIDAD ----------
+    def rentabilidad_vehiculo(self, vehiculo_id: UUID):
+        return self._enviar(self.particion_de_vehiculo(vehiculo_id), "rentabilidad_vehiculo", vehiculo_id)
+
+    def vehiculos_menos_rentables(self, limite: int = 10):
+        # Cada partición da sus 'limite' menos rentables; los de todo el sistema están entre ellos
+        if limite < 1:
+            raise ValueError("El límite debe ser al menos 1.")
+        partes = self._a_todas("vehiculos_menos_rentables", limite)
+        return heapq.nsmallest(limite, (t for parte in partes for t in parte), key=lambda t: t["beneficio"])
@@ -0,0 +1,209 @@
+from __future__ import annotations
+import heapq
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from services.CalendarioVehiculos import CalendarioVehiculos
+
+# Kilómetros entre dos revisiones
+INTERVALO_REVISION_KM = 15000.0
+# Kilómetros al día que suponemos para un vehículo hasta que tengamos datos de sus alquileres
+KM_DIARIOS_POR_DEFECTO = 50.0
+# Peso de cada alquiler nuevo en la media de km diarios de un vehículo (media móvil exponencial)
+PESO_KM_DIARIOS = 0.3
+# Días que el vehículo queda parado por cada tipo de mantenimiento planificado
+DURACION_DIAS = {"REVISIÓN": 1, "ITV": 1}
+# Hasta cuántos días después del vencimiento buscamos hueco si antes no hay ninguno
+MARGEN_BUSQUEDA_DIAS = 90
+
+_UN_DIA = timedelta(days=1)
+
+
+def _dia(fecha: datetime) -> datetime:
+    # Nos quedamos solo con el día (las fechas del sistema van siempre a las 00:00)
+    return datetime(fecha.year, fecha.month, fecha.day)
+
+
+def proxima_itv(año: int, ultima: Optional[datetime] = None, referencia: Optional[datetime] = None) -> datetime:
+    # Fecha de la próxima ITV: la primera a los 4 años de la matriculación, después cada 2 años
+    # y cada año a partir de los 10 años de antigüedad. Solo conocemos el año del vehículo,
+    # así que contamos desde el 1 de enero. Si no hay ninguna ITV registrada, suponemos que
+    # pasó las anteriores y buscamos la primera que vence a partir de la fecha de referencia.
+    if ultima is not None:
+        return _siguiente_itv(año, ultima)
+    fecha = datetime(año + 4, 1, 1)
+    while referencia is not None and fecha < referencia:
+        fecha = _siguiente_itv(año, fecha)
+    return fecha
+
+
+def _siguiente_itv(año: int, fecha: datetime) -> datetime:
+    siguiente = fecha.year + (1 if fecha.year - año >= 10 else 2)
+    # El 29 de febrero no existe todos los años
+    return datetime(siguiente, fecha.month, min(fecha.day, 28) if fecha.month == 2 else fecha.day)
+
+
+class PlanificadorMantenimiento:
+    # Planificador de mantenimiento preventivo. Para cada vehículo llevamos, de forma incremental,
+    # los km recorridos desde la última revisión, su media de km diarios y la fecha de la próxima ITV.
+    # Con eso estimamos cuándo vence cada mantenimiento y lo guardamos en una cola de prioridad:
+    # los vehículos más urgentes salen primero sin tener que recorrer toda la flota.
+    # Cuando cambian los datos de un vehículo no buscamos su entrada antigua en la cola: añadimos
+    # una nueva con otra versión y la antigua se descarta al salir (invalidación perezosa).
+
+    def __init__(self, calendario: CalendarioVehiculos, intervalo_km: float = INTERVALO_REVISION_KM):
+        self.calendario = calendario
+        self.intervalo_km = intervalo_km
+        self._vehiculos: Dict[UUID, object] = {}
+        # Km del vehículo en su última revisión y fecha de la próxima ITV
+        self._km_revision: Dict[UUID, float] = {}
+        self._proxima_itv: Dict[UUID, datetime] = {}
+        # Media de km diarios y fecha de la que parte la estimación de la próxima revisión
+        self._km_diarios: Dict[UUID, float] = {}
+        self._referencia: Dict[UUID, datetime] = {}
+        # Mantenimientos (vehículo, tipo) ya programados: no se vuelven a proponer
+        self._programados: Set[Tuple[UUID, str]] = set()
+        # Cola de prioridad de (vencimiento, orden, vehículo, tipo, versión)
+        self._cola: List[Tuple[datetime, int, UUID, str, int]] = []
+        self._versiones: Dict[Tuple[UUID, str], int] = {}
+        self._orden = 0
+
+    # ---------- SEGUIMIENTO DE LA FLOTA ----------
+    def agregar(self, vehiculo, fecha: Optional[datetime] = None):
+        # Empezamos a seguir un vehículo. Sin historial suponemos que se revisó en el último
+        # múltiplo del intervalo de km (un coche con 14.000 km pasará la revisión a los 15.000)
+        fecha = _dia(fecha or datetime.now())
+        self._vehiculos[vehiculo.id] = vehiculo
+        self._km_revision[vehiculo.id] = (vehiculo.km // self.intervalo_km) * self.intervalo_km
+        self._km_diarios[vehiculo.id] = KM_DIARIOS_POR_DEFECTO
+        self._referencia[vehiculo.id] = fecha
+        self._proxima_itv[vehiculo.id] = proxima_itv(vehiculo.año, referencia=fecha)
+        self._encolar(vehiculo.id, "REVISIÓN")
+        self._encolar(vehiculo.id, "ITV")
+
+    def eliminar(self, vehiculo_id: UUID):
+        # Dejamos de seguir un vehículo; sus entradas de la cola se descartarán al salir
+        if self._vehiculos.pop(vehiculo_id, None) is None:
+            return
+        for datos in (self._km_revision, self._proxima_itv, self._km_diarios, self._referencia):
+            datos.pop(vehiculo_id, None)
+        for tipo in DURACION_DIAS:
+            self._programados.discard((vehiculo_id, tipo))
+
+    def registrar_km(self, vehiculo, km_recorridos: float, dias: int, fecha: Optional[datetime] = None):
+        # Un alquiler ha terminado: actualizamos la media de km diarios y la previsión de la revisión
+        if vehiculo.id not in self._vehiculos:
+            return
+        if dias > 0:
+            media = self._km_diarios[vehiculo.id]
+            self._km_diarios[vehiculo.id] = (1 - PESO_KM_DIARIOS) * media + PESO_KM_DIARIOS * (km_recorridos / dias)
+        self._referencia[vehiculo.id] = _dia(fecha or datetime.now())
+        self._encolar(vehiculo.id, "REVISIÓN")
+
+    def marcar_programado(self, vehiculo_id: UUID, tipo: str):
+        # Ya hay un mantenimiento de este tipo en marcha o programado: no lo proponemos
+        if tipo in DURACION_DIAS and vehiculo_id in self._vehiculos:
+            self._programados.add((vehiculo_id, tipo))
+
+    def registrar_mantenimiento(self, mantenimiento):
+        # Un mantenimiento ha terminado: una revisión pone a cero los km y una ITV fija la siguiente
+        vehiculo = mantenimiento.vehiculo
+        tipo = mantenimiento.tipo
+        if vehiculo.id not in self._vehiculos or tipo not in DURACION_DIAS:
+            return
+        self._programados.discard((vehiculo.id, tipo))
+        if tipo == "REVISIÓN":
+            self._km_revision[vehiculo.id] = vehiculo.km
+            self._referencia[vehiculo.id] = _dia(mantenimiento.fecha_fin)
+        else:
+            self._proxima_itv[vehiculo.id] = proxima_itv(vehiculo.año, _dia(mantenimiento.fecha_fin))
+        self._encolar(vehiculo.id, tipo)
+
+    def km_desde_revision(self, vehiculo_id: UUID) -> float:
+        return self._vehiculos[vehiculo_id].km - self._km_revision[vehiculo_id]
+
+    def vencimiento(self, vehiculo_id: UUID, tipo: str) -> datetime:
+        # Fecha estimada en la que vence el mantenimiento (puede estar en el pasado si ya va tarde)
+        if tipo == "ITV":
+            return self._proxima_itv[vehiculo_id]
+        km_restantes = self.intervalo_km - self.km_desde_revision(vehiculo_id)
+        dias = km_restantes / max(self._km_diarios[vehiculo_id], 1.0)
+        return self._referencia[vehiculo_id] + timedelta(days=int(dias))
+
+    def _encolar(self, vehiculo_id: UUID, tipo: str):
+        version = self._versiones.get((vehiculo_id, tipo), 0) + 1
+        self._versiones[(vehiculo_id, tipo)] = version
+        self._orden += 1
+        heapq.heappush(self._cola, (self.vencimiento(vehiculo_id, tipo), self._orden, vehiculo_id, tipo, version))
+        # Si se acumulan demasiadas entradas caducadas, reconstruimos la cola solo con las vigentes
+        if len(self._cola) > 4 * len(self._vehiculos) + 1024:
+            self._cola = [e for e in self._cola if self._vigente(e)]
+            heapq.heapify(self._cola)
+
+    def _vigente(self, entrada) -> bool:
+        # Una entrada de la cola vale si el vehículo sigue en la flota y es la última versión de sus datos
+        _, _, vehiculo_id, tipo, version = entrada
+        return vehiculo_id in self._vehiculos and self._versiones.get((vehiculo_id, tipo)) == version
+
+    # ---------- PLANIFICACIÓN ----------
+    def plan(self, desde: Optional[datetime] = None, horizonte_dias: int = 30, limite: int = 50) -> List[dict]:
+        # Mantenimientos que vencen antes de desde + horizonte, del más urgente al menos urgente,
+        # cada uno con la ventana propuesta. Solo sacamos de la cola lo que vamos a devolver.
+        desde = _dia(desde or datetime.now())
+        corte = desde + timedelta(days=horizonte_dias)
+        plan, revisadas = [], []
+
+        while self._cola and len(plan) < limite and self._cola[0][0] <= corte:
+            entrada = heapq.heappop(self._cola)
+            _, _, vehiculo_id, tipo, _ = entrada
+            if not self._vigente(entrada):
+                continue  # entrada caducada: la descartamos
+            revisadas.append(entrada)
+            if (vehiculo_id, tipo) in self._programados:
+                continue
+            plan.append(self._proponer(vehiculo_id, tipo, entrada[0], desde))
+
+        # Las entradas vigentes vuelven a la cola: el plan no cambia el estado del planificador
+        for entrada in revisadas:
+            heapq.heappush(self._cola, entrada)
+        return plan
+
+    def _proponer(self, vehiculo_id: UUID, tipo: str, vencimiento: datetime, desde: datetime) -> dict:
+        # Elegimos la ventana para el mantenimiento dentro de los huecos libres del vehículo:
+        # antes del vencimiento, el día con menos demanda de la flota; si no hay hueco, el primero después
+        duracion = DURACION_DIAS[tipo]
+        limite = max(vencimiento, desde + _UN_DIA * duracion)
+        ventana = self._mejor_ventana(vehiculo_id, desde, limite, duracion)
+        if ventana is None:
+            ventana = self._primera_ventana(vehiculo_id, limite, limite + timedelta(days=MARGEN_BUSQUEDA_DIAS), duracion)
+
+        return {
+            "vehiculo": self._vehiculos[vehiculo_id],
+            "tipo": tipo,
+            "vencimiento": vencimiento,
+            "km_desde_revision": self.km_desde_revision(vehiculo_id),
+            "inicio": ventana,
+            # Los mantenimientos guardan el último día incluido
+            "fin": ventana + _UN_DIA * (duracion - 1) if ventana is not None else None,
+        }
+
+    def _mejor_ventana(self, vehiculo_id: UUID, desde: datetime, hasta: datetime, duracion: int) -> Optional[datetime]:
+        mejor, mejor_demanda = None, None
+        for inicio, fin in self.calendario.huecos(vehiculo_id, desde, hasta):
+            dia = inicio
+            while dia + _UN_DIA * duracion <= fin:
+                demanda = sum(self.calendario.demanda(dia + _UN_DIA * i) for i in range(duracion))
+                if mejor is None or demanda < mejor_demanda:
+                    mejor, mejor_demanda = dia, demanda
+                dia += _UN_DIA
+        return mejor
+
+    def _primera_ventana(self, vehiculo_id: UUID, desde: datetime, hasta: datetime, duracion: int) -> Optional[datetime]:
+        for inicio, fin in self.calendario.huecos(vehiculo_id, desde, hasta):
+            if inicio + _UN_DIA * duracion <= fin:
+                return inicio
+        return None
+
+    def __len__(self) -> int:
+        return len(self._vehiculos)
@@ -0,0 +1,477 @@
+from __future__ import annotations
+import asyncio
+import atexit
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+from services.Eventos import Evento
+from services.RevocacionTokens import FiltroBloom
+
+logger = logging.getLogger(__name__)
+
+# Registros como mucho en cada bloque comprimido y bloques en cada segmento
+REGISTROS_POR_BLOQUE = 512
+BLOQUES_POR_SEGMENTO = 256
+# Tiempo máximo que un registro espera en memoria a que se llene su bloque antes de escribirlo
+ESPERA_MAXIMA_SEGUNDOS = 0.5
+# Si la cola se queda vacía, el escritor duerme este rato en lugar de esperar registro a registro:
+# así los registros se acumulan y el escritor apenas compite con las peticiones
+SONDEO_SEGUNDOS = 0.05
+# Registros pendientes de escribir a partir de los cuales esperar_sitio hace esperar (la cola no
+# descarta nunca: registrar siempre encola y la espera la hace quien puede permitírsela)
+CAPACIDAD_COLA = 10_000
+# Intentos de escribir un bloque antes de detener el registro, con una espera creciente entre ellos
+INTENTOS_ESCRITURA = 5
+ESPERA_REINTENTO_SEGUNDOS = 0.2
+# Textos de UUID que recordamos (los de vehículos, clientes y reservas se repiten entre eventos)
+MAX_TEXTOS = 100_000
+# Índices de entidades de segmentos cerrados que mantenemos cargados
+SEGMENTOS_EN_CACHE = 8
+
+# Cabecera de cada bloque: longitud de los datos comprimidos, su CRC32, número de registros,
+# número del primero y fechas (epoch) del más antiguo y el más moderno
+_CABECERA = struct.Struct("<IIIQdd")
+
+# Marca que se cuela en la cola para que el hilo escritor termine (para vaciar se encola un Event)
+_FIN = object()
+
+
+def _entidades(datos: dict) -> List[str]:
+    # Entidades a las que se refiere un registro: los valores de sus campos *_id
+    return [valor for clave, valor in datos.items() if clave.endswith("_id") and valor is not None]
+
+
+class _Segmento:
+    # Un fichero de bloques comprimidos y su índice: por cada bloque (desplazamiento, longitud,
+    # registros, primer número, fecha mínima, fecha máxima) y qué bloques mencionan cada tipo de
+    # evento y cada entidad. Cuando se cierra, el índice de entidades pasa a su fichero .idx y en
+    # memoria solo queda un filtro de Bloom para saber si merece la pena cargarlo.
+
+    def __init__(self, numero: int, directorio: str):
+        self.numero = numero
+        self.ruta = os.path.join(directorio, f"auditoria-{numero:06d}.seg")
+        self.ruta_indice = os.path.join(directorio, f"auditoria-{numero:06d}.idx")
+        self.bloques: List[tuple] = []
+        self.tipos: Dict[str, List[int]] = {}
+        self.entidades: Optional[Dict[str, List[int]]] = {}
+        self.filtro: Optional[FiltroBloom] = None
+        self.tamaño = 0
+
+    @property
+    def cerrado(self) -> bool:
+        return self.filtro is not None
+
+    def agregar_bloque(self, longitud: int, registros: List[dict], fecha_min: float, fecha_max: float):
+        numero_bloque = len(self.bloques)
+        self.bloques.append((self.tamaño, longitud, len(registros), registros[0]["n"], fecha_min, fecha_max))
+        self.tamaño += longitud
+        tipos, entidades = set(), set()
+        for registro in registros:
+            tipos.add(registro["tipo"])
+            entidades.update(_entidades(registro["datos"]))
+        for tipo in tipos:
+            self.tipos.setdefault(tipo, []).append(numero_bloque)
+        for entidad in entidades:
+            self.entidades.setdefault(entidad, []).append(numero_bloque)
+
+    def guardar_indice(self):
+        # Guardamos el índice completo junto al segmento (al cerrarlo)
+        contenido = {"bloques": self.bloques, "tipos": self.tipos, "entidades": self.entidades}
+        temporal = f"{self.ruta_indice}.tmp"
+        with open(temporal, "wb") as fichero:
+            fichero.write(zlib.compress(json.dumps(contenido).encode()))
+        os.replace(temporal, self.ruta_indice)
+
+    def cargar_indice(self) -> Dict[str, List[int]]:
+        with open(self.ruta_indice, "rb") as fichero:
+            contenido = json.loads(zlib.decompress(fichero.read()))
+        self.bloques = [tuple(bloque) for bloque in contenido["bloques"]]
+        self.tipos = contenido["tipos"]
+        offset, longitud = self.bloques[-1][:2] if self.bloques else (0, 0)
+        self.tamaño = offset + longitud
+        return contenido["entidades"]
+
+    def filtrar(self, entidades: Dict[str, List[int]]):
+        # A partir de aquí, en memoria solo queda el filtro de Bloom de sus entidades
+        filtro = FiltroBloom(len(entidades))
+        for entidad in entidades:
+            filtro.agregar(entidad)
+        self.filtro = filtro
+        self.entidades = None
+
+    @property
+    def fecha_min(self) -> float:
+        return min(bloque[4] for bloque in self.bloques)
+
+    @property
+    def fecha_max(self) -> float:
+        return max(bloque[5] for bloque in self.bloques)
+
+
+class RegistroAuditoria:
+    # Registro de auditoría de solo añadir con todos los cambios de estado del servicio (se suscribe
+    # a sus eventos). Quien emite solo deja el evento en una cola acotada: un hilo escritor los agrupa
+    # en bloques de hasta REGISTROS_POR_BLOQUE registros, los comprime con zlib y los añade al segmento
+    # abierto, así que las reservas no esperan al disco (salvo que la cola se llene). Cada segmento
+    # tiene BLOQUES_POR_SEGMENTO bloques como mucho y un índice por entidad, tipo y fechas: para
+    # responder "historial del vehículo X" o "pagos del día D" solo se descomprimen los bloques que
+    # pueden contener algo. Un único proceso escribe en cada directorio.
+
+    def __init__(self, directorio: str, sincronizar: bool = True, capacidad: int = CAPACIDAD_COLA):
+        self.directorio = directorio
+        # Con sincronizar, cada bloque se fuerza a disco (fsync) antes de escribir el siguiente
+        self.sincronizar = sincronizar
+        os.makedirs(directorio, exist_ok=True)
+        self.capacidad = capacidad
+        self._pendientes: Deque[object] = deque()
+        self._hay_sitio = threading.Condition()
+        self._lock = threading.Lock()
+        self._segmentos: List[_Segmento] = []
+        self._siguiente = 1
+        self._cache_entidades: "OrderedDict[int, Dict[str, List[int]]]" = OrderedDict()
+        self._textos: Dict[object, str] = {}
+        self._json = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+        self._recuperar()
+        self._fichero = open(self._abierto.ruta, "ab")
+        self._cerrado = False
+        # Error de escritura que ha detenido el registro (los registros sin escribir siguen en la cola)
+        self._error: Optional[BaseException] = None
+        self._hilo = threading.Thread(target=self._escribir, name="auditoria", daemon=True)
+        self._hilo.start()
+        # Lo que quede en la cola al salir se escribe antes de terminar
+        atexit.register(self.cerrar)
+
+    @property
+    def _abierto(self) -> _Segmento:
+        return self._segmentos[-1]
+
+    # ---------- ESCRITURA ----------
+    def registrar(self, evento: Evento):
+        # Suscriptor de los eventos del servicio: solo deja el evento en la cola (añadir a una deque
+        # no necesita cerrojo) y nunca espera, porque se llama desde el bucle de eventos; la
+        # serialización y la escritura van en el hilo y la contrapresión en esperar_escritor, que
+        # se espera antes de cada modificación. Con el registro detenido el evento se sigue
+        # guardando en la cola, para no perder los cambios que ya se han hecho
+        if self._cerrado:
+            raise RuntimeError("El registro de auditoría está cerrado.")
+        self._pendientes.append(evento)
+
+    @property
+    def lleno(self) -> bool:
+        return len(self._pendientes) >= self.capacidad
+
+    def esperar_sitio(self):
+        # Para quien puede bloquearse (un hilo): espera a que el escritor baje la cola de la capacidad
+        if not self.lleno and self._error is None:
+            return
+        with self._hay_sitio:
+            while self.lleno:
+                self._comprobar()
+                self._hay_sitio.wait(SONDEO_SEGUNDOS)
+        self._comprobar()
+
+    async def esperar_escritor(self, *_):
+        # Lo mismo desde el bucle de eventos (función 'admitir' de AlquilerServicioAsync, antes de
+        # cada modificación): con el registro detenido lanza el error y la modificación no se hace.
+        # Solo saltamos a un hilo si de verdad hay que esperar
+        if self.lleno or self._error is not None:
+            await asyncio.to_thread(self.esperar_sitio)
+
+    def vaciar(self):
+        # Esperamos a que todo lo registrado hasta ahora esté escrito
+        if self._cerrado:
+            return
+        self._comprobar()
+        escrito = threading.Event()
+        self._pendientes.append(escrito)
+        while not escrito.wait(SONDEO_SEGUNDOS) and self._hilo.is_alive():
+            pass
+        self._comprobar()
+
+    def cerrar(self):
+        if self._cerrado:
+            return
+        self._cerrado = True
+        self._pendientes.append(_FIN)
+        self._hilo.join()
+        self._fichero.close()
+        if self._error is not None:
+            logger.critical("Registro de auditoría cerrado con %d registros sin escribir", self.sin_escribir())
+
+    def sin_escribir(self) -> int:
+        return sum(1 for elemento in list(self._pendientes) if isinstance(elemento, Evento))
+
+    def _comprobar(self):
+        if self._cerrado:
+            raise RuntimeError("El registro de auditoría está cerrado.")
+        if self._error is not None:
+            raise RuntimeError("El registro de auditoría está detenido por un error de escritura; "
+                               f"{self.sin_escribir()} registros siguen en memoria sin escribir.") from self._error
+
+    def _escribir(self):
+        # Hilo escritor: reunimos un bloque (hasta que se llena, pasa la espera máxima desde su primer
+        # registro o nos piden vaciar) y lo escribimos de una vez. Con la cola vacía dormimos un rato
+        # en lugar de esperar registro a registro
+        pendientes = self._pendientes
+        terminar = False
+        while not terminar:
+            lote, avisos, limite = [], [], 0.0
+            while True:
+                try:
+                    elemento = pendientes.popleft()
+                except IndexError:
+                    restante = limite - time.monotonic()
+                    if lote and restante <= 0:
+                        break
+                    time.sleep(min(SONDEO_SEGUNDOS, restante) if lote else SONDEO_SEGUNDOS)
+                    continue
+                if elemento is _FIN:
+                    terminar = True
+                    break
+                if isinstance(elemento, threading.Event):
+                    avisos.append(elemento)
+                    break
+                if not lote:
+                    limite = time.monotonic() + ESPERA_MAXIMA_SEGUNDOS
+                lote.append(elemento)
+                if len(lote) == REGISTROS_POR_BLOQUE:
+                    break
+            if lote and not self._escribir_con_reintentos(lote):
+                # Detenido: devolvemos el lote al principio de la cola, en orden, para no perderlo
+                pendientes.extendleft(reversed(lote))
+                terminar = True
+            with self._hay_sitio:
+                self._hay_sitio.notify_all()
+            for aviso in avisos:
+                aviso.set()
+
+    def _escribir_con_reintentos(self, lote: List[Evento]) -> bool:
+        # Un bloque que no se puede escribir no se descarta: deshacemos lo que haya quedado a medias
+        # en el segmento y lo reintentamos; si sigue fallando, detenemos el registro
+        for intento in range(1, INTENTOS_ESCRITURA + 1):
+            try:
+                self._escribir_bloque(lote)
+                return True
+            except Exception as exc:
+                logger.exception("No se han podido escribir %d registros de auditoría (intento %d de %d)",
+                                 len(lote), intento, INTENTOS_ESCRITURA)
+                error = exc
+                try:
+                    self._deshacer_escritura()
+                except Exception:
+                    logger.exception("No se ha podido deshacer la escritura incompleta del segmento %s",
+                                     self._abierto.ruta)
+                if intento < INTENTOS_ESCRITURA:
+                    time.sleep(ESPERA_REINTENTO_SEGUNDOS * intento)
+        self._error = error
+        logger.critical("Registro de auditoría DETENIDO: %d registros sin escribir quedan en memoria",
+                        len(lote) + len(self._pendientes))
+        return False
+
+    def _deshacer_escritura(self):
+        # Dejamos el segmento abierto como estaba tras el último bloque escrito entero. Cerramos antes
+        # el fichero (su búfer puede volcar algo más al cerrarse) y lo recortamos después
+        try:
+            self._fichero.close()
+        except OSError:
+            pass
+        with open(self._abierto.ruta, "r+b") as fichero:
+            fichero.truncate(self._abierto.tamaño)
+        self._fichero = open(self._abierto.ruta, "ab")
+
+    def _texto(self, valor):
+        # Valor de un evento en JSON: los nativos tal cual y el resto (UUID, fechas) como texto
+        if valor is None or isinstance(valor, (bool, int, float, str)):
+            return valor
+        texto = self._textos.get(valor)
+        if texto is None:
+            if len(self._textos) >= MAX_TEXTOS:
+                self._textos.clear()
+            texto = self._textos[valor] = str(valor)
+        return texto
+
+    def _escribir_bloque(self, eventos: List[Evento]):
+        # El segmento abierto se cierra antes de escribir el bloque que ya no cabe en él: si cerrarlo
+        # falla, el bloque no se ha escrito y se puede reintentar sin duplicarlo
+        if len(self._abierto.bloques) >= BLOQUES_POR_SEGMENTO:
+            self._rotar()
+        # Los números de registro solo avanzan cuando el bloque está escrito
+        registros = []
+        texto = self._texto
+        for n, evento in enumerate(eventos, self._siguiente):
+            registros.append({"n": n, "fecha": evento.fecha.isoformat(), "tipo": evento.tipo,
+                              "datos": {clave: texto(valor) for clave, valor in evento.datos.items()}})
+        comprimido = zlib.compress("\n".join(self._json(r) for r in registros).encode())
+        fechas = [evento.fecha.timestamp() for evento in eventos]
+        cabecera = _CABECERA.pack(len(comprimido), zlib.crc32(comprimido), len(registros),
+                                  registros[0]["n"], min(fechas), max(fechas))
+        self._fichero.write(cabecera + comprimido)
+        self._fichero.flush()
+        if self.sincronizar:
+            os.fsync(self._fichero.fileno())
+
+        with self._lock:
+            self._abierto.agregar_bloque(len(cabecera) + len(comprimido), registros, min(fechas), max(fechas))
+            self._siguiente += len(registros)
+
+    def _rotar(self):
+        # El segmento abierto está completo: guardamos su índice y empezamos otro. Solo cambiamos de
+        # segmento cuando el índice está guardado y el fichero nuevo abierto, así un fallo no deja nada a medias
+        segmento = self._abierto
+        siguiente = _Segmento(segmento.numero + 1, self.directorio)
+        segmento.guardar_indice()
+        fichero = open(siguiente.ruta, "ab")
+        self._fichero.close()
+        self._fichero = fichero
+        with self._lock:
+            segmento.filtrar(segmento.entidades)
+            self._segmentos.append(siguiente)
+
+    # ---------- ARRANQUE ----------
+    def _recuperar(self):
+        # Al arrancar cargamos los índices de los segmentos cerrados y reconstruimos el del último
+        # leyendo sus bloques. Si el proceso se cortó a mitad de un bloque, lo descartamos
+        numeros = sorted(int(nombre[10:16]) for nombre in os.listdir(self.directorio)
+                         if nombre.startswith("auditoria-") and nombre.endswith(".seg"))
+        for numero in numeros:
+            segmento = _Segmento(numero, self.directorio)
+            if os.path.exists(segmento.ruta_indice):
+                segmento.filtrar(segmento.cargar_indice())
+            else:
+                self._reconstruir(segmento)
+                if segmento.bloques and (len(segmento.bloques) >= BLOQUES_POR_SEGMENTO or numero != numeros[-1]):
+                    segmento.guardar_indice()
+                    segmento.filtrar(segmento.entidades)
+            self._segmentos.append(segmento)
+            if segmento.bloques:
+                _, _, registros, primero, _, _ = segmento.bloques[-1]
+                self._siguiente = primero + registros
+        if not self._segmentos or self._abierto.cerrado:
+            numero = self._abierto.numero + 1 if self._segmentos else 1
+            self._segmentos.append(_Segmento(numero, self.directorio))
+
+    def _reconstruir(self, segmento: _Segmento):
+        with open(segmento.ruta, "r+b") as fichero:
+            while True:
+                cabecera = fichero.read(_CABECERA.size)
+                if not cabecera:
+                    break
+                datos = fichero.read(_CABECERA.unpack(cabecera)[0]) if len(cabecera) == _CABECERA.size else b""
+                registros = self._descomprimir(cabecera, datos)
+                if registros is None:
+                    logger.warning("Bloque incompleto al final de %s: se descarta", segmento.ruta)
+                    fichero.truncate(segmento.tamaño)
+                    break
+                _, _, _, _, fecha_min, fecha_max = _CABECERA.unpack(cabecera)
+                segmento.agregar_bloque(len(cabecera) + len(datos), registros, fecha_min, fecha_max)
+
+    @staticmethod
+    def _descomprimir(cabecera: bytes, datos: bytes, contiene: Optional[str] = None) -> Optional[List[dict]]:
+        # Registros de un bloque, o None si está incompleto o dañado. Con 'contiene' solo
+        # interpretamos las líneas que incluyen ese texto (las demás no pueden coincidir)
+        if len(cabecera) != _CABECERA.size:
+            return None
+        longitud, crc, registros, _, _, _ = _CABECERA.unpack(cabecera)
+        if len(datos) != longitud or zlib.crc32(datos) != crc:
+            return None
+        lineas = zlib.decompress(datos).decode().split("\n")
+        if len(lineas) != registros:
+            return None
+        return [json.loads(linea) for linea in lineas if contiene is None or contiene in linea]
+
+    # ---------- CONSULTAS ----------
+    def buscar(self, entidad_id: Optional[str] = None, tipo: Optional[str] = None,
+               desde: Optional[datetime] = None, hasta: Optional[datetime] = None,
+               limite: int = 1000) -> List[dict]:
+        # Registros de una entidad (por ejemplo, un vehículo), de un tipo de evento y/o entre dos
+        # fechas ('hasta' excluida), del más antiguo al más moderno. Solo vemos lo ya escrito:
+        # lo registrado en el último medio segundo puede no aparecer todavía (ver vaciar)
+        minimo = desde.timestamp() if desde else float("-inf")
+        maximo = hasta.timestamp() if hasta else float("inf")
+        with self._lock:
+            segmentos = [(s, len(s.bloques)) for s in self._segmentos if s.bloques]
+        # Texto que tiene que aparecer en la línea de un registro para que merezca la pena interpretarla
+        contiene = entidad_id if entidad_id is not None else (self._json({"tipo": tipo})[1:-1] if tipo else None)
+
+        resultado = []
+        for segmento, total in segmentos:
+            if segmento.fecha_max < minimo or segmento.fecha_min >= maximo:
+                continue
+            for numero_bloque in self._bloques_candidatos(segmento, total, entidad_id, tipo):
+                offset, longitud, _, _, fecha_min, fecha_max = segmento.bloques[numero_bloque]
+                if fecha_max < minimo or fecha_min >= maximo:
+                    continue
+                for registro in self._leer_bloque(segmento, offset, longitud, contiene):
+                    fecha = datetime.fromisoformat(registro["fecha"]).timestamp()
+                    if not minimo <= fecha < maximo:
+                        continue
+                    if tipo is not None and registro["tipo"] != tipo:
+                        continue
+                    if entidad_id is not None and entidad_id not in _entidades(registro["datos"]):
+                        continue
+                    resultado.append(registro)
+                    if len(resultado) == limite:
+                        return resultado
+        return resultado
+
+    def _bloques_candidatos(self, segmento: _Segmento, total: int, entidad_id: Optional[str],
+                            tipo: Optional[str]) -> List[int]:
+        # Bloques del segmento que pueden tener registros de la entidad y el tipo pedidos
+        candidatos = set(range(total))
+        if tipo is not None:
+            candidatos &= set(segmento.tipos.get(tipo, ()))
+        if entidad_id is not None and candidatos:
+            # El segmento abierto tiene el índice en memoria (y se puede cerrar mientras consultamos)
+            with self._lock:
+                abierto = segmento.entidades
+                bloques = list(abierto.get(entidad_id, ())) if abierto is not None else None
+            if bloques is None:
+                if entidad_id not in segmento.filtro:
+                    return []
+                bloques = self._entidades_de(segmento).get(entidad_id, ())
+            candidatos &= set(bloques)
+        return sorted(candidatos)
+
+    def _entidades_de(self, segmento: _Segmento) -> Dict[str, List[int]]:
+        # Índice de entidades de un segmento cerrado (se lee de su .idx y se guarda en una caché pequeña)
+        with self._lock:
+            entidades = self._cache_entidades.get(segmento.numero)
+            if entidades is not None:
+                self._cache_entidades.move_to_end(segmento.numero)
+                return entidades
+        with open(segmento.ruta_indice, "rb") as fichero:
+            entidades = json.loads(zlib.decompress(fichero.read()))["entidades"]
+        with self._lock:
+            self._cache_entidades[segmento.numero] = entidades
+            if len(self._cache_entidades) > SEGMENTOS_EN_CACHE:
+                self._cache_entidades.popitem(last=False)
+        return entidades
+
+    def _leer_bloque(self, segmento: _Segmento, offset: int, longitud: int,
+                     contiene: Optional[str] = None) -> List[dict]:
+        with open(segmento.ruta, "rb") as fichero:
+            fichero.seek(offset)
+            cabecera = fichero.read(_CABECERA.size)
+            registros = self._descomprimir(cabecera, fichero.read(longitud - _CABECERA.size), contiene)
+        if registros is None:
+            raise ValueError(f"Bloque dañado en {segmento.ruta} (posición {offset}).")
+        return registros
+
+    def estado(self) -> dict:
+        with self._lock:
+            return {
+                "segmentos": len(self._segmentos),
+                "bloques": sum(len(s.bloques) for s in self._segmentos),
+                "registros": self._siguiente - 1,
+                "bytes": sum(s.tamaño for s in self._segmentos),
+                "pendientes": len(self._pendientes),
+                "detenido": self._error is not None,
+            }
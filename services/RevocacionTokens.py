@@ -0,0 +1,110 @@
+from __future__ import annotations
+import heapq
+import math
+import threading
+import time
+from typing import Dict, List, Tuple
+
+# Tokens revocados que esperamos tener a la vez. Si se supera, el filtro se reconstruye con el doble
+CAPACIDAD_INICIAL = 10_000
+# Probabilidad de que el filtro diga "quizá revocado" para un token que no lo está
+PROBABILIDAD_FALSO_POSITIVO = 0.01
+
+
+class FiltroBloom:
+    # Conjunto aproximado en un array de bits: si dice que una clave no está, seguro que no está;
+    # si dice que está, puede equivocarse con la probabilidad indicada. No admite borrados.
+
+    def __init__(self, capacidad: int, probabilidad: float = PROBABILIDAD_FALSO_POSITIVO):
+        self.capacidad = max(1, capacidad)
+        self._bits_totales = max(8, math.ceil(-self.capacidad * math.log(probabilidad) / math.log(2) ** 2))
+        self._funciones = max(1, round(self._bits_totales / self.capacidad * math.log(2)))
+        self._bits = bytearray((self._bits_totales + 7) // 8)
+
+    def _posiciones(self, clave: str):
+        # Doble hash: las k posiciones salen de dos mitades del hash de la clave
+        valor = hash(clave)
+        h1 = valor & 0xFFFFFFFF
+        h2 = (valor >> 32) | 1
+        for i in range(self._funciones):
+            yield (h1 + i * h2) % self._bits_totales
+
+    def agregar(self, clave: str):
+        for posicion in self._posiciones(clave):
+            self._bits[posicion >> 3] |= 1 << (posicion & 7)
+
+    def __contains__(self, clave: str) -> bool:
+        # Mismo cálculo que _posiciones, sin generador: es el camino de cada petición y casi
+        # siempre sale en la primera o segunda posición con el bit a cero
+        valor = hash(clave)
+        h1 = valor & 0xFFFFFFFF
+        h2 = (valor >> 32) | 1
+        bits, total = self._bits, self._bits_totales
+        for i in range(self._funciones):
+            posicion = (h1 + i * h2) % total
+            if not bits[posicion >> 3] & (1 << (posicion & 7)):
+                return False
+        return True
+
+
+class RevocacionTokens:
+    # Identificadores (jti) de los tokens revocados antes de caducar: al cerrar sesión o al renovar
+    # un refresh token. Un filtro de Bloom delante del conjunto exacto responde sin buscar en él
+    # para casi todos los tokens válidos. Cuando un token revocado caduca ya no hace falta recordarlo:
+    # lo sacamos del conjunto y, si se acumulan muchos, reconstruimos el filtro solo con los vigentes.
+
+    def __init__(self, capacidad: int = CAPACIDAD_INICIAL, reloj=time.time):
+        self._reloj = reloj
+        # jti -> instante (epoch) en que caduca el token
+        self._revocados: Dict[str, float] = {}
+        # Cola de (caducidad, jti) para ir olvidando los tokens ya caducados
+        self._caducidades: List[Tuple[float, str]] = []
+        self._filtro = FiltroBloom(capacidad)
+        # Tokens añadidos al filtro desde su última reconstrucción (incluidos los ya olvidados)
+        self._en_filtro = 0
+        self._lock = threading.Lock()
+
+    def revocar(self, jti: str, caduca: float):
+        # Guardamos el token hasta su caducidad; después ya lo rechaza la propia firma
+        with self._lock:
+            ahora = self._reloj()
+            self._podar(ahora)
+            if caduca <= ahora or jti in self._revocados:
+                return
+            self._revocados[jti] = caduca
+            heapq.heappush(self._caducidades, (caduca, jti))
+            self._filtro.agregar(jti)
+            self._en_filtro += 1
+            if self._en_filtro > self._filtro.capacidad:
+                self._reconstruir()
+
+    def esta_revocado(self, jti: str) -> bool:
+        # Camino de cada petición autenticada: sin revocaciones o con el filtro diciendo que no,
+        # contestamos sin tocar el conjunto exacto ni el cerrojo
+        if not self._revocados or jti not in self._filtro:
+            return False
+        return jti in self._revocados
+
+    def podar(self):
+        with self._lock:
+            self._podar(self._reloj())
+
+    def _podar(self, ahora: float):
+        while self._caducidades and self._caducidades[0][0] <= ahora:
+            _, jti = heapq.heappop(self._caducidades)
+            self._revocados.pop(jti, None)
+        # El filtro no admite borrados: si la mayoría de lo que contiene ya caducó, lo rehacemos
+        if self._en_filtro > 2 * len(self._revocados) + 1024:
+            self._reconstruir()
+
+    def _reconstruir(self):
+        capacidad = max(CAPACIDAD_INICIAL, 2 * len(self._revocados))
+        filtro = FiltroBloom(capacidad)
+        for jti in self._revocados:
+            filtro.agregar(jti)
+        # Sustituimos el filtro de una vez: las lecturas sin cerrojo ven el viejo o el nuevo, ambos válidos
+        self._filtro = filtro
+        self._en_filtro = len(self._revocados)
+
+    def __len__(self) -> int:
+        return len(self._revocados)
@@ -0,0 +1,26 @@
+import importlib
+import pickle
+
+import pytest
+
+from services.AlquilerServicio import AlquilerServicio
+
+# El paquete services exporta la clase con el mismo nombre que el módulo
+modulo = importlib.import_module("services.AlquilerServicio")
+
+
+def test_guardar_y_cargar_estado(tmp_path):
+    servicio = AlquilerServicio()
+    servicio.agregar_sucursal("Centro", "Calle Mayor 1", "600000000")
+    ruta = str(tmp_path / "estado.bin")
+    servicio.guardar_estado(ruta)
+    cargado = AlquilerServicio.cargar_estado(ruta)
+    assert [s.nombre for s in cargado.sucursales.values()] == ["Centro"]
+    assert "_formato" not in cargado.__dict__
+
+
+def test_estado_de_otro_formato_se_rechaza(tmp_path, monkeypatch):
+    datos = pickle.dumps(AlquilerServicio())
+    monkeypatch.setattr(modulo, "FORMATO_ESTADO", modulo.FORMATO_ESTADO + 1)
+    with pytest.raises(ValueError):
+        pickle.loads(datos)
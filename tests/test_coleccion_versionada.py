@@ -0,0 +1,57 @@
+import pytest
+
+from services.AlquilerServicio import AlquilerServicio
+from services.ColeccionVersionada import ColeccionVersionada, RelojVersiones
+
+
+def test_instantanea_de_una_version_leida_antes_de_compactar():
+    # Leemos la versión y después se escribe lo bastante para compactar el registro: la vista en
+    # esa versión sigue teniendo la clave
+    coleccion = ColeccionVersionada({"x": 0})
+    version = coleccion.reloj.actual
+    for i in range(1100):
+        coleccion["x"] = i + 1
+    assert coleccion.instantanea(version).keys() == ["x"]
+    assert coleccion.instantanea(version).values() == [0]
+    assert coleccion.instantanea().items() == [("x", 1100)]
+
+
+def test_compactar_mantiene_acotado_el_registro():
+    coleccion = ColeccionVersionada({"x": 0, "y": 0})
+    for i in range(20000):
+        coleccion["x"] = i
+    assert len(coleccion._registro) < 3 * len(coleccion) + 3 * 1024
+    assert sorted(coleccion.keys()) == ["x", "y"]
+
+
+def test_version_anterior_a_la_compactacion_previa_se_rechaza():
+    coleccion = ColeccionVersionada({"x": 0})
+    version = coleccion.reloj.actual
+    for i in range(5000):
+        coleccion["x"] = i
+    with pytest.raises(ValueError):
+        coleccion.instantanea(version)
+
+
+def test_instantanea_tras_borrar_y_compactar():
+    reloj = RelojVersiones()
+    a = ColeccionVersionada({"x": 1}, reloj)
+    b = ColeccionVersionada({"y": 2}, reloj)
+    version = reloj.actual
+    del a["x"]
+    for i in range(1100):
+        b["y"] = i
+    assert a.instantanea(version).items() == [("x", 1)]
+    assert a.instantanea().items() == []
+    assert b.instantanea(version).items() == [("y", 2)]
+
+
+def test_instantanea_del_servicio_coherente_entre_colecciones():
+    servicio = AlquilerServicio()
+    sucursal = servicio.agregar_sucursal("Central", "Calle Mayor 1", "900000000")
+    vista = servicio.instantanea()
+    for i in range(1100):
+        servicio.ubicar_sucursal(sucursal.id, 40.0, -3.0 + i / 10000)
+    servicio.agregar_sucursal("Norte", "Calle Norte 1", "900000001")
+    assert vista["sucursales"].keys() == [sucursal.id]
+    assert len(servicio.instantanea()["sucursales"]) == 2
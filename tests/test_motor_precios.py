@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from models.Tarifa import Tarifa
+from services.MotorPrecios import DIAS_EN_MEMORIA, DIAS_MAXIMOS, MotorPrecios
+
+
+def test_cotizar_rechaza_periodos_demasiado_largos():
+    motor = MotorPrecios()
+    tarifa = Tarifa("Básica", "Económico", 30.0)
+    inicio = datetime(2026, 1, 1)
+    assert motor.cotizar(tarifa, uuid4(), inicio, inicio + timedelta(days=DIAS_MAXIMOS))["dias"] == DIAS_MAXIMOS
+    with pytest.raises(ValueError):
+        motor.cotizar(tarifa, uuid4(), inicio, inicio + timedelta(days=DIAS_MAXIMOS + 1))
+
+
+def test_memoria_de_multiplicadores_acotada():
+    # Recorremos muchos días distintos de la misma sucursal y categoría: la memoria no pasa del máximo
+    motor = MotorPrecios()
+    sucursal_id = uuid4()
+    dia = datetime(2026, 1, 1)
+    for i in range(3 * DIAS_EN_MEMORIA):
+        motor.multiplicador(sucursal_id, "Económico", dia + timedelta(days=i))
+    assert len(motor._multiplicadores[(sucursal_id, "económico")]) == DIAS_EN_MEMORIA
@@ -0,0 +1,58 @@
+import pytest
+
+from services.Particionado import ServicioParticionado
+
+# Fases del traspaso tras las que se para el enrutador, y partición en la que debe quedar el vehículo
+# al arrancar de nuevo desde el estado guardado
+FASES = [
+    (("preparar_salida",), "origen"),
+    (("preparar_salida", "preparar_entrada"), "origen"),
+    (("preparar_salida", "preparar_entrada", "confirmar_entrada"), "destino"),
+]
+
+
+def _preparar(directorio, fases):
+    # Dos sucursales en particiones distintas y un vehículo en la primera. Hacemos a mano las fases
+    # indicadas del traspaso a la segunda y guardamos el estado sin terminarlo
+    with ServicioParticionado(2) as servicio:
+        origen_sucursal = servicio.agregar_sucursal("Norte", "Calle Norte 1", "600000001")
+        destino_sucursal = servicio.agregar_sucursal("Sur", "Calle Sur 1", "600000002")
+        vehiculo = servicio.registrar_vehiculo("coche", "1234 ABC", "Seat", "Ibiza", 2022, "Económico", 100,
+                                               origen_sucursal.id, puertas=5, motor="Gasolina")
+        origen = servicio.particion_de_sucursal(origen_sucursal.id)
+        destino = servicio.particion_de_sucursal(destino_sucursal.id)
+        assert origen != destino
+        datos = None
+        for fase in fases:
+            if fase == "preparar_salida":
+                datos = servicio._enviar(origen, fase, vehiculo["id"])
+            elif fase == "preparar_entrada":
+                servicio._enviar(destino, fase, datos, destino_sucursal.id)
+            else:
+                servicio._enviar(destino, fase, vehiculo["id"])
+        servicio.guardar_estado(str(directorio))
+    return vehiculo["id"], {"origen": origen, "destino": destino}, destino_sucursal.id, origen_sucursal.id
+
+
+def _comprobar_enrutado(servicio, vehiculo_id, particion):
+    # El vehículo está en una sola partición, sin traspasos pendientes, y los mapas del enrutador
+    # coinciden con lo que tiene cada partición
+    repartos = servicio._a_todas("reparto")
+    assert [p for p, reparto in enumerate(repartos) if vehiculo_id in reparto["vehiculos"]] == [particion]
+    assert all(not reparto["salidas"] and not reparto["entradas"] for reparto in repartos)
+    assert servicio._vehiculo_particion[vehiculo_id] == particion
+    for matricula, otro_id in servicio._matriculas.items():
+        assert repartos[servicio._vehiculo_particion[otro_id]]["vehiculos"][otro_id] == matricula
+    assert set(servicio._matriculas.values()) == set(servicio._vehiculo_particion)
+
+
+@pytest.mark.parametrize("fases, esperada", FASES, ids=lambda valor: "-".join(valor) if isinstance(valor, tuple) else valor)
+def test_traspaso_a_medias_se_resuelve_al_arrancar(tmp_path, fases, esperada):
+    vehiculo_id, particiones, destino_id, origen_id = _preparar(tmp_path, fases)
+    with ServicioParticionado(ruta_estado=str(tmp_path)) as servicio:
+        _comprobar_enrutado(servicio, vehiculo_id, particiones[esperada])
+        assert [v["id"] for v in servicio.listar_vehiculos_disponibles()] == [vehiculo_id]
+        # Sin nada pendiente, el vehículo se puede volver a traspasar entre las dos particiones
+        otra = destino_id if esperada == "origen" else origen_id
+        servicio.transferir_vehiculo(vehiculo_id, otra)
+        _comprobar_enrutado(servicio, vehiculo_id, servicio.particion_de_sucursal(otra))
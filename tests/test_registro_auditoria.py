@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from services import RegistroAuditoria as modulo_auditoria
+from services.AlquilerServicio import AlquilerServicio
+from services.AlquilerServicioAsync import AlquilerServicioAsync
+from services.RegistroAuditoria import RegistroAuditoria
+
+
+@pytest.fixture
+def registro_detenido(tmp_path, monkeypatch):
+    # Registro cuyo escritor no consigue escribir nada y se detiene tras los reintentos
+    monkeypatch.setattr(modulo_auditoria, "ESPERA_REINTENTO_SEGUNDOS", 0.0)
+    registro = RegistroAuditoria(str(tmp_path), sincronizar=False)
+
+    def fallar(eventos):
+        raise OSError("disco lleno")
+
+    registro._escribir_bloque = fallar
+    yield registro
+    registro.cerrar()
+
+
+def _servicio_auditado(registro):
+    servicio = AlquilerServicio()
+    servicio.suscribir(registro.registrar)
+    fachada = AlquilerServicioAsync(servicio, str, lambda p, h: (True, None), admitir=registro.esperar_escritor)
+    return servicio, fachada
+
+
+def test_con_el_registro_detenido_la_modificacion_se_rechaza_antes_de_hacerse(registro_detenido):
+    servicio, fachada = _servicio_auditado(registro_detenido)
+    asyncio.run(fachada.agregar_sucursal("Central", "Calle Mayor 1", "900000000"))
+    with pytest.raises(RuntimeError):
+        registro_detenido.vaciar()
+    assert registro_detenido.sin_escribir() == 1
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(fachada.agregar_sucursal("Norte", "Calle Norte 1", "900000001"))
+    assert [s.nombre for s in servicio.listar_sucursales()] == ["Central"]
+    assert registro_detenido.sin_escribir() == 1
+    fachada.cerrar()
+
+
+def test_con_el_registro_detenido_los_cambios_directos_siguen_en_la_cola(registro_detenido):
+    servicio, fachada = _servicio_auditado(registro_detenido)
+    servicio.agregar_sucursal("Central", "Calle Mayor 1", "900000000")
+    with pytest.raises(RuntimeError):
+        registro_detenido.vaciar()
+    servicio.agregar_sucursal("Norte", "Calle Norte 1", "900000001")
+    assert registro_detenido.sin_escribir() == 2
+    fachada.cerrar()